@@ -0,0 +1,114 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from data_handler import load_transactions, fetch_price_data
+from benchmark_analytics import DEFAULT_BENCHMARKS, benchmark_tickers
+from main import SPY_TICKER, report_portfolio
+
+# Price matrix attached from shared memory, one per worker process:
+# (segment, column-major closes, dates, ticker -> column position)
+_shared_prices = None
+
+def _attach_prices(shm_name, shape, index_values, columns):
+    global _shared_prices
+    shm = shared_memory.SharedMemory(name=shm_name)
+    # Keep the segment open for the worker's lifetime; every frame is a view on it
+    values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, order='F')
+    _shared_prices = (shm, values, pd.DatetimeIndex(index_values, name='Date'),
+                      {ticker: position for position, ticker in enumerate(columns)})
+
+def _price_view(tickers):
+    # One block per column, each a view on its contiguous slice of the segment,
+    # so neither this selection nor later column subsets copy any closes
+    _, values, index, positions = _shared_prices
+    columns = {ticker: values[:, positions[ticker]] for ticker in tickers}
+    return pd.DataFrame(columns, index=index, copy=False).rename_axis(columns='Ticker')
+
+def _report_one(job):
+    name, transactions, output_dir, charts = job
+    positions = _shared_prices[3]
+    tickers = sorted(set(transactions.tickers.tolist()) | {SPY_TICKER})
+    # Benchmark closes the fetch returned, for the TWR comparison
+    tickers += [ticker for ticker in benchmark_tickers(DEFAULT_BENCHMARKS) if ticker in positions and ticker not in tickers]
+    started = time.perf_counter()
+    advanced_metrics = report_portfolio(transactions, _price_view(tickers), output_dir, charts=charts,
+                                        chart_workers=1) # portfolios already run in parallel
+    return name, advanced_metrics, time.perf_counter() - started
+
+def _namespaces(ledger_files):
+    names = {}
+    for path in ledger_files:
+        base = os.path.splitext(os.path.basename(path))[0]
+        name, suffix = base, 2
+        while name in names:
+            name, suffix = f'{base}_{suffix}', suffix + 1
+        names[name] = path
+    return names
+
+def run_batch(ledger_files, start_date, end_date, output_root='output', workers=None, charts=False):
+    """
+    Evaluates many portfolios against one shared price fetch.
+
+    The closes for the union of all tickers are fetched once and placed in shared
+    memory; worker processes map it without copying and write each portfolio's
+    reports to output_root/<ledger name>/.
+
+    Returns:
+        dict: Advanced metrics per portfolio plus timing and throughput.
+    """
+    started = time.perf_counter()
+    ledgers = {name: load_transactions(path) for name, path in _namespaces(ledger_files).items()}
+
+    tickers = sorted(set().union(*(ledger.tickers.tolist() for ledger in ledgers.values()))
+                     | {SPY_TICKER} | set(benchmark_tickers(DEFAULT_BENCHMARKS)))
+    fetch_started = time.perf_counter()
+    price_data = fetch_price_data(tickers, start_date, end_date)
+    fetch_seconds = time.perf_counter() - fetch_started
+
+    # Column-major, so each ticker's closes are one contiguous slice
+    values = np.asfortranarray(price_data.to_numpy(dtype=np.float64))
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    try:
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf, order='F')[:] = values
+        jobs = [(name, ledger, os.path.join(output_root, name), charts) for name, ledger in ledgers.items()]
+
+        eval_started = time.perf_counter()
+        initargs = (shm.name, values.shape, price_data.index.to_numpy(), list(price_data.columns))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_prices, initargs=initargs) as pool:
+            results = {name: {'advanced_metrics': metrics, 'seconds': seconds}
+                       for name, metrics, seconds in pool.map(_report_one, jobs)}
+        eval_seconds = time.perf_counter() - eval_started
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return {
+        'portfolios': results,
+        'tickers': len(tickers),
+        'price_fetch_seconds': fetch_seconds,
+        'evaluation_seconds': eval_seconds,
+        'total_seconds': time.perf_counter() - started,
+        'portfolios_per_second': len(results) / eval_seconds if eval_seconds > 0 else float('inf'),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate many portfolio ledgers with one shared price fetch.')
+    parser.add_argument('ledgers', nargs='+', help='Transaction CSV files, one per portfolio')
+    parser.add_argument('--start', default='2025-03-26', help="Start date in 'YYYY-MM-DD' format")
+    parser.add_argument('--end', default=(datetime.today() + timedelta(days=1)).strftime('%Y-%m-%d'), help="End date in 'YYYY-MM-DD' format")
+    parser.add_argument('--output-root', default=os.path.join('output', 'batch'), help='Each portfolio writes to <output-root>/<ledger name>/')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per core)')
+    parser.add_argument('--charts', action='store_true', help='Also render the PNG charts for every portfolio')
+    args = parser.parse_args()
+
+    summary = run_batch(args.ledgers, args.start, args.end, args.output_root, args.workers, args.charts)
+    print(f"Evaluated {len(summary['portfolios'])} portfolios over {summary['tickers']} tickers "
+          f"in {summary['evaluation_seconds']:.2f}s ({summary['portfolios_per_second']:.1f} portfolios/s); "
+          f"price fetch took {summary['price_fetch_seconds']:.2f}s.")
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+from metrics_calculator import TRADING_DAYS_IN_YEAR
+
+# Benchmarks compared with the portfolio unless configured otherwise
+DEFAULT_BENCHMARKS = ('SPY', 'QQQ')
+
+def parse_benchmark(spec):
+    """
+    Parses one benchmark: a ticker ('QQQ') or a named blend of tickers rebalanced
+    daily to fixed weights ('60/40=SPY:0.6,AGG:0.4'). Weights are normalized to
+    sum to 1.
+
+    Returns:
+        tuple: (name, {ticker: weight})
+    """
+    if isinstance(spec, tuple):
+        name, weights = spec
+    elif '=' in spec:
+        name, blend = (part.strip() for part in spec.split('=', 1))
+        weights = {}
+        for item in blend.split(','):
+            ticker, _, weight = item.partition(':')
+            weights[ticker.strip().upper()] = float(weight) if weight.strip() else 1.0
+    else:
+        name = spec.strip().upper()
+        weights = {name: 1.0}
+    total = sum(weights.values())
+    if not weights or total <= 0:
+        raise ValueError(f"Benchmark '{name}' needs positive weights")
+    return name, {ticker: weight / total for ticker, weight in weights.items()}
+
+def parse_benchmarks(specs):
+    """Parses a list of benchmark specs, or one string of specs separated by ';'."""
+    if isinstance(specs, str):
+        specs = [spec for spec in specs.split(';') if spec.strip()]
+    return dict(parse_benchmark(spec) for spec in specs)
+
+def benchmark_tickers(benchmarks):
+    """Every ticker the benchmarks need prices for."""
+    return sorted({ticker for _, weights in parse_benchmarks(benchmarks).items() for ticker in weights})
+
+def calculate_benchmark_comparison(portfolio_value, price_data, benchmarks=DEFAULT_BENCHMARKS):
+    """
+    TWR of each benchmark next to the portfolio's, and the portfolio's daily
+    excess return over each.
+
+    Benchmark daily returns come from one matrix product of the tickers' daily
+    returns with a tickers x benchmarks weight matrix, which covers single
+    tickers and blends alike. Benchmarks with a ticker that has no prices are
+    left out.
+
+    Args:
+        portfolio_value (pd.DataFrame): Daily results of the valuation engine.
+        price_data (pd.DataFrame): Closes, one column per ticker.
+        benchmarks (list): Benchmark specs, see parse_benchmark.
+
+    Returns:
+        pd.DataFrame: Indexed by date: 'Portfolio TWR', then '<name> TWR' and
+            '<name> Excess Return' (daily, portfolio minus benchmark) per benchmark.
+    """
+    priced = set(price_data.columns[price_data.notna().any()])
+    benchmarks = {name: weights for name, weights in parse_benchmarks(benchmarks).items()
+                  if priced.issuperset(weights)}
+    tickers = sorted({ticker for weights in benchmarks.values() for ticker in weights})
+    dates = portfolio_value.index
+
+    closes = price_data.reindex(index=dates, columns=tickers).ffill().to_numpy(dtype=np.float64)
+    returns = np.zeros_like(closes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[1:] = closes[1:] / closes[:-1] - 1
+    returns[~np.isfinite(returns)] = 0.0
+
+    weights = np.zeros((len(tickers), len(benchmarks)))
+    positions = {ticker: position for position, ticker in enumerate(tickers)}
+    for column, ticker_weights in enumerate(benchmarks.values()):
+        for ticker, weight in ticker_weights.items():
+            weights[positions[ticker], column] = weight
+
+    benchmark_returns = returns @ weights
+    benchmark_twr = np.cumprod(1 + benchmark_returns, axis=0)
+    portfolio_returns = portfolio_value['Portfolio Daily Return'].to_numpy(dtype=np.float64)
+    excess_returns = portfolio_returns[:, None] - benchmark_returns
+    excess_returns[:1] = 0.0
+
+    columns = {'Portfolio TWR': portfolio_value['TWR'].to_numpy(dtype=np.float64)}
+    for column, name in enumerate(benchmarks):
+        columns[f'{name} TWR'] = benchmark_twr[:, column]
+        columns[f'{name} Excess Return'] = excess_returns[:, column]
+    return pd.DataFrame(columns, index=dates)
+
+def summarize_benchmarks(portfolio_twr, benchmark_twrs, excess_returns):
+    """
+    Period statistics of the portfolio against each benchmark, from rows of the
+    benchmark comparison (the first row is the base the returns start from).
+
+    Args:
+        portfolio_twr (np.ndarray): Portfolio TWR rows.
+        benchmark_twrs (dict): Benchmark name -> TWR rows.
+        excess_returns (dict): Benchmark name -> daily excess return rows.
+
+    Returns:
+        dict: Name -> total return, portfolio excess return over it, annualized
+            tracking error and information ratio (None with too few days).
+    """
+    def period_return(twr):
+        return float(twr[-1] / twr[0] - 1) if len(twr) and twr[0] else None
+
+    portfolio_return = period_return(portfolio_twr)
+    summary = {}
+    for name, twr in benchmark_twrs.items():
+        excess = excess_returns[name][1:]
+        tracking_error = float(np.std(excess, ddof=1) * np.sqrt(TRADING_DAYS_IN_YEAR)) if len(excess) > 1 else None
+        total_return = period_return(twr)
+        summary[name] = {
+            'total_return': total_return,
+            'excess_return': portfolio_return - total_return if None not in (portfolio_return, total_return) else None,
+            'tracking_error': tracking_error,
+            'information_ratio': float(np.mean(excess) * TRADING_DAYS_IN_YEAR / tracking_error) if tracking_error else None,
+        }
+    return summary
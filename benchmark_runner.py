@@ -0,0 +1,405 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'portfolio_web_app'))
+
+from benchmark_analytics import calculate_benchmark_comparison
+from chart_generator import render_charts
+from data_handler import load_transactions
+from main import SPY_TICKER, build_open_positions_data, evaluate_portfolio
+from metrics_calculator import calculate_advanced_metrics, calculate_rolling_metrics
+from price_cache import PriceCache
+from report_generator import generate_csv_reports, generate_column_reports
+from result_snapshot import ResultSnapshot
+from risk_engine import calculate_risk
+from synthetic_data import FramePriceProvider, generate_ledger, generate_prices, synthetic_tickers
+
+RESULTS_VERSION = 1
+
+# Ledger sizes from a single account up to a large book
+SCENARIOS = {
+    'tiny': {'trades': 10, 'tickers': 5, 'years': 1},
+    'small': {'trades': 1_000, 'tickers': 20, 'years': 2},
+    'medium': {'trades': 50_000, 'tickers': 200, 'years': 10},
+    'large': {'trades': 250_000, 'tickers': 1_000, 'years': 20},
+    'huge': {'trades': 1_000_000, 'tickers': 5_000, 'years': 30},
+}
+DEFAULT_SCENARIOS = ['tiny', 'small', 'medium']
+
+# A stage is a regression when its median time grew by more than this fraction
+REGRESSION_THRESHOLD = 0.10
+
+WEB_APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'portfolio_web_app')
+# Cold start budgets of the web app in seconds: `import app`, and from there to the
+# first /data/portfolio_value response
+STARTUP_BUDGETS = {'import': 1.5, 'first_response': 2.0}
+# Modules that only specific code paths need; none may be loaded by a cold start
+DEFERRED_MODULES = ('scipy', 'matplotlib', 'yfinance')
+
+# Runs in a fresh interpreter: imports the web app and sends it one request
+# directly over ASGI, so no server or HTTP client is involved
+_STARTUP_PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.snapshots.output_dir = sys.argv[1]
+
+async def get(path):
+    messages = []
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+    async def send(message):
+        messages.append(message)
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+             'root_path': '', 'headers': [], 'server': ('localhost', 80), 'client': ('127.0.0.1', 1)}
+    await app.app(scope, receive, send)
+    return messages[0]['status']
+
+status = asyncio.run(get('/data/portfolio_value'))
+responded = time.perf_counter()
+print(json.dumps({'import': imported - started, 'first_response': responded - started, 'status': status,
+                  'modules': sorted(name for name in sys.modules if '.' not in name)}))
+"""
+
+def _reset_peak_rss():
+    # Linux resets the process's peak RSS on request, so each stage reports its own
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def _peak_rss():
+    """Peak resident set size in bytes: since the last reset on Linux, else of the whole process."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes, except on macOS where it is in bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class StageTimer:
+    """Wall-clock time and peak resident memory of each named pipeline stage of one run."""
+
+    def __init__(self):
+        self.seconds = {}
+        self.peak_rss = {}
+
+    @contextmanager
+    def stage(self, name):
+        _reset_peak_rss()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = time.perf_counter() - started
+            self.peak_rss[name] = _peak_rss()
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'cpus': os.cpu_count(),
+        'commit': commit,
+    }
+
+def run_once(params, work_dir, engine='vectorized', charts=False, seed=0):
+    """
+    Runs the pipeline stages on one synthetic portfolio inside work_dir.
+
+    Returns:
+        tuple: (stage timings in seconds, peak RSS of each stage in bytes, row counts)
+    """
+    prices = generate_prices(synthetic_tickers(params['tickers']), params['years'], seed=seed)
+    ledger_file = os.path.join(work_dir, 'transactions.csv')
+    generate_ledger(prices, params['trades'], seed=seed).to_csv(ledger_file, index=False)
+    start_date = prices.index[0].strftime('%Y-%m-%d')
+    end_date = (prices.index[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    output_dir = os.path.join(work_dir, 'output')
+    os.makedirs(output_dir)
+
+    timer = StageTimer()
+    with timer.stage('load'):
+        transactions = load_transactions(ledger_file)
+
+    tickers = transactions.tickers.tolist() + [SPY_TICKER]
+    cache = PriceCache(os.path.join(work_dir, 'prices.sqlite'), FramePriceProvider(prices))
+    with timer.stage('price_fetch_cold'):
+        price_data = cache.get_closes(tickers, start_date, end_date)
+    with timer.stage('price_fetch_warm'):
+        price_data = cache.get_closes(tickers, start_date, end_date)
+
+    with timer.stage('daily_loop'):
+        portfolio_value, open_positions, closed_positions, attribution = evaluate_portfolio(
+            transactions, price_data, engine, incremental=False, attribution=True)
+    # The chunked engine never resumes from checkpoints
+    if engine == 'vectorized':
+        with timer.stage('incremental_initial'):
+            evaluate_portfolio(transactions, price_data, engine, incremental=True, output_dir=output_dir)
+        with timer.stage('incremental_unchanged'):
+            evaluate_portfolio(transactions, price_data, engine, incremental=True, output_dir=output_dir)
+
+    with timer.stage('metrics'):
+        open_positions_data = build_open_positions_data(open_positions, portfolio_value, price_data)
+        calculate_advanced_metrics(portfolio_value)
+    with timer.stage('rolling_metrics'):
+        rolling_metrics = calculate_rolling_metrics(portfolio_value)
+    with timer.stage('benchmarks'):
+        benchmark_comparison = calculate_benchmark_comparison(portfolio_value, price_data)
+    with timer.stage('risk'):
+        risk = calculate_risk(open_positions_data, price_data)
+    with timer.stage('csv_write'):
+        generate_csv_reports(portfolio_value, open_positions_data, closed_positions, output_dir)
+    with timer.stage('column_write'):
+        generate_column_reports(portfolio_value, open_positions_data, closed_positions, output_dir, rolling_metrics,
+                                benchmark_comparison, risk, attribution)
+    if charts:
+        with timer.stage('charts'):
+            render_charts(output_dir)
+
+    with timer.stage('web_payloads'):
+        snapshot = ResultSnapshot.from_output_dir(output_dir)
+        for name in snapshot.payload_names():
+            snapshot.payload(name)
+
+    rows = {
+        'trades': len(transactions),
+        'tickers': len(tickers),
+        'days': len(price_data.index),
+        'closed_positions': len(closed_positions),
+    }
+    return timer.seconds, timer.peak_rss, rows
+
+def run_scenario(name, params, repeat=3, engine='vectorized', charts=False):
+    runs = []
+    peaks = []
+    for run in range(repeat):
+        with tempfile.TemporaryDirectory(prefix=f'bench-{name}-') as work_dir:
+            seconds, peak_rss, rows = run_once(params, work_dir, engine, charts)
+        runs.append(seconds)
+        peaks.append(peak_rss)
+
+    stages = {}
+    for stage in runs[0]:
+        times = [seconds[stage] for seconds in runs]
+        stage_peaks = [peak_rss[stage] for peak_rss in peaks if peak_rss[stage] is not None]
+        stages[stage] = {'median': statistics.median(times), 'min': min(times), 'runs': times,
+                         'peak_rss': max(stage_peaks, default=None)}
+    return {
+        'params': dict(params, engine=engine, charts=charts, repeat=repeat),
+        'rows': rows,
+        'stages': stages,
+        'total': statistics.median(sum(seconds.values()) for seconds in runs),
+        'peak_rss': max((stage['peak_rss'] for stage in stages.values() if stage['peak_rss'] is not None), default=None),
+    }
+
+def run_benchmarks(scenarios, repeat=3, engine='vectorized', charts=False, log=print):
+    """
+    Times every pipeline stage for each scenario.
+
+    Args:
+        scenarios (dict): Scenario name -> {'trades', 'tickers', 'years'}.
+        repeat (int): Runs per scenario; each stage reports its median and minimum.
+        engine (str): 'vectorized', 'chunked' or 'loop', see main.evaluate_portfolio.
+        charts (bool): Also time chart rendering.
+
+    Returns:
+        dict: Machine-readable results, see compare_results.
+    """
+    results = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': _environment(),
+        'scenarios': {},
+    }
+    for name, params in scenarios.items():
+        log(f"Running '{name}': {params['trades']:,} trades, {params['tickers']:,} tickers, {params['years']} years")
+        results['scenarios'][name] = run_scenario(name, params, repeat, engine, charts)
+    return results
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Compares the median stage times of two result sets.
+
+    Returns:
+        list: One dict per stage present in both: scenario, stage, baseline and
+            current seconds, their ratio, and whether it counts as a regression.
+    """
+    rows = []
+    for name, scenario in current['scenarios'].items():
+        old_scenario = baseline['scenarios'].get(name)
+        if old_scenario is None:
+            continue
+        for stage, timing in scenario['stages'].items():
+            old = old_scenario['stages'].get(stage)
+            if old is None:
+                continue
+            ratio = timing['median'] / old['median'] if old['median'] > 0 else float('inf')
+            rows.append({
+                'scenario': name,
+                'stage': stage,
+                'baseline': old['median'],
+                'current': timing['median'],
+                'ratio': ratio,
+                'regression': ratio > 1 + threshold,
+            })
+    return rows
+
+def _slowest_imports(count=10):
+    """Top-level imports of the web app by cumulative time, from `python -X importtime`."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=WEB_APP_DIR,
+                            capture_output=True, text=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nesting is shown by indentation: ' app', then '   <direct import of app>'
+        if name.startswith('   ') and not name.startswith('    '):
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+def check_startup(runs=5, budgets=STARTUP_BUDGETS, scenario='small'):
+    """
+    Measures the web app's cold start in fresh interpreters against the budgets.
+
+    Each run imports portfolio_web_app/app.py and serves /data/portfolio_value
+    from the reports of a synthetic portfolio.
+
+    Returns:
+        dict: Median seconds per measure, the budgets, the DEFERRED_MODULES that
+            were loaded anyway, and whether everything is within budget.
+    """
+    with tempfile.TemporaryDirectory(prefix='bench-startup-') as work_dir:
+        run_once(SCENARIOS[scenario], work_dir)
+        probes = []
+        for run in range(runs):
+            completed = subprocess.run([sys.executable, '-c', _STARTUP_PROBE, os.path.join(work_dir, 'output')],
+                                       cwd=WEB_APP_DIR, capture_output=True, text=True, check=True)
+            probes.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    seconds = {measure: statistics.median(probe[measure] for probe in probes) for measure in budgets}
+    loaded = sorted({module for probe in probes for module in probe['modules']} & set(DEFERRED_MODULES))
+    within = all(seconds[measure] <= budget for measure, budget in budgets.items())
+    return {
+        'seconds': seconds,
+        'budgets': dict(budgets),
+        'status': probes[-1]['status'],
+        'deferred_modules_loaded': loaded,
+        'ok': within and not loaded and all(probe['status'] == 200 for probe in probes),
+    }
+
+def _mib(size):
+    return f"{size / 2**20:,.0f} MiB" if size is not None else 'n/a'
+
+def _print_results(results):
+    for name, scenario in results['scenarios'].items():
+        print(f"\n{name}  ({scenario['rows']['trades']:,} trades, {scenario['rows']['tickers']:,} tickers, "
+              f"{scenario['rows']['days']:,} days)  total {scenario['total']:.3f}s  peak RSS {_mib(scenario.get('peak_rss'))}")
+        for stage, timing in scenario['stages'].items():
+            print(f"  {stage:<24}{timing['median']:>10.4f}s  (min {timing['min']:.4f}s)  peak RSS {_mib(timing.get('peak_rss'))}")
+
+def _print_comparison(rows):
+    print(f"\n{'scenario':<10}{'stage':<24}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for row in rows:
+        flag = '  REGRESSION' if row['regression'] else ''
+        print(f"{row['scenario']:<10}{row['stage']:<24}{row['baseline']:>11.4f}s{row['current']:>11.4f}s"
+              f"{row['ratio']:>8.2f}{flag}")
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the portfolio pipeline on synthetic ledgers.')
+    commands = parser.add_subparsers(dest='command')
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks (default)')
+    run_parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                            help=f"Scenario to run, repeatable (default: {', '.join(DEFAULT_SCENARIOS)})")
+    run_parser.add_argument('--trades', type=int, help='Custom scenario: number of trades')
+    run_parser.add_argument('--tickers', type=int, default=50, help='Custom scenario: number of tickers')
+    run_parser.add_argument('--years', type=int, default=5, help='Custom scenario: years of history')
+    run_parser.add_argument('--repeat', type=int, default=3, help='Runs per scenario')
+    run_parser.add_argument('--engine', choices=['vectorized', 'chunked', 'loop'], default='vectorized')
+    run_parser.add_argument('--charts', action='store_true', help='Also time chart rendering')
+    run_parser.add_argument('--output', help='Write the JSON results to this file')
+    run_parser.add_argument('--baseline', help='Compare against an earlier results file')
+    run_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+
+    compare_parser = commands.add_parser('compare', help='Compare two results files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+
+    startup_parser = commands.add_parser('startup', help="Check the web app's cold start against its budgets")
+    startup_parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to time')
+    startup_parser.add_argument('--import-budget', type=float, default=STARTUP_BUDGETS['import'])
+    startup_parser.add_argument('--first-response-budget', type=float, default=STARTUP_BUDGETS['first_response'])
+
+    args = parser.parse_args(sys.argv[1:] or ['run'])
+
+    if args.command == 'startup':
+        report = check_startup(args.runs, {'import': args.import_budget, 'first_response': args.first_response_budget})
+        for measure, seconds in report['seconds'].items():
+            flag = '' if seconds <= report['budgets'][measure] else '  OVER BUDGET'
+            print(f"{measure:<16}{seconds:>8.3f}s  (budget {report['budgets'][measure]:.3f}s){flag}")
+        if report['deferred_modules_loaded']:
+            print(f"Loaded at startup but should be deferred: {', '.join(report['deferred_modules_loaded'])}")
+        if not report['ok']:
+            print('\nSlowest imports of app.py:')
+            for seconds, module in _slowest_imports():
+                print(f"  {module:<24}{seconds:>8.3f}s")
+        sys.exit(0 if report['ok'] else 1)
+
+    if args.command == 'compare':
+        comparison = compare_results(_load(args.baseline), _load(args.current), args.threshold)
+    else:
+        if args.trades is not None:
+            scenarios = {'custom': {'trades': args.trades, 'tickers': args.tickers, 'years': args.years}}
+        else:
+            scenarios = {name: SCENARIOS[name] for name in (args.scenario or DEFAULT_SCENARIOS)}
+        results = run_benchmarks(scenarios, args.repeat, args.engine, args.charts)
+        _print_results(results)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=1)
+            print(f"\nResults written to {args.output}")
+        comparison = compare_results(_load(args.baseline), results, args.threshold) if args.baseline else None
+
+    if comparison is not None:
+        _print_comparison(comparison)
+        # Non-zero exit status so CI can fail on a slowdown
+        sys.exit(1 if any(row['regression'] for row in comparison) else 0)
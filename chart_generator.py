@@ -1,59 +1,176 @@
-import matplotlib.pyplot as plt
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
 
-def generate_charts(portfolio_value, open_positions_data):
+from column_store import open_column_store
+
+CHART_STATE_FILENAME = 'charts.json'
+
+# matplotlib is only imported by the functions below, so processes that never
+# render a chart (the web server) never load it
+
+def _figure(figsize):
+    # Figures are built on the headless Agg canvas, without pyplot's global state
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=figsize)
+    FigureCanvasAgg(figure)
+    return figure, figure.add_subplot()
+
+def _plot_portfolio_value(columns, path):
     # 1. Portfolio Value Over Time
-    plt.figure(figsize=(12, 6))
-    plt.plot(portfolio_value.index, portfolio_value['Current Value'], label='Total Portfolio Value')
-    plt.plot(portfolio_value.index, portfolio_value['Cost'], label='Total Cost')
-    plt.title('Portfolio Value Over Time')
-    plt.xlabel('Date')
-    plt.ylabel('Value ($)')
-    plt.grid(True)
-    plt.legend()
-    plt.savefig('output/portfolio_value_over_time.png')
-    plt.close()
+    figure, ax = _figure((12, 6))
+    ax.plot(columns['Date'], columns['Current Value'], label='Total Portfolio Value')
+    ax.plot(columns['Date'], columns['Cost'], label='Total Cost')
+    ax.set_title('Portfolio Value Over Time')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Value ($)')
+    ax.grid(True)
+    ax.legend()
+    figure.savefig(path)
 
+def _plot_daily_pnl_change(columns, path):
     # 2. Daily P&L Change
-    plt.figure(figsize=(12, 6))
-    colors = ['g' if x > 0 else 'r' for x in portfolio_value['Daily P&L Change']]
-    plt.bar(portfolio_value.index, portfolio_value['Daily P&L Change'], color=colors)
-    plt.title('Daily Portfolio P&L Change')
-    plt.xlabel('Date')
-    plt.ylabel('P&L Change ($)')
-    plt.grid(True)
-    plt.savefig('output/daily_pnl_change.png')
-    plt.close()
+    figure, ax = _figure((12, 6))
+    colors = np.where(columns['Daily P&L Change'] > 0, 'g', 'r')
+    ax.bar(columns['Date'], columns['Daily P&L Change'], color=colors)
+    ax.set_title('Daily Portfolio P&L Change')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('P&L Change ($)')
+    ax.grid(True)
+    figure.savefig(path)
 
+def _plot_asset_allocation(columns, path):
     # 3. Asset Allocation
-    plt.figure(figsize=(8, 8))
-    open_pos_df = pd.DataFrame(open_positions_data)
-    if not open_pos_df.empty:
-        plt.pie(open_pos_df['Value'], labels=open_pos_df['Symbol'], autopct='%1.1f%%', startangle=140)
-        plt.title('Portfolio Asset Allocation')
-        plt.axis('equal')
-        plt.savefig('output/asset_allocation.png')
-    plt.close()
+    figure, ax = _figure((8, 8))
+    ax.pie(columns['Value'], labels=columns['Symbol'], autopct='%1.1f%%', startangle=140)
+    ax.set_title('Portfolio Asset Allocation')
+    ax.axis('equal')
+    figure.savefig(path)
 
+def _plot_twr_vs_spy(columns, path):
     # 4. TWR vs. SPY
-    plt.figure(figsize=(12, 6))
-    plt.plot(portfolio_value.index, portfolio_value['TWR'], label='Portfolio TWR')
-    plt.plot(portfolio_value.index, portfolio_value['SPY_TWR'], label='SPY TWR')
-    plt.title('Time-Weighted Return (TWR) vs. SPY')
-    plt.xlabel('Date')
-    plt.ylabel('TWR (Normalized to 1)')
-    plt.grid(True)
-    plt.legend()
-    plt.savefig('output/twr_vs_spy.png')
-    plt.close()
+    figure, ax = _figure((12, 6))
+    ax.plot(columns['Date'], columns['TWR'], label='Portfolio TWR')
+    ax.plot(columns['Date'], columns['SPY_TWR'], label='SPY TWR')
+    ax.set_title('Time-Weighted Return (TWR) vs. SPY')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('TWR (Normalized to 1)')
+    ax.grid(True)
+    ax.legend()
+    figure.savefig(path)
 
+def _plot_cumulative_return(columns, path):
     # 5. Cumulative Cash Flow Adjusted Return
-    plt.figure(figsize=(12, 6))
-    plt.plot(portfolio_value.index, portfolio_value['Cumulative Cash Flow Adjusted Return'], label='Cumulative Cash Flow Adjusted Return')
-    plt.title('Cumulative Cash Flow Adjusted Return Over Time')
-    plt.xlabel('Date')
-    plt.ylabel('Return (%)')
-    plt.grid(True)
-    plt.legend()
-    plt.savefig('output/cumulative_cash_flow_adjusted_return.png')
-    plt.close()
\ No newline at end of file
+    figure, ax = _figure((12, 6))
+    ax.plot(columns['Date'], columns['Cumulative Cash Flow Adjusted Return'], label='Cumulative Cash Flow Adjusted Return')
+    ax.set_title('Cumulative Cash Flow Adjusted Return Over Time')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Return (%)')
+    ax.grid(True)
+    ax.legend()
+    figure.savefig(path)
+
+# File name -> (source table, source columns, plot function)
+CHARTS = {
+    'portfolio_value_over_time.png': ('portfolio_value', ['Date', 'Current Value', 'Cost'], _plot_portfolio_value),
+    'daily_pnl_change.png': ('portfolio_value', ['Date', 'Daily P&L Change'], _plot_daily_pnl_change),
+    'asset_allocation.png': ('open_positions', ['Symbol', 'Value'], _plot_asset_allocation),
+    'twr_vs_spy.png': ('portfolio_value', ['Date', 'TWR', 'SPY_TWR'], _plot_twr_vs_spy),
+    'cumulative_cash_flow_adjusted_return.png': ('portfolio_value', ['Date', 'Cumulative Cash Flow Adjusted Return'], _plot_cumulative_return),
+}
+
+def _source_digest(columns):
+    digest = hashlib.blake2b(digest_size=16)
+    for name, values in columns.items():
+        digest.update(name.encode('utf-8'))
+        digest.update(values.dtype.str.encode('ascii'))
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+def _render_one(job):
+    chart, columns, path = job
+    if 'Date' in columns:
+        columns = dict(columns, Date=pd.to_datetime(columns['Date']))
+    # Rendered under a temporary name (keeping the extension for the format) and renamed into place
+    root, extension = os.path.splitext(path)
+    tmp_path = f'{root}.tmp{extension}'
+    CHARTS[chart][2](columns, tmp_path)
+    os.replace(tmp_path, path)
+    return chart
+
+def _load_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, CHART_STATE_FILENAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _save_state(output_dir, state):
+    path = os.path.join(output_dir, CHART_STATE_FILENAME)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(f'{path}.tmp', path)
+
+def render_charts(output_dir='output', workers=None, force=False):
+    """
+    Renders the PNG charts from the column store written by the last run.
+
+    A chart is only re-rendered when the columns it is drawn from changed since
+    it was last rendered (or its file is missing). Stale charts are rendered in
+    parallel worker processes.
+
+    Args:
+        output_dir (str): Directory holding the column store; charts are written here.
+        workers (int): Worker processes; None picks one per stale chart up to the
+            number of cores, 1 renders in this process.
+        force (bool): Re-render every chart.
+
+    Returns:
+        list: File names of the charts that were rendered.
+    """
+    tables = open_column_store(output_dir)
+    if tables is None:
+        raise FileNotFoundError(f"No column store in '{output_dir}'; run the portfolio pipeline first")
+
+    state = _load_state(output_dir)
+    jobs = []
+    for chart, (table, source_columns, _) in CHARTS.items():
+        path = os.path.join(output_dir, chart)
+        if tables[table].rows == 0:
+            # Nothing to draw, e.g. no open positions: drop the outdated chart
+            if os.path.exists(path):
+                os.remove(path)
+            state.pop(chart, None)
+            continue
+        columns = {name: np.asarray(tables[table].columns[name]) for name in source_columns}
+        digest = _source_digest(columns)
+        if force or state.get(chart) != digest or not os.path.exists(path):
+            jobs.append((chart, columns, path))
+            state[chart] = digest
+
+    if workers is None:
+        workers = min(len(jobs), os.cpu_count() or 1)
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rendered = list(pool.map(_render_one, jobs))
+    else:
+        rendered = [_render_one(job) for job in jobs]
+
+    _save_state(output_dir, state)
+    return rendered
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render the PNG charts from the last portfolio run.')
+    parser.add_argument('--output-dir', default='output', help='Output directory of the run')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per stale chart)')
+    parser.add_argument('--force', action='store_true', help='Re-render charts whose data did not change')
+    args = parser.parse_args()
+
+    rendered = render_charts(args.output_dir, args.workers, args.force)
+    print(f"Rendered {len(rendered)} of {len(CHARTS)} charts in '{args.output_dir}'.")
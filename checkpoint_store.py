@@ -0,0 +1,112 @@
+import bisect
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+# Trading days between checkpoints; the last evaluated day is always checkpointed too
+CHECKPOINT_INTERVAL = 21
+# Bumped whenever the pickled layout changes; a file of another version is discarded
+FORMAT_VERSION = 2
+
+def _first_divergence(old_dates, old_digests, new_dates, new_digests):
+    """Returns the earliest date from which two date-ordered digest sequences differ, or None."""
+    common = min(len(old_digests), len(new_digests))
+    differs = (old_digests[:common] != new_digests[:common]) | (old_dates[:common] != new_dates[:common])
+    position = int(np.argmax(differs)) if differs.any() else common
+    if position == len(old_digests) and position == len(new_digests):
+        return None
+    candidates = [dates[position] for dates in (old_dates, new_dates) if position < len(dates)]
+    return pd.Timestamp(min(candidates))
+
+def _price_digests(price_data, columns):
+    return pd.util.hash_pandas_object(price_data[columns], index=True).to_numpy()
+
+class CheckpointStore:
+    """
+    Results of the last evaluation (with the per-ticker attribution) plus daily
+    state checkpoints (lots, closed positions, cumulative totals) taken every
+    `interval` trading days.
+
+    Digests of the ledger rows and price rows used are kept as well, so the next
+    evaluation can find the first date that changed and resume from the
+    checkpoint before it.
+    """
+
+    def __init__(self, interval=CHECKPOINT_INTERVAL):
+        self.interval = interval
+        self.checkpoints = []
+        self.portfolio_value = None
+        self.open_positions = {}
+        self.closed_positions = []
+        self.price_columns = []
+        self.price_dates = None
+        self.price_digests = None
+        self.ledger_dates = None
+        self.ledger_digests = None
+        self.lot_method = None
+        self.attribution = None
+
+    @classmethod
+    def load(cls, path, interval=CHECKPOINT_INTERVAL):
+        """Returns the store saved at path, or an empty one if it is missing, unreadable or of another format."""
+        if not os.path.exists(path):
+            return cls(interval)
+        try:
+            with open(path, 'rb') as f:
+                version, store = pickle.load(f)
+        except Exception:
+            # Truncated, or pickled by code whose classes have since changed
+            return cls(interval)
+        if version != FORMAT_VERSION:
+            return cls(interval)
+        store.interval = interval
+        return store
+
+    def save(self, path):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((FORMAT_VERSION, self), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def first_changed_date(self, ledger, price_data, lot_method):
+        """
+        Returns the first date whose ledger rows or closes differ from the last
+        evaluation, the first price date if there is nothing to compare against
+        or the lot relief method changed, or None when nothing changed.
+        """
+        if (self.portfolio_value is None or lot_method != self.lot_method
+                or not set(self.price_columns) <= set(price_data.columns)):
+            return price_data.index[0]
+
+        changes = [
+            _first_divergence(self.ledger_dates, self.ledger_digests, ledger.trade_dates, ledger.row_digests()),
+            _first_divergence(self.price_dates, self.price_digests,
+                              price_data.index.to_numpy(), _price_digests(price_data, self.price_columns)),
+        ]
+        changes = [date for date in changes if date is not None]
+        return min(changes) if changes else None
+
+    def checkpoint_before(self, date):
+        """Returns the latest checkpoint strictly before `date`, or None."""
+        position = bisect.bisect_left([checkpoint['date'] for checkpoint in self.checkpoints], date)
+        return self.checkpoints[position - 1] if position > 0 else None
+
+    def update(self, ledger, price_data, portfolio_value, open_positions, closed_positions, checkpoints, resume_at, lot_method,
+               attribution=None):
+        kept = []
+        if resume_at:
+            last_kept_day = price_data.index[resume_at - 1]
+            kept = [checkpoint for checkpoint in self.checkpoints if checkpoint['date'] <= last_kept_day]
+        self.checkpoints = kept + checkpoints
+        self.portfolio_value = portfolio_value
+        self.open_positions = open_positions
+        self.closed_positions = closed_positions
+        self.price_columns = list(price_data.columns)
+        self.price_dates = price_data.index.to_numpy()
+        self.price_digests = _price_digests(price_data, self.price_columns)
+        self.ledger_dates = ledger.trade_dates
+        self.ledger_digests = ledger.row_digests()
+        self.lot_method = lot_method
+        self.attribution = attribution
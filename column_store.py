@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+COLUMN_STORE_DIRNAME = 'columns'
+MANIFEST_FILENAME = 'manifest.json'
+CURRENT_FILENAME = 'CURRENT'
+
+# Older generations are kept for readers that still have them memory-mapped
+_KEEP_GENERATIONS = 2
+
+def _column_array(series):
+    """Converts a report column to a fixed-width array that np.load can memory-map."""
+    if isinstance(series, np.ndarray) and series.dtype.kind in 'biuf':
+        return series
+    series = pd.Series(series) if not isinstance(series, pd.Series) else series
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.strftime('%Y-%m-%d').to_numpy(dtype=str)
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy()
+    return series.astype(str).to_numpy(dtype=str)
+
+def _generations(store_dir):
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(int(name[1:]) for name in os.listdir(store_dir) if name.startswith('g') and name[1:].isdigit())
+
+def write_column_store(tables, output_dir='output'):
+    """
+    Writes each table as one .npy file per column under output_dir/columns/.
+
+    A run writes a new generation directory and then points CURRENT at it with an
+    atomic rename, so readers see either the old or the new tables, never a mix.
+
+    Args:
+        tables (dict): Table name -> pd.DataFrame, or a dict of column name ->
+            array with one row per table row; numeric arrays may be 2-D.
+        output_dir (str): Directory that holds the CSV reports.
+
+    Returns:
+        str: Path of the generation that was written.
+    """
+    store_dir = os.path.join(output_dir, COLUMN_STORE_DIRNAME)
+    os.makedirs(store_dir, exist_ok=True)
+    generations = _generations(store_dir)
+    generation = f'g{(generations[-1] + 1) if generations else 1}'
+    generation_dir = os.path.join(store_dir, generation)
+    os.makedirs(generation_dir)
+
+    manifest = {'generation': generation, 'tables': {}}
+    for table, frame in tables.items():
+        os.makedirs(os.path.join(generation_dir, table))
+        digest = hashlib.blake2b(digest_size=8)
+        columns = []
+        for position, (name, column) in enumerate(frame.items()):
+            values = _column_array(column)
+            file_name = os.path.join(table, f'{position:03d}.npy')
+            np.save(os.path.join(generation_dir, file_name), values, allow_pickle=False)
+            digest.update(name.encode('utf-8'))
+            digest.update(values.dtype.str.encode('ascii'))
+            digest.update(np.ascontiguousarray(values).tobytes())
+            columns.append({'name': name, 'file': file_name})
+        rows = len(frame) if isinstance(frame, pd.DataFrame) else len(next(iter(frame.values()), ()))
+        manifest['tables'][table] = {'rows': rows, 'columns': columns, 'digest': digest.hexdigest()}
+
+    with open(os.path.join(generation_dir, MANIFEST_FILENAME), 'w') as f:
+        json.dump(manifest, f)
+    tmp_path = os.path.join(store_dir, f'{CURRENT_FILENAME}.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(generation)
+    os.replace(tmp_path, os.path.join(store_dir, CURRENT_FILENAME))
+
+    for old in _generations(store_dir)[:-_KEEP_GENERATIONS]:
+        shutil.rmtree(os.path.join(store_dir, f'g{old}'), ignore_errors=True)
+    return generation_dir
+
+class ColumnTable:
+    """One table of the column store; columns are read-only memory maps."""
+
+    def __init__(self, name, rows, columns, digest):
+        self.name = name
+        self.rows = rows
+        self.columns = columns
+        self.digest = digest
+
+    def to_frame(self):
+        # Numeric columns stay views on the memory maps
+        return pd.DataFrame(self.columns, copy=False)
+
+def open_column_store(output_dir='output'):
+    """
+    Memory-maps the current generation of the column store.
+
+    Returns:
+        dict: Table name -> ColumnTable, or None when no store has been written.
+    """
+    store_dir = os.path.join(output_dir, COLUMN_STORE_DIRNAME)
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILENAME)) as f:
+            generation_dir = os.path.join(store_dir, f.read().strip())
+        with open(os.path.join(generation_dir, MANIFEST_FILENAME)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    tables = {}
+    for table, entry in manifest['tables'].items():
+        columns = {
+            column['name']: np.load(os.path.join(generation_dir, column['file']), mmap_mode='r', allow_pickle=False)
+            for column in entry['columns']
+        }
+        tables[table] = ColumnTable(table, entry['rows'], columns, entry['digest'])
+    return tables
@@ -1,13 +1,137 @@
+import hashlib
+import os
+
+import numpy as np
 import pandas as pd
-import yfinance as yf
 from datetime import datetime, timedelta
 
+from ledger_store import LedgerStore, is_ledger_store
+from price_cache import default_price_cache
+
+BUY = 1
+SELL = -1
+SIDES = {'Buy': BUY, 'Sell': SELL}
+
+class TransactionLedger:
+    """
+    Transactions compiled into typed column arrays, sorted by date.
+
+    Rows for one date are contiguous; `offsets[k]:offsets[k + 1]` holds the rows
+    of `dates[k]`, so a day's transactions are a slice rather than a scan of the
+    whole ledger.
+    """
+
+    def __init__(self, trade_dates, tickers, ticker_codes, side, quantity, price, commission, lot=None):
+        self.trade_dates = trade_dates
+        self.tickers = tickers
+        self.ticker_codes = ticker_codes
+        self.side = side
+        self.quantity = quantity
+        self.price = price
+        self.commission = commission
+        # Optional 1-based lot number a sell relieves first, 0 when not given
+        self.lot = lot if lot is not None else np.zeros(len(trade_dates), dtype=np.int64)
+
+        self.dates, first_rows, counts = np.unique(trade_dates, return_index=True, return_counts=True)
+        self.offsets = np.append(first_rows, len(trade_dates)).astype(np.int64)
+        self.counts = counts
+        self._day_positions = {pd.Timestamp(date): k for k, date in enumerate(self.dates)}
+
+        # Net cash flow per date as used for the time-weighted return: buys pay out, sells pay in
+        self.amount = quantity * price
+        self.day_cash_flow = np.add.reduceat(-side * self.amount, first_rows) if len(trade_dates) else np.zeros(0)
+
+    def __len__(self):
+        return len(self.trade_dates)
+
+    def day_slice(self, date):
+        k = self._day_positions.get(date)
+        if k is None:
+            return slice(0, 0)
+        return slice(self.offsets[k], self.offsets[k + 1])
+
+    def row_digests(self):
+        """One 64-bit hash per transaction, for spotting where two ledgers diverge."""
+        rows = pd.DataFrame({
+            'date': self.trade_dates,
+            'ticker': self.tickers[self.ticker_codes],
+            'side': self.side,
+            'quantity': self.quantity,
+            'price': self.price,
+            'commission': self.commission,
+            'lot': self.lot,
+        })
+        return pd.util.hash_pandas_object(rows, index=False).to_numpy()
+
+    def lot_ids(self, row):
+        """LotBook ids a row's sell should relieve first."""
+        lot = self.lot[row]
+        return (lot - 1,) if lot > 0 else ()
+
+    def net_cash_flow(self, date):
+        """Returns the date's net cash flow, or None when nothing traded that day."""
+        k = self._day_positions.get(date)
+        if k is None:
+            return None
+        return self.day_cash_flow[k]
+
 def load_transactions(transactions_file):
+    """Loads a transactions CSV, or a ledger store when the path is a .sqlite/.db file."""
+    if is_ledger_store(transactions_file):
+        return compile_ledger(LedgerStore(transactions_file).load())
     transactions = pd.read_csv(transactions_file)
     transactions['Date'] = pd.to_datetime(transactions['Date'], format='%m/%d/%y')
-    transactions = transactions.sort_values(by='Date')
-    return transactions
+    transactions = transactions.sort_values(by='Date', kind='stable')
+    return compile_ledger(transactions)
+
+def compile_ledger(transactions):
+    ticker_codes, tickers = pd.factorize(transactions['Ticker'])
+    return TransactionLedger(
+        trade_dates=transactions['Date'].to_numpy(dtype='datetime64[ns]'),
+        tickers=np.asarray(tickers, dtype=object),
+        ticker_codes=ticker_codes.astype(np.int32),
+        side=transactions['Type'].map(SIDES).fillna(0).to_numpy(dtype=np.int8),
+        quantity=transactions['Quantity'].to_numpy(),
+        price=transactions['Price'].to_numpy(dtype=np.float64),
+        commission=transactions['Commission'].to_numpy(dtype=np.float64),
+        lot=pd.to_numeric(transactions['Lot'], errors='coerce').fillna(0).to_numpy(dtype=np.int64) if 'Lot' in transactions else None,
+    )
+
+_ledger_fingerprints = {}
+# Opened once per path: opening a LedgerStore sets the database up, which writes
+_ledger_stores = {}
+
+def ledger_fingerprint(transactions_file):
+    """
+    Content hash of the transactions file. The file is only rehashed when its
+    size or modification time changes. A ledger store (a path, or an open
+    LedgerStore) is append-only, so its last row id identifies its contents.
+    """
+    if isinstance(transactions_file, LedgerStore):
+        return transactions_file.fingerprint()
+    if is_ledger_store(transactions_file):
+        if transactions_file not in _ledger_stores:
+            _ledger_stores[transactions_file] = LedgerStore(transactions_file)
+        return _ledger_stores[transactions_file].fingerprint()
+    stat = os.stat(transactions_file)
+    cached = _ledger_fingerprints.get(transactions_file)
+    if cached is not None and cached[0] == (stat.st_size, stat.st_mtime_ns):
+        return cached[1]
+    with open(transactions_file, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _ledger_fingerprints[transactions_file] = ((stat.st_size, stat.st_mtime_ns), digest)
+    return digest
+
+def fetch_price_data(tickers, start_date, end_date, cache=None):
+    """
+    Returns daily closes for the tickers, served from the local price cache and
+    fetching only the dates and tickers it does not hold yet.
+    """
+    if cache is None:
+        cache = default_price_cache()
+    return cache.get_closes(tickers, start_date, end_date)
 
-def fetch_price_data(tickers, start_date, end_date):
-    price_data = yf.download(tickers, start=start_date, end=end_date)['Close']
-    return price_data
\ No newline at end of file
+def price_data_version(cache=None):
+    if cache is None:
+        cache = default_price_cache()
+    return cache.version()
\ No newline at end of file
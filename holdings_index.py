@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+# Index keys pack the ticker's position above the day number, counted from the
+# index's first day so dates before 1970 pack too
+_DAY_BITS = 20
+
+def _day_numbers(dates):
+    return pd.DatetimeIndex(dates).to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+class HoldingsIndex:
+    """
+    Quantity and cost basis of every ticker at each day they changed.
+
+    Change points are grouped by ticker and date-ordered within a ticker, under
+    one sorted key array, so the positions on any date take a single binary
+    search per ticker (one vectorized np.searchsorted) instead of a replay of the
+    ledger. Each point holds the position at the end of its day.
+    """
+
+    def __init__(self, tickers, ticker_codes, days, quantity, cost_basis, keys=None):
+        self.tickers = list(tickers)
+        self.ticker_codes = np.asarray(ticker_codes, dtype=np.int64)
+        self.days = np.asarray(days, dtype=np.int64)
+        self.quantity = np.asarray(quantity, dtype=np.float64)
+        self.cost_basis = np.asarray(cost_basis, dtype=np.float64)
+        self.first_day = int(self.days.min()) if len(self.days) else 0
+        self.keys = np.asarray(keys, dtype=np.int64) if keys is not None else \
+            (self.ticker_codes << _DAY_BITS) | (self.days - self.first_day)
+
+    def __len__(self):
+        return len(self.days)
+
+    @classmethod
+    def from_changes(cls, dates, tickers, day_idx, ticker_idx, quantity, cost, opening=None):
+        """
+        Builds the index from per-transaction changes, as replayed by the valuation engine.
+
+        Args:
+            dates (pd.DatetimeIndex): Trading days the day indexes refer to.
+            tickers (list): Tickers the ticker indexes refer to.
+            day_idx, ticker_idx (np.ndarray): Day and ticker of each change (-1 for
+                tickers outside `tickers`, which are skipped).
+            quantity, cost (np.ndarray): Change of each.
+            opening (dict): Ticker -> (quantity, cost basis) before the first day.
+        """
+        opening = opening or {}
+        known = ticker_idx >= 0
+        n_days = len(dates)
+        # Changes on one day are summed first, as in the engine's holdings matrix
+        keys, inverse = np.unique(ticker_idx[known].astype(np.int64) * n_days + day_idx[known], return_inverse=True)
+        quantity_change = np.bincount(inverse, weights=quantity[known], minlength=len(keys))
+        cost_change = np.bincount(inverse, weights=cost[known], minlength=len(keys))
+        ticker_of, day_of = np.divmod(keys, n_days) if n_days else (keys, keys)
+
+        codes, days, quantities, costs = [], [], [], []
+        bounds = np.searchsorted(ticker_of, np.arange(len(tickers) + 1))
+        day_numbers = _day_numbers(dates)
+        for t, ticker in enumerate(tickers):
+            lo, hi = bounds[t], bounds[t + 1]
+            if lo == hi:
+                continue
+            opening_quantity, opening_cost = opening.get(ticker, (0.0, 0.0))
+            ticker_quantity = np.cumsum(np.concatenate(([opening_quantity], quantity_change[lo:hi])))[1:]
+            ticker_cost = np.cumsum(np.concatenate(([opening_cost], cost_change[lo:hi])))[1:]
+            # A rejected sell changes nothing and leaves no point
+            changed = np.diff(np.concatenate(([opening_quantity], ticker_quantity))) != 0
+            changed |= np.diff(np.concatenate(([opening_cost], ticker_cost))) != 0
+            codes.append(np.full(changed.sum(), t))
+            days.append(day_numbers[day_of[lo:hi][changed]])
+            quantities.append(ticker_quantity[changed])
+            costs.append(ticker_cost[changed])
+        if not codes:
+            return cls(tickers, [], [], [], [])
+        return cls(tickers, np.concatenate(codes), np.concatenate(days), np.concatenate(quantities), np.concatenate(costs))
+
+    def extend(self, suffix, resume_date):
+        """
+        The points of this index before resume_date, the first day suffix was
+        evaluated from, then every point of suffix. Points from resume_date on
+        are dropped even where suffix has none, e.g. after a trade was removed.
+        """
+        tickers = self.tickers + [ticker for ticker in suffix.tickers if ticker not in set(self.tickers)]
+        kept = self.days < _day_numbers([resume_date])[0]
+        codes = np.concatenate([pd.Index(tickers).get_indexer(self.tickers)[self.ticker_codes[kept]],
+                                pd.Index(tickers).get_indexer(suffix.tickers)[suffix.ticker_codes]])
+        days = np.concatenate([self.days[kept], suffix.days])
+        order = np.lexsort((days, codes))
+        return HoldingsIndex(tickers, codes[order], days[order],
+                             np.concatenate([self.quantity[kept], suffix.quantity])[order],
+                             np.concatenate([self.cost_basis[kept], suffix.cost_basis])[order])
+
+    def as_of(self, date):
+        """
+        Positions at the end of `date`.
+
+        Returns:
+            pd.DataFrame: Symbol, Quantity and Cost Basis of every open position,
+                in ticker order.
+        """
+        if not len(self):
+            return pd.DataFrame({'Symbol': [], 'Quantity': [], 'Cost Basis': []})
+        day = _day_numbers([date])[0] - self.first_day
+        if day < 0:
+            return pd.DataFrame({'Symbol': [], 'Quantity': [], 'Cost Basis': []})
+        codes = np.arange(len(self.tickers), dtype=np.int64)
+        found = np.searchsorted(self.keys, (codes << _DAY_BITS) | day, side='right') - 1
+        # The point found belongs to an earlier ticker when this one has none by then
+        valid = found >= 0
+        found = np.maximum(found, 0)
+        valid &= self.ticker_codes[found] == codes
+        quantity = np.where(valid, self.quantity[found], 0.0)
+        cost_basis = np.where(valid, self.cost_basis[found], 0.0)
+        held = quantity > 0
+        return pd.DataFrame({
+            'Symbol': np.array(self.tickers, dtype=object)[held],
+            'Quantity': quantity[held],
+            'Cost Basis': cost_basis[held],
+        })
+
+    def diff(self, start, end):
+        """
+        Position changes between the end of `start` and the end of `end`.
+
+        Returns:
+            pd.DataFrame: Symbol, Quantity Before, Quantity After, Quantity Change,
+                Cost Basis Before, Cost Basis After and Cost Basis Change for every
+                ticker whose position differs.
+        """
+        before = self.as_of(start).set_index('Symbol')
+        after = self.as_of(end).set_index('Symbol')
+        symbols = [ticker for ticker in self.tickers if ticker in before.index or ticker in after.index]
+        before = before.reindex(symbols, fill_value=0.0)
+        after = after.reindex(symbols, fill_value=0.0)
+        changes = pd.DataFrame({
+            'Quantity Before': before['Quantity'],
+            'Quantity After': after['Quantity'],
+            'Quantity Change': after['Quantity'] - before['Quantity'],
+            'Cost Basis Before': before['Cost Basis'],
+            'Cost Basis After': after['Cost Basis'],
+            'Cost Basis Change': after['Cost Basis'] - before['Cost Basis'],
+        }).rename_axis('Symbol').reset_index()
+        return changes[(changes['Quantity Change'] != 0) | (changes['Cost Basis Change'] != 0)].reset_index(drop=True)
+
+    def columns(self):
+        """
+        Column store layout: the tickers, and one row per change point with the
+        code of its ticker; see from_columns.
+        """
+        return np.array(self.tickers, dtype=str), {
+            'Key': self.keys,
+            'Ticker Code': self.ticker_codes,
+            'Day': self.days,
+            'Quantity': self.quantity,
+            'Cost Basis': self.cost_basis,
+        }
+
+    @classmethod
+    def from_columns(cls, tickers, columns):
+        """The index over stored columns; memory-mapped columns are used without copying."""
+        return cls(tickers, columns['Ticker Code'], columns['Day'], columns['Quantity'], columns['Cost Basis'], columns['Key'])
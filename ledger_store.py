@@ -0,0 +1,293 @@
+import argparse
+import io
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_LEDGER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ledger.sqlite')
+LEDGER_SUFFIXES = ('.sqlite', '.db')
+
+REQUIRED_COLUMNS = ['Date', 'Ticker', 'Type', 'Quantity', 'Price', 'Commission']
+TRANSACTION_TYPES = ('Buy', 'Sell')
+# Dates are accepted as in transactions.csv (MM/DD/YY) or as YYYY-MM-DD
+DATE_FORMATS = ('%m/%d/%y', '%Y-%m-%d')
+
+# Row errors reported by a failed validation; the rest are only counted
+MAX_REPORTED_ERRORS = 50
+
+class LedgerValidationError(ValueError):
+    """Raised when transactions fail validation; `errors` lists the offending rows."""
+
+    def __init__(self, errors, total=None):
+        self.errors = errors[:MAX_REPORTED_ERRORS]
+        self.total = total if total is not None else len(errors)
+        if errors and errors[0]['row'] is None:
+            super().__init__(errors[0]['error'])
+        else:
+            super().__init__(f"{self.total} invalid transaction row(s)")
+
+def is_ledger_store(path):
+    return str(path).endswith(LEDGER_SUFFIXES)
+
+def _parse_dates(values):
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for date_format in DATE_FORMATS:
+        missing = parsed.isna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(values[missing], format=date_format, errors='coerce')
+    return parsed
+
+def validate_transactions(frame):
+    """
+    Checks and normalizes transactions in the transactions.csv layout.
+
+    Every row is checked before anything is returned, so a file is accepted or
+    rejected as a whole.
+
+    Args:
+        frame (pd.DataFrame): Columns Date, Ticker, Type, Quantity, Price,
+            Commission and optionally Lot, as parsed from CSV (any dtypes).
+
+    Returns:
+        pd.DataFrame: Date as datetime, Ticker upper-cased, Type 'Buy'/'Sell',
+            numeric Quantity, Price, Commission and Lot (NaN when not given).
+
+    Raises:
+        LedgerValidationError: Missing columns, or rows with a bad value; the
+            errors give the 1-based data row and the problem.
+    """
+    missing_columns = [column for column in REQUIRED_COLUMNS if column not in frame.columns]
+    if missing_columns:
+        raise LedgerValidationError([{'row': None, 'error': f"Missing column(s): {', '.join(missing_columns)}"}])
+
+    text = frame[REQUIRED_COLUMNS].astype(str).apply(lambda column: column.str.strip())
+    dates = _parse_dates(text['Date'])
+    tickers = text['Ticker'].str.upper()
+    types = text['Type'].str.capitalize()
+    quantity = pd.to_numeric(frame['Quantity'], errors='coerce')
+    price = pd.to_numeric(frame['Price'], errors='coerce')
+    commission = pd.to_numeric(frame['Commission'], errors='coerce')
+    lot = pd.to_numeric(frame['Lot'], errors='coerce') if 'Lot' in frame else pd.Series(np.nan, index=frame.index)
+    lot_given = frame['Lot'].notna() & (frame['Lot'].astype(str).str.strip() != '') if 'Lot' in frame else lot.notna()
+
+    checks = [
+        (dates.isna(), "Date must be MM/DD/YY or YYYY-MM-DD"),
+        (frame['Ticker'].isna() | (tickers == ''), "Ticker is empty"),
+        (~types.isin(TRANSACTION_TYPES), "Type must be Buy or Sell"),
+        (~(quantity > 0), "Quantity must be a positive number"),
+        (~(price > 0), "Price must be a positive number"),
+        (~(commission >= 0), "Commission must be zero or more"),
+        (lot_given & ~((lot >= 1) & (lot % 1 == 0)), "Lot must be a positive whole number"),
+    ]
+    errors = []
+    for failed, message in checks:
+        for position in np.flatnonzero(failed.to_numpy()):
+            errors.append({'row': int(position) + 1, 'error': message})
+    if errors:
+        errors.sort(key=lambda error: error['row'])
+        raise LedgerValidationError(errors)
+
+    return pd.DataFrame({
+        'Date': dates,
+        'Ticker': tickers,
+        'Type': types,
+        'Quantity': quantity,
+        'Price': price,
+        'Commission': commission,
+        'Lot': lot,
+    }).reset_index(drop=True)
+
+def read_transactions_csv(source):
+    """Parses a transactions CSV (a path or the file's bytes) for validate_transactions, all columns as text."""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    frame = pd.read_csv(source, dtype=str, keep_default_na=False, na_values=[''], skip_blank_lines=True)
+    frame.columns = [str(column).strip() for column in frame.columns]
+    return frame
+
+class LedgerStore:
+    """
+    Append-only SQLite store of the transactions.
+
+    The database runs in WAL mode, so readers (the recompute worker) never block
+    an import. Rows are only ever inserted, each import in a single transaction
+    recorded as one batch; triggers reject updates and deletes. Date and ticker
+    are indexed.
+    """
+
+    def __init__(self, path=DEFAULT_LEDGER_PATH):
+        self.path = path
+        self._store_id = None
+        self._readers = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS batches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    source TEXT,
+                    rows INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS transactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    batch_id INTEGER NOT NULL REFERENCES batches (id),
+                    date TEXT NOT NULL,
+                    ticker TEXT NOT NULL,
+                    type TEXT NOT NULL CHECK (type IN ('Buy', 'Sell')),
+                    quantity NUMERIC NOT NULL,
+                    price REAL NOT NULL,
+                    commission REAL NOT NULL,
+                    lot INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS transactions_date ON transactions (date);
+                CREATE INDEX IF NOT EXISTS transactions_ticker ON transactions (ticker, date);
+                CREATE TRIGGER IF NOT EXISTS transactions_no_update BEFORE UPDATE ON transactions
+                BEGIN SELECT RAISE(ABORT, 'the ledger is append-only'); END;
+                CREATE TRIGGER IF NOT EXISTS transactions_no_delete BEFORE DELETE ON transactions
+                BEGIN SELECT RAISE(ABORT, 'the ledger is append-only'); END;
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+            """)
+            # Identifies this database in fingerprints, so a recreated store never matches an old one
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', ?)", (uuid.uuid4().hex,))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def append(self, transactions, source=None):
+        """
+        Validates and inserts transactions in one database transaction.
+
+        Args:
+            transactions (pd.DataFrame): Rows in the transactions.csv layout.
+            source (str): Where the rows came from, kept with the batch.
+
+        Returns:
+            dict: {'batch_id', 'rows', 'version'}.
+
+        Raises:
+            LedgerValidationError: Nothing is inserted when any row is invalid.
+        """
+        return self.commit_batches([(validate_transactions(transactions), source)])[0]
+
+    def commit_batches(self, batches, durable=False):
+        """
+        Inserts already validated batches in a single database transaction (a
+        group commit), each recorded as its own batch.
+
+        Args:
+            batches (list): (rows from validate_transactions, source) pairs.
+            durable (bool): fsync the write-ahead log before returning, so the
+                rows survive a power loss, not only a crash of this process.
+
+        Returns:
+            list: {'batch_id', 'rows', 'version'} per batch, in order; version
+                is the ledger version right after the commit, see version().
+        """
+        committed = []
+        with closing(self._connect()) as conn:
+            if durable:
+                conn.execute("PRAGMA synchronous=FULL")
+            with conn:
+                for rows, source in batches:
+                    lots = [None if np.isnan(lot) else int(lot) for lot in rows['Lot'].tolist()]
+                    batch_id = conn.execute("INSERT INTO batches (source, rows, created_at) VALUES (?, ?, ?)",
+                                            (source, len(rows), time.time())).lastrowid
+                    values = zip([batch_id] * len(rows), rows['Date'].dt.strftime('%Y-%m-%d'), rows['Ticker'], rows['Type'],
+                                 rows['Quantity'].tolist(), rows['Price'].tolist(), rows['Commission'].tolist(), lots)
+                    conn.executemany("INSERT INTO transactions (batch_id, date, ticker, type, quantity, price, commission, lot) "
+                                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", values)
+                    committed.append({'batch_id': batch_id, 'rows': len(rows)})
+                version = self._version(conn)
+        return [dict(batch, version=version) for batch in committed]
+
+    def import_csv(self, source, name=None):
+        """Appends every row of a transactions CSV (a path or the file's bytes) as one batch."""
+        return self.append(read_transactions_csv(source), name or (source if isinstance(source, str) else None))
+
+    def __len__(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    @staticmethod
+    def _version(conn):
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
+
+    def version(self):
+        """
+        Id of the last transaction. It only grows, so a result computed from
+        version v includes every transaction committed at or before v.
+        """
+        with closing(self._connect()) as conn:
+            return self._version(conn)
+
+    def fingerprint(self):
+        """
+        Changes with every append; rows are never rewritten, so the last id
+        suffices. A single indexed read on a plain connection, cheap enough for
+        every request: in WAL mode it never waits for a writer.
+        """
+        conn = getattr(self._readers, 'conn', None)
+        if conn is None:
+            # Kept open per thread; outside a transaction each query sees the latest commit
+            conn = self._readers.conn = sqlite3.connect(self.path)
+        if self._store_id is None:
+            self._store_id = conn.execute("SELECT value FROM meta WHERE key = 'store_id'").fetchone()[0]
+        return f'{self._store_id}:{self._version(conn)}'
+
+    def load(self):
+        """
+        Returns the ledger as load_transactions reads it from CSV: in date order,
+        rows of one date in insertion order.
+        """
+        with closing(self._connect()) as conn:
+            frame = pd.read_sql_query(
+                "SELECT date AS Date, ticker AS Ticker, type AS Type, quantity AS Quantity, price AS Price, "
+                "commission AS Commission, lot AS Lot FROM transactions ORDER BY date, id", conn)
+        frame['Date'] = pd.to_datetime(frame['Date'], format='%Y-%m-%d')
+        return frame
+
+    def export_csv(self, path):
+        """Writes the ledger in the transactions.csv format."""
+        frame = self.load()
+        frame['Date'] = frame['Date'].dt.strftime('%m/%d/%y')
+        if frame['Lot'].isna().all():
+            frame = frame.drop(columns='Lot')
+        else:
+            frame['Lot'] = frame['Lot'].astype('Int64')
+        frame.to_csv(path, index=False)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the append-only transaction ledger.')
+    parser.add_argument('--ledger', default=DEFAULT_LEDGER_PATH, help='Path of the SQLite ledger')
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help='Append the rows of a transactions CSV')
+    import_parser.add_argument('csv')
+    export_parser = commands.add_parser('export', help='Write the ledger as a transactions CSV')
+    export_parser.add_argument('csv')
+    args = parser.parse_args()
+
+    store = LedgerStore(args.ledger)
+    if args.command == 'import':
+        try:
+            batch = store.import_csv(args.csv)
+        except LedgerValidationError as e:
+            for error in e.errors:
+                print(f"row {error['row']}: {error['error']}")
+            raise SystemExit(f"{e}; nothing was imported")
+        print(f"Imported {batch['rows']} transactions as batch {batch['batch_id']}")
+    else:
+        store.export_csv(args.csv)
+        print(f"Exported {len(store)} transactions to {args.csv}")
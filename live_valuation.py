@@ -0,0 +1,175 @@
+import asyncio
+import math
+import random
+import time
+
+from column_store import open_column_store
+
+class QuoteSource:
+    """Source of intraday quotes for the live valuation."""
+
+    async def stream(self, last_prices):
+        """
+        Yields batches of new prices for the tickers in last_prices.
+
+        Args:
+            last_prices (dict): Ticker -> last known price (the end-of-day close).
+
+        Yields:
+            dict: Ticker -> price, only for the tickers that changed.
+        """
+        raise NotImplementedError
+        yield
+
+class SimulatedQuoteSource(QuoteSource):
+    """
+    Local random-walk feed for testing: every `interval` seconds a random share
+    of the tickers moves by a normally distributed return.
+    """
+
+    def __init__(self, interval=0.5, volatility=0.001, share=0.2, seed=None):
+        self.interval = interval
+        self.volatility = volatility
+        self.share = share
+        self.seed = seed
+
+    async def stream(self, last_prices):
+        rng = random.Random(self.seed)
+        prices = dict(last_prices)
+        tickers = list(prices)
+        while tickers:
+            await asyncio.sleep(self.interval)
+            moved = rng.sample(tickers, max(1, round(len(tickers) * self.share)))
+            for ticker in moved:
+                prices[ticker] = round(prices[ticker] * math.exp(rng.gauss(0, self.volatility)), 4)
+            yield {ticker: prices[ticker] for ticker in moved}
+
+class YFinanceQuoteSource(QuoteSource):
+    """Polls Yahoo Finance for the latest one-minute closes every `interval` seconds."""
+
+    def __init__(self, interval=60):
+        self.interval = interval
+
+    def _fetch(self, tickers):
+        # Imported on first use, like price_cache.YFinanceProvider
+        import yfinance as yf
+        closes = yf.download(tickers, period='1d', interval='1m', progress=False)['Close']
+        if closes.ndim == 1:
+            closes = closes.to_frame(tickers[0])
+        latest = closes.ffill().iloc[-1] if len(closes) else {}
+        return {ticker: float(price) for ticker, price in latest.items() if price == price}
+
+    async def stream(self, last_prices):
+        loop = asyncio.get_running_loop()
+        tickers = sorted(last_prices)
+        known = dict(last_prices)
+        while tickers:
+            quotes = await loop.run_in_executor(None, self._fetch, tickers)
+            changed = {ticker: price for ticker, price in quotes.items() if known.get(ticker) != price}
+            known.update(changed)
+            if changed:
+                yield changed
+            await asyncio.sleep(self.interval)
+
+class LiveBook:
+    """
+    Open positions of the last end-of-day run, revalued as quotes arrive.
+
+    Quantities and cost bases are fixed until the next run; a quote only changes
+    its own position, and the totals are adjusted by that position's difference,
+    so a tick costs O(tickers it moves) however large the book is.
+    """
+
+    def __init__(self, symbols, quantities, costs, closes, closed_pnl=0.0, as_of=None):
+        self.symbols = list(symbols)
+        self.quantities = [float(quantity) for quantity in quantities]
+        self.costs = [float(cost) for cost in costs]
+        self.closes = [float(close) for close in closes]
+        self.prices = list(self.closes)
+        self.values = [quantity * price for quantity, price in zip(self.quantities, self.prices)]
+        self.positions = {symbol: position for position, symbol in enumerate(self.symbols)}
+        self.closed_pnl = float(closed_pnl)
+        self.as_of = as_of
+        self.updated_at = None
+
+        self.close_value = sum(self.values)
+        self.value = self.close_value
+        self.cost = sum(self.costs)
+
+    @classmethod
+    def from_column_store(cls, output_dir):
+        """The book of the run last written to output_dir's column store, or None."""
+        tables = open_column_store(output_dir)
+        if tables is None:
+            return None
+        open_positions = tables['open_positions'].columns
+        portfolio_value = tables['portfolio_value']
+        last = portfolio_value.rows - 1
+        return cls(
+            open_positions['Symbol'].tolist(),
+            open_positions['Quantity'].tolist(),
+            open_positions['Cost'].tolist(),
+            open_positions['Price'].tolist(),
+            closed_pnl=float(portfolio_value.columns['Closed P&L'][last]) if last >= 0 else 0.0,
+            as_of=str(portfolio_value.columns['Date'][last]) if last >= 0 else None,
+        )
+
+    def last_prices(self):
+        return dict(zip(self.symbols, self.prices))
+
+    def apply(self, quotes):
+        """
+        Revalues the positions of the quoted tickers.
+
+        Args:
+            quotes (dict): Ticker -> price; tickers not in the book are ignored.
+
+        Returns:
+            list: Symbols whose price changed.
+        """
+        changed = []
+        for symbol, price in quotes.items():
+            position = self.positions.get(symbol)
+            if position is None or price == self.prices[position]:
+                continue
+            value = self.quantities[position] * price
+            self.value += value - self.values[position]
+            self.values[position] = value
+            self.prices[position] = price
+            changed.append(symbol)
+        if changed:
+            self.updated_at = time.time()
+        return changed
+
+    def position(self, symbol):
+        position = self.positions[symbol]
+        value = self.values[position]
+        return {
+            'symbol': symbol,
+            'quantity': self.quantities[position],
+            'price': self.prices[position],
+            'value': round(value, 2),
+            'cost': round(self.costs[position], 2),
+            'pnl': round(value - self.costs[position], 2),
+            'day_change': round(value - self.quantities[position] * self.closes[position], 2),
+        }
+
+    def totals(self):
+        current_pnl = self.value - self.cost
+        return {
+            'as_of': self.as_of,
+            'updated_at': self.updated_at,
+            'value': round(self.value, 2),
+            'cost': round(self.cost, 2),
+            'current_pnl': round(current_pnl, 2),
+            'closed_pnl': round(self.closed_pnl, 2),
+            'overall_pnl': round(current_pnl + self.closed_pnl, 2),
+            'day_change': round(self.value - self.close_value, 2),
+        }
+
+    def snapshot(self):
+        return {'totals': self.totals(), 'positions': [self.position(symbol) for symbol in self.symbols]}
+
+    def update(self, symbols):
+        """The totals and the given positions, as pushed to live clients."""
+        return {'totals': self.totals(), 'positions': [self.position(symbol) for symbol in symbols]}
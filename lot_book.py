@@ -0,0 +1,121 @@
+import heapq
+
+FIFO = 'fifo'
+LIFO = 'lifo'
+HIFO = 'hifo'
+LOT_METHODS = (FIFO, LIFO, HIFO)
+
+# Drained lots at the front are dropped once there are this many of them
+_COMPACT_AFTER = 64
+
+class LotBook:
+    """
+    Open lots of one ticker, stored as parallel lists of quantity and cost per
+    share. Lot ids are assigned in purchase order starting at 0 and never change.
+
+    Sells drain lots by the book's method:
+        fifo: oldest first, through a head pointer that skips drained lots
+        lifo: newest first, through a stack of lot ids
+        hifo: highest cost per share first, through a heap of lot ids
+    Specific lots can be relieved first by passing their ids to relieve().
+    A sell costs O(lots it touches), or O(lots touched * log lots) for hifo.
+    """
+
+    def __init__(self, method=FIFO):
+        if method not in LOT_METHODS:
+            raise ValueError(f"Unknown lot relief method '{method}', expected one of {LOT_METHODS}")
+        self.method = method
+        self._quantity = []
+        self._cost_per_share = []
+        self._first_id = 0 # id of _quantity[0]
+        self._head = 0
+        self._stack = []
+        self._heap = []
+        self._open = 0
+
+    def __len__(self):
+        return self._open
+
+    def __eq__(self, other):
+        if not isinstance(other, LotBook):
+            return NotImplemented
+        return self.method == other.method and list(self) == list(other)
+
+    def __iter__(self):
+        """Yields the open lots, oldest first, as {'lot_id', 'quantity', 'cost_per_share'}."""
+        for position in range(self._head, len(self._quantity)):
+            if self._quantity[position] > 0:
+                yield {
+                    'lot_id': self._first_id + position,
+                    'quantity': self._quantity[position],
+                    'cost_per_share': self._cost_per_share[position],
+                }
+
+    def add(self, quantity, cost_per_share):
+        lot_id = self._first_id + len(self._quantity)
+        self._quantity.append(quantity)
+        self._cost_per_share.append(cost_per_share)
+        self._open += 1
+        if self.method == LIFO:
+            self._stack.append(lot_id)
+        elif self.method == HIFO:
+            heapq.heappush(self._heap, (-cost_per_share, lot_id))
+        return lot_id
+
+    def _drain(self, position, remaining_quantity):
+        """Takes up to remaining_quantity from one lot; returns (quantity taken, cost)."""
+        available = self._quantity[position]
+        taken = available if available < remaining_quantity else remaining_quantity
+        self._quantity[position] = available - taken
+        if available > 0 and self._quantity[position] == 0:
+            self._open -= 1
+        return taken, taken * self._cost_per_share[position]
+
+    def _next_position(self):
+        """Position of the next lot to drain, or None when no lot is open."""
+        if self.method == FIFO:
+            while self._head < len(self._quantity) and self._quantity[self._head] == 0:
+                self._head += 1
+            return self._head if self._head < len(self._quantity) else None
+        # Lots drained through relieve(lot_ids) are skipped when they reach the top
+        if self.method == LIFO:
+            while self._stack and self._quantity[self._stack[-1] - self._first_id] == 0:
+                self._stack.pop()
+            return self._stack[-1] - self._first_id if self._stack else None
+        while self._heap and self._quantity[self._heap[0][1] - self._first_id] == 0:
+            heapq.heappop(self._heap)
+        return self._heap[0][1] - self._first_id if self._heap else None
+
+    def relieve(self, quantity, lot_ids=()):
+        """
+        Removes quantity shares, first from the given lot ids in order and then by
+        the book's method. The caller must check there are enough open shares.
+
+        Returns:
+            float: Cost of the shares removed.
+        """
+        sold_cost = 0
+        remaining_quantity = quantity
+        for lot_id in lot_ids:
+            position = lot_id - self._first_id
+            if remaining_quantity == 0:
+                break
+            if 0 <= position < len(self._quantity):
+                taken, cost = self._drain(position, remaining_quantity)
+                sold_cost += cost
+                remaining_quantity -= taken
+
+        while remaining_quantity > 0:
+            position = self._next_position()
+            if position is None:
+                break
+            taken, cost = self._drain(position, remaining_quantity)
+            sold_cost += cost
+            remaining_quantity -= taken
+
+        if self.method == FIFO and self._head >= _COMPACT_AFTER and self._head * 2 >= len(self._quantity):
+            del self._quantity[:self._head]
+            del self._cost_per_share[:self._head]
+            self._first_id += self._head
+            self._head = 0
+        return sold_cost
@@ -1,81 +1,78 @@
-import pandas as pd
 from datetime import datetime, timedelta
 import numpy as np
-from scipy import stats
 import os
 
-from data_handler import load_transactions, fetch_price_data
-from portfolio_processor import process_daily_transactions, calculate_daily_metrics, calculate_twr
-from report_generator import generate_csv_reports
-from chart_generator import generate_charts
-
-def calculate_portfolio_performance(transactions_file, start_date, end_date):
+from data_handler import load_transactions, fetch_price_data, ledger_fingerprint, price_data_version
+from portfolio_processor import run_daily_loop
+from valuation_engine import CHUNK_DAYS, build_portfolio_value, evaluate_incremental
+from checkpoint_store import CheckpointStore
+from metrics_calculator import calculate_advanced_metrics, calculate_rolling_metrics, MetricsMemo, ROLLING_WINDOWS
+from report_generator import generate_csv_reports, generate_column_reports
+from chart_generator import render_charts
+from benchmark_analytics import DEFAULT_BENCHMARKS, benchmark_tickers, calculate_benchmark_comparison
+from risk_engine import DEFAULT_PATHS, calculate_risk
+from lot_book import FIFO
+from metrics_registry import profile_run, timed_stage
+
+CHECKPOINTS_FILENAME = 'checkpoints.pkl'
+PROFILE_FILENAME = 'profile.json'
+SPY_TICKER = 'SPY'
+
+# Advanced metrics of earlier runs, keyed by input_fingerprint()
+advanced_metrics_memo = MetricsMemo()
+
+def input_fingerprint(transactions_file, start_date, end_date):
+    """Identifies the inputs of a run: ledger contents, cached price data version and date range."""
+    return (ledger_fingerprint(transactions_file), price_data_version(), start_date, end_date)
+
+def load_inputs(transactions_file, start_date, end_date, benchmarks=DEFAULT_BENCHMARKS):
+    with timed_stage('load') as stage:
+        transactions = load_transactions(transactions_file)
+        stage.rows = len(transactions)
+
+    tickers = transactions.tickers.tolist()
+    for ticker in [SPY_TICKER] + benchmark_tickers(benchmarks):
+        if ticker not in tickers:
+            tickers.append(ticker)
+
+    with timed_stage('price_fetch') as stage:
+        price_data = fetch_price_data(tickers, start_date, end_date)
+        stage.rows = price_data.size
+    return transactions, price_data
+
+def evaluate_portfolio(transactions, price_data, engine='vectorized', incremental=True, output_dir='output', lot_method=FIFO, attribution=False):
     """
-    Calculates daily portfolio performance and generates reports and charts.
-
-    Args:
-        transactions_file (str): Path to the CSV file with transaction data.
-        start_date (str): The start date for the analysis in 'YYYY-MM-DD' format.
-        end_date (str): The end date for the analysis in 'YYYY-MM-DD' format.
+    Evaluates the portfolio with the given engine. With attribution=True the
+    per-ticker position_attribution.Attribution is returned as a fourth item
+    (None from the 'loop' engine, which has no per-ticker matrices).
+
+    The 'chunked' engine is the low-memory mode of the vectorized one: it
+    evaluates CHUNK_DAYS trading days at a time and stores the ratio columns and
+    the attribution as float32. It always replays the whole history, as the
+    checkpoints of an incremental run hold full-precision results.
     """
-    transactions = load_transactions(transactions_file)
-
-    tickers = transactions['Ticker'].unique().tolist()
-    spy_ticker = 'SPY'
-    if spy_ticker not in tickers:
-        tickers.append(spy_ticker)
-
-    price_data = fetch_price_data(tickers, start_date, end_date)
-
-    # Ensure output directory exists
-    os.makedirs('output', exist_ok=True)
-
-    portfolio_value = pd.DataFrame(index=price_data[spy_ticker].index)
-    open_positions = {}
-    closed_positions = []
-
-    portfolio_value['Current Value'] = 0.0
-    portfolio_value['Cost'] = 0.0
-    portfolio_value['Current P&L'] = 0.0
-    portfolio_value['Closed P&L'] = 0.0
-    portfolio_value['Overall P&L'] = 0.0
-    portfolio_value['P&L Positive'] = 0.0
-    portfolio_value['P&L Negative'] = 0.0
-    portfolio_value['Daily P&L Change'] = 0.0
-    portfolio_value['TWR'] = 1.0
-    portfolio_value['SPY_TWR'] = 1.0
-    portfolio_value['Net Invested Capital'] = 0.0
-    portfolio_value['Cumulative Cash Flow Adjusted Return'] = 0.0
-    portfolio_value['Drawdown'] = 0.0
-    portfolio_value['Portfolio Daily Return'] = 0.0
-    portfolio_value['SPY Daily Return'] = 0.0
-
-    total_cash_in_cumulative = 0.0
-    total_cash_out_cumulative = 0.0
-    running_peak = 0.0
-
-    for i, date in enumerate(portfolio_value.index):
-        if i > 0:
-            prev_trading_day = portfolio_value.index[i-1]
-            portfolio_value.loc[date, 'Closed P&L'] = portfolio_value.loc[prev_trading_day, 'Closed P&L']
-            total_cash_in_cumulative = portfolio_value.loc[prev_trading_day, 'total_cash_in_cumulative']
-            total_cash_out_cumulative = portfolio_value.loc[prev_trading_day, 'total_cash_out_cumulative']
-            running_peak = portfolio_value.loc[prev_trading_day, 'running_peak'] # Carry forward running_peak
-        else:
-            total_cash_in_cumulative = 0.0
-            total_cash_out_cumulative = 0.0
-            running_peak = 0.0 # Initialize for the first day
-
-        day_transactions = transactions[transactions['Date'] == date]
-
-        open_positions, portfolio_value, closed_positions, total_cash_in_cumulative, total_cash_out_cumulative = \
-            process_daily_transactions(date, day_transactions, open_positions, portfolio_value, closed_positions, total_cash_in_cumulative, total_cash_out_cumulative)
-
-        portfolio_value, running_peak = calculate_daily_metrics(date, open_positions, price_data, portfolio_value, total_cash_in_cumulative, total_cash_out_cumulative, i, running_peak)
-        portfolio_value.loc[date, 'running_peak'] = running_peak # Store running_peak for next iteration
-
-        portfolio_value = calculate_twr(i, date, portfolio_value, transactions, price_data, spy_ticker)
-
+    with timed_stage('daily_loop') as stage:
+        stage.rows = len(transactions)
+        return _evaluate_portfolio(transactions, price_data, engine, incremental, output_dir, lot_method, attribution)
+
+def _evaluate_portfolio(transactions, price_data, engine, incremental, output_dir, lot_method, attribution):
+    if engine == 'loop':
+        results = run_daily_loop(transactions, price_data, SPY_TICKER, lot_method)
+        return results + (None,) if attribution else results
+    if engine == 'chunked':
+        return build_portfolio_value(transactions, price_data, SPY_TICKER, lot_method, attribution, chunk_days=CHUNK_DAYS,
+                                     derived_dtype=np.float32)
+    if incremental:
+        # Ensure output directory exists
+        os.makedirs(output_dir, exist_ok=True)
+        checkpoints_file = os.path.join(output_dir, CHECKPOINTS_FILENAME)
+        checkpoints = CheckpointStore.load(checkpoints_file)
+        results = evaluate_incremental(transactions, price_data, SPY_TICKER, checkpoints, lot_method, attribution)
+        checkpoints.save(checkpoints_file)
+        return results
+    return build_portfolio_value(transactions, price_data, SPY_TICKER, lot_method, attribution)
+
+def build_open_positions_data(open_positions, portfolio_value, price_data):
     open_positions_data = []
     total_market_value = portfolio_value['Current Value'].iloc[-1] if not portfolio_value.empty else 0
     for ticker, data in open_positions.items():
@@ -93,63 +90,122 @@ def calculate_portfolio_performance(transactions_file, start_date, end_date):
                 'Value': round(value, 2),
                 'P&L': pnl
             })
+    return open_positions_data
+
+def report_portfolio(transactions, price_data, output_dir='output', engine='vectorized', incremental=True, charts=False, lot_method=FIFO, chart_workers=None, rolling_windows=ROLLING_WINDOWS, benchmarks=DEFAULT_BENCHMARKS, risk_paths=DEFAULT_PATHS):
+    """
+    Evaluates one portfolio and writes its reports (CSV and column store) to
+    output_dir. With charts=True the PNG charts are rendered from the new
+    column store afterwards, see chart_generator.render_charts.
+
+    The rolling metrics over each of rolling_windows (trading days), the
+    comparison with `benchmarks` (see benchmark_analytics) and the Monte Carlo
+    VaR/CVaR of the open positions over risk_paths paths (see risk_engine) go
+    to the column store only, for the web app, as does the per-ticker
+    attribution of the evaluation.
+
+    Returns:
+        dict: The advanced metrics.
+    """
+    # Ensure output directory exists
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Closes of tickers only a benchmark uses stay out of the valuation
+    held = set(transactions.tickers.tolist()) | {SPY_TICKER}
+    portfolio_prices = price_data[[ticker for ticker in price_data.columns if ticker in held]]
+    portfolio_value, open_positions, closed_positions, attribution = evaluate_portfolio(
+        transactions, portfolio_prices, engine, incremental, output_dir, lot_method, attribution=True)
+
+    with timed_stage('metrics') as stage:
+        open_positions_data = build_open_positions_data(open_positions, portfolio_value, portfolio_prices)
+        advanced_metrics = calculate_advanced_metrics(portfolio_value)
+        stage.rows = len(portfolio_value)
+    # From the unrounded daily results; the reports keep only 2 decimals
+    with timed_stage('rolling_metrics') as stage:
+        rolling_metrics = calculate_rolling_metrics(portfolio_value, rolling_windows)
+        stage.rows = len(portfolio_value) * len(rolling_windows)
+    with timed_stage('benchmarks') as stage:
+        benchmark_comparison = calculate_benchmark_comparison(portfolio_value, price_data, benchmarks)
+        stage.rows = benchmark_comparison.size
+    with timed_stage('risk') as stage:
+        risk = calculate_risk(open_positions_data, portfolio_prices, paths=risk_paths)
+        stage.rows = risk_paths * len(open_positions_data)
+
+    report_rows = len(portfolio_value) + len(open_positions_data) + len(closed_positions)
+    with timed_stage('csv_write') as stage:
+        generate_csv_reports(portfolio_value, open_positions_data, closed_positions, output_dir)
+        stage.rows = report_rows
+    with timed_stage('column_write') as stage:
+        generate_column_reports(portfolio_value, open_positions_data, closed_positions, output_dir, rolling_metrics, benchmark_comparison, risk,
+                                attribution)
+        stage.rows = report_rows
+    if charts:
+        with timed_stage('charts') as stage:
+            stage.rows = len(render_charts(output_dir, chart_workers))
+    return advanced_metrics
+
+def run_portfolio_pipeline(transactions_file, start_date, end_date, engine='vectorized', incremental=True, output_dir='output', lot_method=FIFO, charts=False, profile=False, benchmarks=DEFAULT_BENCHMARKS):
+    """
+    Calculates daily portfolio performance and generates reports, and charts if asked.
 
-    # --- Calculate Advanced Metrics ---
-    # Risk-free rate (annualized, then converted to daily)
-    RISK_FREE_RATE_ANNUAL = 0.02 # Example: 2% annual risk-free rate
-    TRADING_DAYS_IN_YEAR = 252
-    risk_free_rate_daily = RISK_FREE_RATE_ANNUAL / TRADING_DAYS_IN_YEAR
-
-    # Portfolio Daily Returns (excluding the first day which has no return)
-    portfolio_returns = portfolio_value['Portfolio Daily Return'][1:]
-    spy_returns = portfolio_value['SPY Daily Return'][1:]
-
-    # Sharpe Ratio
-    avg_portfolio_return = portfolio_returns.mean()
-    std_portfolio_return = portfolio_returns.std()
-    sharpe_ratio = (avg_portfolio_return - risk_free_rate_daily) / std_portfolio_return if std_portfolio_return != 0 else 0.0
-    sharpe_ratio_annualized = sharpe_ratio * np.sqrt(TRADING_DAYS_IN_YEAR)
-
-    # Sortino Ratio
-    downside_returns = portfolio_returns[portfolio_returns < risk_free_rate_daily]
-    downside_deviation = downside_returns.std() if not downside_returns.empty else 0.0
-    sortino_ratio = (avg_portfolio_return - risk_free_rate_daily) / downside_deviation if downside_deviation != 0 else 0.0
-    sortino_ratio_annualized = sortino_ratio * np.sqrt(TRADING_DAYS_IN_YEAR)
-
-    # Alpha and Beta (using linear regression)
-    # Ensure both series have data and align their indices
-    common_index = portfolio_returns.index.intersection(spy_returns.index)
-    if len(common_index) > 1:
-        slope, intercept, r_value, p_value, std_err = stats.linregress(
-            spy_returns.loc[common_index],
-            portfolio_returns.loc[common_index]
-        )
-        beta = slope
-        alpha_daily = intercept
-        alpha_annualized = alpha_daily * TRADING_DAYS_IN_YEAR
-    else:
-        beta = 0.0
-        alpha_daily = 0.0
-        alpha_annualized = 0.0
-
-    # Store advanced metrics in a dictionary to pass around
-    advanced_metrics = {
-        "sharpe_ratio": round(sharpe_ratio_annualized, 2),
-        "sortino_ratio": round(sortino_ratio_annualized, 2),
-        "beta": round(beta, 2),
-        "alpha": round(alpha_annualized, 2)
-    }
-
-    generate_csv_reports(portfolio_value, open_positions_data, closed_positions)
-    generate_charts(portfolio_value, open_positions_data)
-    print("\n--- Portfolio Value DataFrame Columns before CSV generation ---")
-    print(portfolio_value.columns)
-
-    return advanced_metrics # Return advanced metrics
+    Returns the advanced metrics together with the input_fingerprint() they were
+    computed from, so callers in another process can seed their memo, and the
+    run's stage timings and cache counters (see metrics_registry.RunProfile).
+
+    Args:
+        transactions_file (str): Path to the CSV file with transaction data.
+        start_date (str): The start date for the analysis in 'YYYY-MM-DD' format.
+        end_date (str): The end date for the analysis in 'YYYY-MM-DD' format.
+        engine (str): 'vectorized' (default) evaluates the whole history with array
+            operations; 'chunked' does the same a year at a time with float32
+            ratio columns, for ledgers too large for memory; 'loop' runs the
+            original day-by-day evaluation.
+        incremental (bool): With the vectorized engine, resume from the checkpoints
+            saved by the previous run instead of replaying the whole history.
+        output_dir (str): Directory for the reports, charts and checkpoints.
+        lot_method (str): Which lots a sell relieves: 'fifo' (default), 'lifo' or
+            'hifo'. A sell row with a Lot number relieves that purchase first.
+        charts (bool): Also render the PNG charts. Off by default so callers that
+            draw their own charts (the web app) never load matplotlib.
+        profile (bool): Also write the run's stage timings to output_dir/profile.json.
+        benchmarks (list): Benchmarks to compare the TWR with: tickers, or blends
+            such as '60/40=SPY:0.6,AGG:0.4'. See benchmark_analytics.parse_benchmark.
+    """
+    with profile_run() as run_profile:
+        ledger_key = ledger_fingerprint(transactions_file)
+        transactions, price_data = load_inputs(transactions_file, start_date, end_date, benchmarks)
+        fingerprint = (ledger_key, price_data_version(), start_date, end_date)
+
+        advanced_metrics = report_portfolio(transactions, price_data, output_dir, engine, incremental, charts, lot_method,
+                                            benchmarks=benchmarks)
+        advanced_metrics_memo.put(fingerprint, advanced_metrics)
+
+    if profile:
+        run_profile.save(os.path.join(output_dir, PROFILE_FILENAME))
+    return {'advanced_metrics': advanced_metrics, 'fingerprint': fingerprint, 'profile': run_profile.to_dict()}
+
+def calculate_portfolio_performance(transactions_file, start_date, end_date, engine='vectorized', incremental=True, output_dir='output', lot_method=FIFO, charts=False, profile=False, benchmarks=DEFAULT_BENCHMARKS):
+    """
+    Calculates daily portfolio performance and generates reports, and charts if asked.
+
+    Args:
+        transactions_file (str): Path to the CSV file with transaction data.
+        start_date (str): The start date for the analysis in 'YYYY-MM-DD' format.
+        end_date (str): The end date for the analysis in 'YYYY-MM-DD' format.
+        engine (str): 'vectorized' (default), 'chunked' or 'loop', see run_portfolio_pipeline.
+        incremental (bool): Resume from the previous run's checkpoints.
+        output_dir (str): Directory for the reports, charts and checkpoints.
+        lot_method (str): 'fifo' (default), 'lifo' or 'hifo', see run_portfolio_pipeline.
+        charts (bool): Also render the PNG charts.
+        profile (bool): Also write the run's stage timings to output_dir/profile.json.
+        benchmarks (list): Benchmarks to compare the TWR with, see run_portfolio_pipeline.
+    """
+    results = run_portfolio_pipeline(transactions_file, start_date, end_date, engine, incremental, output_dir, lot_method, charts, profile, benchmarks)
+    return results['advanced_metrics'] # Return advanced metrics
 
 if __name__ == '__main__':
     transactions_file = 'transactions.csv'
     start_date = '2025-03-26'
     end_date = (datetime.today() + timedelta(days=1)).strftime('%Y-%m-%d')
-    calculate_portfolio_performance(transactions_file, start_date, end_date)
+    calculate_portfolio_performance(transactions_file, start_date, end_date, charts=True)
     print("Portfolio analysis complete. Reports and charts are in the 'output/' directory.")
\ No newline at end of file
@@ -0,0 +1,186 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from metrics_registry import registry
+
+# Risk-free rate (annualized, then converted to daily)
+RISK_FREE_RATE_ANNUAL = 0.02 # Example: 2% annual risk-free rate
+TRADING_DAYS_IN_YEAR = 252
+
+def _least_squares_line(x, y):
+    """
+    Slope and intercept of the ordinary least squares fit of y on x, in closed
+    form (what scipy.stats.linregress returns, without importing SciPy). A flat
+    x has no defined slope; both are 0 then.
+    """
+    x_mean, y_mean = x.mean(), y.mean()
+    x_deviation = x - x_mean
+    s_xx = x_deviation @ x_deviation
+    if s_xx == 0:
+        return 0.0, 0.0
+    slope = (x_deviation @ (y - y_mean)) / s_xx
+    return slope, y_mean - slope * x_mean
+
+def calculate_advanced_metrics(portfolio_value):
+    """Returns the annualized Sharpe and Sortino ratios, beta and alpha against SPY."""
+    risk_free_rate_daily = RISK_FREE_RATE_ANNUAL / TRADING_DAYS_IN_YEAR
+
+    # Portfolio Daily Returns (excluding the first day which has no return)
+    portfolio_returns = portfolio_value['Portfolio Daily Return'][1:]
+    spy_returns = portfolio_value['SPY Daily Return'][1:]
+
+    # Sharpe Ratio
+    avg_portfolio_return = portfolio_returns.mean()
+    std_portfolio_return = portfolio_returns.std()
+    sharpe_ratio = (avg_portfolio_return - risk_free_rate_daily) / std_portfolio_return if std_portfolio_return != 0 else 0.0
+    sharpe_ratio_annualized = sharpe_ratio * np.sqrt(TRADING_DAYS_IN_YEAR)
+
+    # Sortino Ratio
+    downside_returns = portfolio_returns[portfolio_returns < risk_free_rate_daily]
+    downside_deviation = downside_returns.std() if not downside_returns.empty else 0.0
+    sortino_ratio = (avg_portfolio_return - risk_free_rate_daily) / downside_deviation if downside_deviation != 0 else 0.0
+    sortino_ratio_annualized = sortino_ratio * np.sqrt(TRADING_DAYS_IN_YEAR)
+
+    # Alpha and Beta (using linear regression)
+    # Ensure both series have data and align their indices
+    common_index = portfolio_returns.index.intersection(spy_returns.index)
+    if len(common_index) > 1:
+        beta, alpha_daily = _least_squares_line(
+            spy_returns.loc[common_index].to_numpy(dtype=np.float64),
+            portfolio_returns.loc[common_index].to_numpy(dtype=np.float64)
+        )
+        alpha_annualized = alpha_daily * TRADING_DAYS_IN_YEAR
+    else:
+        beta = 0.0
+        alpha_daily = 0.0
+        alpha_annualized = 0.0
+
+    # Store advanced metrics in a dictionary to pass around
+    return {
+        "sharpe_ratio": round(sharpe_ratio_annualized, 2),
+        "sortino_ratio": round(sortino_ratio_annualized, 2),
+        "beta": round(beta, 2),
+        "alpha": round(alpha_annualized, 2)
+    }
+
+# Trading days per window of the rolling metrics: about a month, a quarter and a year
+ROLLING_WINDOWS = (21, 63, 252)
+ROLLING_METRICS = ['volatility', 'sharpe_ratio', 'sortino_ratio', 'beta', 'alpha', 'correlation', 'max_drawdown']
+
+# Rows of windows materialized at a time by the drawdown kernel
+_DRAWDOWN_CHUNK_ELEMENTS = 1 << 22
+
+def _window_sums(values, window):
+    """Sum of every trailing window of `values`, from one cumulative sum (entry k covers values[k:k + window])."""
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    return sums[window:] - sums[:-window]
+
+def _rolling_max_drawdown(wealth, window):
+    """
+    Largest peak-to-trough fall of `wealth` inside every trailing window, as a
+    fraction. Windows are strided views, processed in chunks to bound memory.
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(wealth, window)
+    drawdowns = np.empty(len(windows))
+    chunk = max(1, _DRAWDOWN_CHUNK_ELEMENTS // window)
+    for start in range(0, len(windows), chunk):
+        block = windows[start:start + chunk]
+        peaks = np.maximum.accumulate(block, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            falls = np.where(peaks > 0, 1 - block / peaks, 0.0)
+        drawdowns[start:start + chunk] = falls.max(axis=1)
+    return drawdowns
+
+def calculate_rolling_metrics(portfolio_value, windows=ROLLING_WINDOWS):
+    """
+    Rolling versions of the advanced metrics over trailing windows of daily returns.
+
+    Definitions match calculate_advanced_metrics (annualized Sharpe and Sortino,
+    beta and annualized alpha of the regression on SPY), plus annualized
+    volatility, correlation with SPY and the maximum drawdown of the TWR index.
+    Every statistic comes from cumulative sums, so each window costs O(1); only
+    the drawdown uses strided windows.
+
+    Args:
+        portfolio_value (pd.DataFrame): Daily results of the valuation engine.
+        windows (tuple): Window lengths in trading days.
+
+    Returns:
+        dict: Window -> pd.DataFrame of ROLLING_METRICS indexed by the window's
+            last date. Dates before the first full window are NaN.
+    """
+    risk_free_rate_daily = RISK_FREE_RATE_ANNUAL / TRADING_DAYS_IN_YEAR
+    dates = portfolio_value.index[1:]
+    portfolio_returns = portfolio_value['Portfolio Daily Return'].to_numpy(dtype=np.float64)[1:]
+    spy_returns = portfolio_value['SPY Daily Return'].to_numpy(dtype=np.float64)[1:]
+    twr = portfolio_value['TWR'].to_numpy(dtype=np.float64)[1:]
+    n = len(portfolio_returns)
+
+    # Variances come from sums of squares; centring first keeps them from cancelling
+    p = portfolio_returns - (portfolio_returns.mean() if n else 0.0)
+    m = spy_returns - (spy_returns.mean() if n else 0.0)
+    downside = portfolio_returns < risk_free_rate_daily
+    d = np.where(downside, p, 0.0)
+
+    results = {}
+    for window in windows:
+        frame = pd.DataFrame(np.nan, index=dates, columns=ROLLING_METRICS)
+        if window < 2 or window > n:
+            results[window] = frame
+            continue
+
+        sum_p, sum_m = _window_sums(p, window), _window_sums(m, window)
+        s_pp = _window_sums(p * p, window) - sum_p * sum_p / window
+        s_mm = _window_sums(m * m, window) - sum_m * sum_m / window
+        s_pm = _window_sums(p * m, window) - sum_p * sum_m / window
+        s_pp, s_mm = np.maximum(s_pp, 0.0), np.maximum(s_mm, 0.0)
+
+        mean_p = _window_sums(portfolio_returns, window) / window
+        mean_m = _window_sums(spy_returns, window) / window
+        std_p = np.sqrt(s_pp / (window - 1))
+
+        # Sortino uses the sample deviation of the returns below the risk-free rate
+        k = _window_sums(downside.astype(np.float64), window)
+        sum_d = _window_sums(d, window)
+        s_dd = np.maximum(_window_sums(d * d, window) - np.divide(sum_d * sum_d, k, out=np.zeros_like(k), where=k > 0), 0.0)
+        downside_deviation = np.sqrt(np.divide(s_dd, k - 1, out=np.zeros_like(k), where=k > 1))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            excess = mean_p - risk_free_rate_daily
+            sharpe = np.where(std_p != 0, excess / std_p, 0.0) * np.sqrt(TRADING_DAYS_IN_YEAR)
+            sortino = np.where(downside_deviation != 0, excess / downside_deviation, 0.0) * np.sqrt(TRADING_DAYS_IN_YEAR)
+            beta = np.where(s_mm > 0, s_pm / s_mm, 0.0)
+            correlation = np.where((s_mm > 0) & (s_pp > 0), s_pm / np.sqrt(s_mm * s_pp), np.nan)
+        alpha = np.where(s_mm > 0, mean_p - beta * mean_m, 0.0) * TRADING_DAYS_IN_YEAR
+
+        values = np.column_stack([
+            std_p * np.sqrt(TRADING_DAYS_IN_YEAR), sharpe, sortino, beta, alpha, correlation,
+            _rolling_max_drawdown(twr, window),
+        ])
+        frame.iloc[window - 1:] = values
+        results[window] = frame
+    return results
+
+class MetricsMemo:
+    """Advanced metrics keyed by a fingerprint of the inputs they were computed from."""
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, fingerprint):
+        metrics = self._entries.get(fingerprint)
+        if metrics is not None:
+            self._entries.move_to_end(fingerprint)
+            registry.count_cache('advanced_metrics', hits=1)
+        else:
+            registry.count_cache('advanced_metrics', misses=1)
+        return metrics
+
+    def put(self, fingerprint, metrics):
+        self._entries[fingerprint] = metrics
+        self._entries.move_to_end(fingerprint)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,199 @@
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+STAGE_SECONDS = 'portfolio_stage_duration_seconds'
+STAGE_ROWS = 'portfolio_stage_rows_total'
+CACHE_REQUESTS = 'portfolio_cache_requests_total'
+HTTP_SECONDS = 'http_request_duration_seconds'
+LEDGER_COMMITS = 'ledger_group_commits_total'
+LEDGER_BATCHES = 'ledger_committed_batches_total'
+LIVE_FEED_ERRORS = 'live_feed_stream_errors_total'
+
+_HELP = {
+    STAGE_SECONDS: 'Time spent in each stage of the portfolio pipeline.',
+    STAGE_ROWS: 'Rows processed by each stage of the portfolio pipeline.',
+    CACHE_REQUESTS: 'Cache lookups by cache and result (hit, partial or miss).',
+    HTTP_SECONDS: 'Latency of the web app handlers.',
+    LEDGER_COMMITS: 'Group commits of the ledger by the web app.',
+    LEDGER_BATCHES: 'Transaction requests committed to the ledger by the web app.',
+    LIVE_FEED_ERRORS: 'Failures of the live quote stream, each followed by a new subscription.',
+}
+
+# Profile of the pipeline run in progress in this context, if any
+_active_profile = contextvars.ContextVar('active_profile', default=None)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+def _format_bound(bound):
+    return '+Inf' if bound == math.inf else repr(bound)
+
+class MetricsRegistry:
+    """
+    In-process counters and latency histograms, rendered in the Prometheus text
+    exposition format. Safe to update from several threads.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def _add(self, name, amount, labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def inc(self, name, amount=1, **labels):
+        if amount == 0:
+            return
+        self._add(name, amount, labels)
+        profile = _active_profile.get()
+        if profile is not None:
+            profile.counters.append({'name': name, 'labels': labels, 'value': amount})
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for position, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram['buckets'][position] += 1
+                    break
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    def count_cache(self, cache, hits=0, misses=0, partial=0):
+        self.inc(CACHE_REQUESTS, hits, cache=cache, result='hit')
+        self.inc(CACHE_REQUESTS, partial, cache=cache, result='partial')
+        self.inc(CACHE_REQUESTS, misses, cache=cache, result='miss')
+
+    def record_profile(self, profile):
+        """Adds the stages and counters of a run profile recorded in another process."""
+        for stage in profile['stages']:
+            self.observe(STAGE_SECONDS, stage['seconds'], stage=stage['stage'])
+            if stage['rows'] is not None:
+                self._add(STAGE_ROWS, stage['rows'], {'stage': stage['stage']})
+        for counter in profile['counters']:
+            self._add(counter['name'], counter['value'], counter['labels'])
+
+    def _cache_hit_ratios(self):
+        totals = {}
+        for key, value in self._counters.get(CACHE_REQUESTS, {}).items():
+            labels = dict(key)
+            hits, lookups = totals.get(labels['cache'], (0, 0))
+            totals[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), lookups + value)
+        return {cache: hits / lookups for cache, (hits, lookups) in totals.items() if lookups}
+
+    def render(self):
+        """Returns every metric in the Prometheus text format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f'# HELP {name} {_HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} counter')
+                for key, value in sorted(series.items()):
+                    lines.append(f'{name}{_format_labels(key)} {value}')
+
+            ratios = self._cache_hit_ratios()
+            if ratios:
+                lines.append('# HELP portfolio_cache_hit_ratio Share of cache lookups that were hits.')
+                lines.append('# TYPE portfolio_cache_hit_ratio gauge')
+                for cache, ratio in sorted(ratios.items()):
+                    lines.append(f'portfolio_cache_hit_ratio{_format_labels([("cache", cache)])} {ratio:.6f}')
+
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f'# HELP {name} {_HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} histogram')
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, histogram['buckets']):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_format_labels(key, [("le", _format_bound(bound))])} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {histogram["sum"]}')
+                    lines.append(f'{name}_count{_format_labels(key)} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+class RunProfile:
+    """Stage timings and counter updates of one pipeline run."""
+
+    def __init__(self):
+        self.started = datetime.now()
+        self.stages = []
+        self.counters = []
+        self._clock = time.perf_counter()
+        self.total_seconds = None
+
+    def to_dict(self):
+        return {
+            'started': self.started.isoformat(timespec='seconds'),
+            'total_seconds': self.total_seconds,
+            'stages': self.stages,
+            'counters': self.counters,
+        }
+
+    def save(self, path):
+        # Written aside and renamed so readers never see a partial report
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+        os.replace(f'{path}.tmp', path)
+
+@contextmanager
+def profile_run():
+    """Collects the stages timed and counters updated inside the block into a RunProfile."""
+    profile = RunProfile()
+    token = _active_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        profile.total_seconds = time.perf_counter() - profile._clock
+        _active_profile.reset(token)
+
+class _StageRows:
+    def __init__(self):
+        self.rows = None
+
+@contextmanager
+def timed_stage(stage):
+    """
+    Times a pipeline stage into the stage histogram. Set `.rows` on the yielded
+    object to also count the rows the stage processed.
+    """
+    counter = _StageRows()
+    started = time.perf_counter()
+    try:
+        yield counter
+    finally:
+        seconds = time.perf_counter() - started
+        registry.observe(STAGE_SECONDS, seconds, stage=stage)
+        if counter.rows is not None:
+            counter.rows = int(counter.rows)
+            registry._add(STAGE_ROWS, counter.rows, {'stage': stage})
+        profile = _active_profile.get()
+        if profile is not None:
+            profile.stages.append({'stage': stage, 'seconds': seconds, 'rows': counter.rows})
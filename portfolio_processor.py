@@ -1,54 +1,57 @@
 import pandas as pd
 
-def process_daily_transactions(date, day_transactions, open_positions, portfolio_value, closed_positions, total_cash_in_cumulative, total_cash_out_cumulative):
-    for _, row in day_transactions.iterrows():
-        ticker, trans_type, quantity, price, commission = row['Ticker'], row['Type'], row['Quantity'], row['Price'], row['Commission']
-
-        if trans_type == 'Buy':
-            if ticker not in open_positions:
-                open_positions[ticker] = {'quantity': 0, 'cost_basis': 0, 'lots': []}
-            
-            open_positions[ticker]['lots'].append({'quantity': quantity, 'cost_per_share': (quantity * price + commission) / quantity})
-            open_positions[ticker]['quantity'] += quantity
-            open_positions[ticker]['cost_basis'] += round(quantity * price + commission, 2)
-            total_cash_in_cumulative += round(quantity * price + commission, 2)
-
-        elif trans_type == 'Sell':
-            if ticker in open_positions and open_positions[ticker]['quantity'] >= quantity:
-                realised_pnl = 0
-                sold_cost = 0
-                
-                remaining_quantity = quantity
-                for lot in open_positions[ticker]['lots']:
-                    if remaining_quantity == 0:
-                        break
-                    
-                    if lot['quantity'] >= remaining_quantity:
-                        sold_cost += remaining_quantity * lot['cost_per_share']
-                        lot['quantity'] -= remaining_quantity
-                        remaining_quantity = 0
-                    else:
-                        sold_cost += lot['quantity'] * lot['cost_per_share']
-                        remaining_quantity -= lot['quantity']
-                        lot['quantity'] = 0
-                
-                open_positions[ticker]['lots'] = [lot for lot in open_positions[ticker]['lots'] if lot['quantity'] > 0]
-
-                realised_pnl = (quantity * price) - sold_cost - commission
-                portfolio_value.loc[date, 'Closed P&L'] += realised_pnl
-                
-                open_positions[ticker]['quantity'] -= quantity
-                open_positions[ticker]['cost_basis'] -= sold_cost
-                total_cash_out_cumulative += round(quantity * price - commission, 2)
-                
-                closed_positions.append({
-                    'Symbol': ticker,
-                    'Quantity': quantity,
-                    'Cost': round(sold_cost, 2),
-                    'Sell Price': round(price, 2),
-                    'Sell Date': date,
-                    'P&L': round(realised_pnl, 2)
-                })
+from data_handler import BUY, SELL
+from lot_book import FIFO, LotBook
+
+def apply_transaction(date, ticker, side, quantity, price, commission, open_positions, closed_positions, lot_method=FIFO, lot_ids=()):
+    """
+    Applies a single transaction to the open lots and closed positions.
+
+    Sells relieve the lots in `lot_ids` first, then follow `lot_method`
+    ('fifo', 'lifo' or 'hifo').
+
+    Returns:
+        tuple: (cost_change, realised_pnl, cash_in, cash_out) for the transaction.
+    """
+    if side == BUY:
+        if ticker not in open_positions:
+            open_positions[ticker] = {'quantity': 0, 'cost_basis': 0, 'lots': LotBook(lot_method)}
+
+        cost = round(quantity * price + commission, 2)
+        open_positions[ticker]['lots'].add(quantity, (quantity * price + commission) / quantity)
+        open_positions[ticker]['quantity'] += quantity
+        open_positions[ticker]['cost_basis'] += cost
+        return cost, 0.0, cost, 0.0
+
+    elif side == SELL:
+        if ticker in open_positions and open_positions[ticker]['quantity'] >= quantity:
+            sold_cost = open_positions[ticker]['lots'].relieve(quantity, lot_ids)
+            realised_pnl = (quantity * price) - sold_cost - commission
+
+            open_positions[ticker]['quantity'] -= quantity
+            open_positions[ticker]['cost_basis'] -= sold_cost
+            cash_out = round(quantity * price - commission, 2)
+
+            closed_positions.append({
+                'Symbol': ticker,
+                'Quantity': quantity,
+                'Cost': round(sold_cost, 2),
+                'Sell Price': round(price, 2),
+                'Sell Date': date,
+                'P&L': round(realised_pnl, 2)
+            })
+            return -sold_cost, realised_pnl, 0.0, cash_out
+    return 0.0, 0.0, 0.0, 0.0
+
+def process_daily_transactions(date, ledger, day_rows, open_positions, portfolio_value, closed_positions, total_cash_in_cumulative, total_cash_out_cumulative, lot_method=FIFO):
+    for k in range(day_rows.start, day_rows.stop):
+        ticker, side = ledger.tickers[ledger.ticker_codes[k]], ledger.side[k]
+
+        _, realised_pnl, cash_in, cash_out = apply_transaction(date, ticker, side, ledger.quantity[k], ledger.price[k], ledger.commission[k], open_positions, closed_positions, lot_method, ledger.lot_ids(k))
+        if side == SELL:
+            portfolio_value.loc[date, 'Closed P&L'] += realised_pnl
+        total_cash_in_cumulative += cash_in
+        total_cash_out_cumulative += cash_out
     return open_positions, portfolio_value, closed_positions, total_cash_in_cumulative, total_cash_out_cumulative
 
 def calculate_daily_metrics(date, open_positions, price_data, portfolio_value, total_cash_in_cumulative, total_cash_out_cumulative, i, running_peak):
@@ -104,18 +107,11 @@ def calculate_daily_metrics(date, open_positions, price_data, portfolio_value, t
     
     return portfolio_value, running_peak
 
-def calculate_twr(i, date, portfolio_value, transactions, price_data, spy_ticker):
+def calculate_twr(i, date, portfolio_value, ledger, price_data, spy_ticker):
     if i > 0:
         prev_trading_day = portfolio_value.index[i-1]
-        net_cash_flow = 0
-        daily_transactions_for_twr = transactions[transactions['Date'] == date]
-        if not daily_transactions_for_twr.empty:
-            for _, trans_row in daily_transactions_for_twr.iterrows():
-                if trans_row['Type'] == 'Buy':
-                    net_cash_flow -= trans_row['Quantity'] * trans_row['Price']
-                elif trans_row['Type'] == 'Sell':
-                    net_cash_flow += trans_row['Quantity'] * trans_row['Price']
-
+        net_cash_flow = ledger.net_cash_flow(date)
+        if net_cash_flow is not None:
             adjusted_start_value = portfolio_value.loc[prev_trading_day, 'Current Value'] + net_cash_flow
 
             if adjusted_start_value != 0:
@@ -143,4 +139,62 @@ def calculate_twr(i, date, portfolio_value, transactions, price_data, spy_ticker
         else:
             portfolio_value.loc[date, 'SPY Daily Return'] = 0.0
             portfolio_value.loc[date, 'SPY_TWR'] = portfolio_value.loc[prev_trading_day, 'SPY_TWR']
-    return portfolio_value
\ No newline at end of file
+    return portfolio_value
+
+def run_daily_loop(ledger, price_data, spy_ticker, lot_method=FIFO):
+    """
+    Reference day-by-day evaluation of the portfolio.
+
+    Kept alongside the vectorized engine in valuation_engine.py so the two can be
+    compared on the same inputs.
+
+    Returns:
+        tuple: (portfolio_value, open_positions, closed_positions)
+    """
+    portfolio_value = pd.DataFrame(index=price_data[spy_ticker].index)
+    open_positions = {}
+    closed_positions = []
+
+    portfolio_value['Current Value'] = 0.0
+    portfolio_value['Cost'] = 0.0
+    portfolio_value['Current P&L'] = 0.0
+    portfolio_value['Closed P&L'] = 0.0
+    portfolio_value['Overall P&L'] = 0.0
+    portfolio_value['P&L Positive'] = 0.0
+    portfolio_value['P&L Negative'] = 0.0
+    portfolio_value['Daily P&L Change'] = 0.0
+    portfolio_value['TWR'] = 1.0
+    portfolio_value['SPY_TWR'] = 1.0
+    portfolio_value['Net Invested Capital'] = 0.0
+    portfolio_value['Cumulative Cash Flow Adjusted Return'] = 0.0
+    portfolio_value['Drawdown'] = 0.0
+    portfolio_value['Portfolio Daily Return'] = 0.0
+    portfolio_value['SPY Daily Return'] = 0.0
+
+    total_cash_in_cumulative = 0.0
+    total_cash_out_cumulative = 0.0
+    running_peak = 0.0
+
+    for i, date in enumerate(portfolio_value.index):
+        if i > 0:
+            prev_trading_day = portfolio_value.index[i-1]
+            portfolio_value.loc[date, 'Closed P&L'] = portfolio_value.loc[prev_trading_day, 'Closed P&L']
+            total_cash_in_cumulative = portfolio_value.loc[prev_trading_day, 'total_cash_in_cumulative']
+            total_cash_out_cumulative = portfolio_value.loc[prev_trading_day, 'total_cash_out_cumulative']
+            running_peak = portfolio_value.loc[prev_trading_day, 'running_peak'] # Carry forward running_peak
+        else:
+            total_cash_in_cumulative = 0.0
+            total_cash_out_cumulative = 0.0
+            running_peak = 0.0 # Initialize for the first day
+
+        day_rows = ledger.day_slice(date)
+
+        open_positions, portfolio_value, closed_positions, total_cash_in_cumulative, total_cash_out_cumulative = \
+            process_daily_transactions(date, ledger, day_rows, open_positions, portfolio_value, closed_positions, total_cash_in_cumulative, total_cash_out_cumulative, lot_method)
+
+        portfolio_value, running_peak = calculate_daily_metrics(date, open_positions, price_data, portfolio_value, total_cash_in_cumulative, total_cash_out_cumulative, i, running_peak)
+        portfolio_value.loc[date, 'running_peak'] = running_peak # Store running_peak for next iteration
+
+        portfolio_value = calculate_twr(i, date, portfolio_value, ledger, price_data, spy_ticker)
+
+    return portfolio_value, open_positions, closed_positions
@@ -1,20 +1,107 @@
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, Request, Form, HTTPException, Query, File, UploadFile
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 import pandas as pd
 import os
+import hashlib
+import threading
+import time
 from datetime import datetime, timedelta
 
 # Assuming main.py is in the parent directory and contains calculate_portfolio_performance
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from main import calculate_portfolio_performance
+sys.path.append(os.path.dirname(__file__))
+from benchmark_analytics import DEFAULT_BENCHMARKS, parse_benchmarks
+from ingest_queue import IngestQueue
+from ledger_store import LedgerStore, LedgerValidationError, read_transactions_csv
+from live_feed import LiveFeed
+from live_valuation import LiveBook, SimulatedQuoteSource, YFinanceQuoteSource
+from main import advanced_metrics_memo, input_fingerprint
+from metrics_registry import HTTP_SECONDS, registry
+from position_attribution import ATTRIBUTION_MEASURES
+from recompute_worker import RecomputeWorker
+from result_snapshot import SnapshotHolder, to_json_bytes
 
 app = FastAPI()
 
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+OUTPUT_DIR = os.path.join(PROJECT_DIR, "output")
+# The ledger lives in an append-only SQLite store; transactions.csv seeds a new store
+LEDGER_FILE = os.path.join(PROJECT_DIR, "ledger.sqlite")
+TRANSACTIONS_FILE = os.path.join(PROJECT_DIR, "transactions.csv")
+START_DATE = '2025-03-26'
+# Set PORTFOLIO_PROFILE=1 to write output/profile.json with the stage timings of every recompute
+PROFILE_RUNS = os.environ.get('PORTFOLIO_PROFILE') == '1'
+# Quotes for the live view: 'yfinance' (polled every minute) or 'simulated' (a local random walk)
+LIVE_QUOTES = os.environ.get('PORTFOLIO_LIVE_QUOTES', 'yfinance')
+# Benchmarks of the TWR comparison, separated by ';', e.g. 'SPY;QQQ;60/40=SPY:0.6,AGG:0.4'
+BENCHMARKS = parse_benchmarks(os.environ.get('PORTFOLIO_BENCHMARKS', ';'.join(DEFAULT_BENCHMARKS)))
+
+# Parsed and serialized /data/* payloads of the last completed run
+snapshots = SnapshotHolder(OUTPUT_DIR)
+# Advanced metrics of the last completed run, served while a newer one is computed
+last_run = {}
+# Open positions of the last completed run, revalued with intraday quotes
+live_feed = LiveFeed(lambda: LiveBook.from_column_store(snapshots.output_dir),
+                     SimulatedQuoteSource() if LIVE_QUOTES == 'simulated' else YFinanceQuoteSource())
+
+_ledger_store = None
+# Called from handlers and from the ingest queue's commit thread; the store must
+# be seeded from transactions.csv exactly once, as the ledger is append-only
+_ledger_lock = threading.Lock()
+
+def _ledger():
+    global _ledger_store
+    if _ledger_store is None:
+        with _ledger_lock:
+            if _ledger_store is None:
+                store = LedgerStore(LEDGER_FILE)
+                if len(store) == 0 and os.path.exists(TRANSACTIONS_FILE):
+                    store.import_csv(TRANSACTIONS_FILE)
+                _ledger_store = store
+    return _ledger_store
+
+def _end_date():
+    # Ensure end_date for yfinance is tomorrow's date relative to current execution
+    return (datetime.today() + timedelta(days=1)).strftime('%Y-%m-%d')
+
+def _publish(results):
+    # Runs on a thread once the worker process has rewritten the output files
+    advanced_metrics_memo.put(tuple(results['fingerprint']), results['advanced_metrics'])
+    # Stage timings and cache counters were recorded in the worker process
+    registry.record_profile(results['profile'])
+    snapshots.reload(results['version'])
+    live_feed.reload()
+    last_run['advanced_metrics'] = results['advanced_metrics']
+
+recompute_worker = RecomputeWorker(lambda: (_ledger().path, START_DATE, _end_date()), on_complete=_publish, working_dir=PROJECT_DIR,
+                                   pipeline_options={'profile': PROFILE_RUNS, 'benchmarks': list(BENCHMARKS.items())},
+                                   version=lambda: _ledger().version())
+# Every ledger write from the web app goes through this queue; each group commit queues one recompute
+ingest_queue = IngestQueue(_ledger, on_commit=lambda: {"job_id": recompute_worker.submit()})
+
+@app.middleware("http")
+async def time_handlers(request: Request, call_next):
+    # Latency per route template, so /jobs/{job_id} is one series rather than one per job
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Mounted apps (/static) leave no route but set their mount path as root_path
+        route = request.scope.get("route")
+        handler = getattr(route, "path", None) or request.scope.get("root_path") or "unmatched"
+        registry.observe(HTTP_SECONDS, time.perf_counter() - started, method=request.method, handler=handler, status=status)
+
+@app.on_event("shutdown")
+def shutdown_recompute_worker():
+    recompute_worker.shutdown()
+
 # Mount static files (CSS, JS, images)
-app.mount("/static", StaticFiles(directory="/Users/chanv/scripts/portfolio_tracker/portfolio_web_app/static"), name="static")
+app.mount("/static", StaticFiles(directory=os.path.join(os.path.dirname(__file__), "static")), name="static")
 
 # Templates for serving HTML (we'll use a simple HTML string for now, but Jinja2 is an option)
 # templates = Jinja2Templates(directory="portfolio_tracker/portfolio_web_app/templates")
@@ -38,6 +125,7 @@ async def read_root():
                 <ul>
                     <li><a href="#" id="nav-welcome">Welcome</a></li>
                     <li><a href="#" id="nav-charts">Charts</a></li>
+                    <li><a href="#" id="nav-live">Live</a></li>
                     <li><a href="#" id="nav-portfolio-values">Portfolio Values</a></li>
                     <li><a href="#" id="nav-open-positions">Open Positions</a></li>
                     <li><a href="#" id="nav-closed-positions">Closed Positions</a></li>
@@ -55,12 +143,19 @@ async def read_root():
 
                 <div id="charts-section" class="content-section hidden">
                     <h2>Charts</h2>
+                    <div class="date-range">
+                        <label for="chart_start">From:</label>
+                        <input type="date" id="chart_start">
+                        <label for="chart_end">To:</label>
+                        <input type="date" id="chart_end">
+                    </div>
                     <div class="tabs">
                         <button class="chart-tab-button active" data-tab-id="portfolio-value-chart-tab">Portfolio Value</button>
                         <button class="chart-tab-button" data-tab-id="daily-pnl-chart-tab">Daily P&L</button>
                         <button class="chart-tab-button" data-tab-id="asset-allocation-chart-tab">Asset Allocation</button>
-                        <button class="chart-tab-button" data-tab-id="twr-chart-tab">TWR vs SPY</button>
+                        <button class="chart-tab-button" data-tab-id="twr-chart-tab">TWR vs Benchmarks</button>
                         <button class="chart-tab-button" data-tab-id="cumulative-return-chart-tab">Cumulative Return</button>
+                        <button class="chart-tab-button" data-tab-id="rolling-risk-chart-tab">Rolling Risk</button>
                     </div>
 
                     <div id="portfolio-value-chart-tab" class="chart-tab-content">
@@ -76,23 +171,72 @@ async def read_root():
                         <canvas id="asset_allocation_chart"></canvas>
                     </div>
                     <div id="twr-chart-tab" class="chart-tab-content hidden">
-                        <h3>Time-Weighted Return (TWR) vs. SPY</h3>
+                        <h3>Time-Weighted Return (TWR) vs. Benchmarks</h3>
                         <canvas id="twr_chart"></canvas>
                     </div>
                     <div id="cumulative-return-chart-tab" class="chart-tab-content hidden">
                         <h3>Cumulative Cash Flow Adjusted Return</h3>
                         <canvas id="cumulative_return_chart"></canvas>
                     </div>
+                    <div id="rolling-risk-chart-tab" class="chart-tab-content hidden">
+                        <h3>Rolling Risk Metrics</h3>
+                        <div class="date-range">
+                            <label for="rolling_window">Window:</label>
+                            <select id="rolling_window">
+                                <option value="21">21 days</option>
+                                <option value="63" selected>63 days</option>
+                                <option value="252">252 days</option>
+                            </select>
+                            <label for="rolling_metric">Metric:</label>
+                            <select id="rolling_metric">
+                                <option value="volatility">Volatility</option>
+                                <option value="sharpe_ratio" selected>Sharpe Ratio</option>
+                                <option value="sortino_ratio">Sortino Ratio</option>
+                                <option value="beta">Beta</option>
+                                <option value="alpha">Alpha</option>
+                                <option value="correlation">Correlation with SPY</option>
+                                <option value="max_drawdown">Max Drawdown</option>
+                            </select>
+                        </div>
+                        <canvas id="rolling_risk_chart"></canvas>
+                    </div>
                 </div>
 
                 <div id="portfolio-values-section" class="content-section hidden">
                     <h2>Portfolio Values</h2>
+                    <div class="date-range">
+                        <label for="pv_start">From:</label>
+                        <input type="date" id="pv_start">
+                        <label for="pv_end">To:</label>
+                        <input type="date" id="pv_end">
+                    </div>
                     <table id="portfolio_value_table"></table>
                     <div id="metrics-display"></div>
                 </div>
 
+                <div id="live-section" class="content-section hidden">
+                    <h2>Live Valuation</h2>
+                    <p id="live_status">Connecting...</p>
+                    <table id="live_totals_table" class="live-table">
+                        <thead>
+                            <tr><th>Value</th><th>Cost</th><th>Current P&L</th><th>Closed P&L</th><th>Overall P&L</th><th>Day Change</th></tr>
+                        </thead>
+                        <tbody>
+                            <tr><td id="live_value"></td><td id="live_cost"></td><td id="live_current_pnl"></td><td id="live_closed_pnl"></td><td id="live_overall_pnl"></td><td id="live_day_change"></td></tr>
+                        </tbody>
+                    </table>
+                    <table id="live_positions_table" class="live-table">
+                        <thead>
+                            <tr><th>Symbol</th><th>Quantity</th><th>Price</th><th>Value</th><th>Cost</th><th>P&L</th><th>Day Change</th></tr>
+                        </thead>
+                        <tbody></tbody>
+                    </table>
+                </div>
+
                 <div id="open-positions-section" class="content-section hidden">
                     <h2>Open Positions</h2>
+                    <label for="positions_as_of">As of</label>
+                    <input type="date" id="positions_as_of">
                     <table id="open_positions_table"></table>
                 </div>
 
@@ -122,6 +266,14 @@ async def read_root():
                         <button type="submit">Add Transaction</button>
                     </form>
                     <p id="message"></p>
+
+                    <h2>Import Transactions</h2>
+                    <form id="import_form">
+                        <label for="import_file">CSV file (Date, Ticker, Type, Quantity, Price, Commission):</label>
+                        <input type="file" id="import_file" name="file" accept=".csv,text/csv" required><br><br>
+                        <button type="submit">Import</button>
+                    </form>
+                    <p id="import_message"></p>
                 </div>
             </div>
         </div>
@@ -135,56 +287,232 @@ async def read_root():
     """
     return HTMLResponse(content=html_content)
 
+def _not_modified(request: Request, etag: str):
+    if_none_match = request.headers.get("if-none-match", "")
+    return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+def _json_response(request: Request, body: bytes, etag: str = None):
+    etag = etag or f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        registry.count_cache("http_etag", hits=1)
+        return Response(status_code=304, headers=headers)
+    registry.count_cache("http_etag", misses=1)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _snapshot_response(request: Request, name: str):
+    snapshot = snapshots.current()
+    return _json_response(request, snapshot.payload(name), snapshot.etag(name))
+
+def _date_param(value, name):
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"'{name}' must be a date in YYYY-MM-DD format")
+
 @app.get("/data/portfolio_value")
-async def get_portfolio_value_data():
-    df = pd.read_csv("/Users/chanv/scripts/portfolio_tracker/output/portfolio_value.csv")
-    return df.to_dict(orient="records")
+async def get_portfolio_value_data(request: Request,
+                                   start: str | None = None,
+                                   end: str | None = None,
+                                   offset: int | None = Query(None, ge=0),
+                                   limit: int | None = Query(None, ge=1),
+                                   sort: str | None = None,
+                                   order: str = Query("asc", pattern="^(asc|desc)$"),
+                                   draw: int | None = None):
+    # Rows between the optional start and end dates. With offset, limit or draw the
+    # response is one page in DataTables' server-side format:
+    # {"draw", "recordsTotal", "recordsFiltered", "data"}
+    start, end = _date_param(start, "start"), _date_param(end, "end")
+    paged = offset is not None or limit is not None or draw is not None
+    if not paged and start is None and end is None and sort is None and order == "asc":
+        return _snapshot_response(request, "portfolio_value")
+
+    snapshot = snapshots.current()
+    if sort is not None and sort not in snapshot.tables["portfolio_value"].columns:
+        raise HTTPException(status_code=400, detail=f"Unknown sort column '{sort}'")
+    total, filtered, rows = snapshot.page("portfolio_value", start, end, offset or 0, limit, sort, order == "desc")
+    if not paged:
+        return _json_response(request, to_json_bytes(rows))
+    return _json_response(request, to_json_bytes({"draw": draw or 0, "recordsTotal": total, "recordsFiltered": filtered, "data": rows}))
 
 @app.get("/data/open_positions")
-async def get_open_positions_data():
-    df = pd.read_csv("/Users/chanv/scripts/portfolio_tracker/output/open_positions.csv")
-    return df.to_dict(orient="records")
+async def get_open_positions_data(request: Request):
+    return _snapshot_response(request, "open_positions")
 
 @app.get("/data/closed_positions")
-async def get_closed_positions_data():
-    df = pd.read_csv("/Users/chanv/scripts/portfolio_tracker/output/closed_positions.csv")
-    return df.to_dict(orient="records")
+async def get_closed_positions_data(request: Request):
+    return _snapshot_response(request, "closed_positions")
+
+@app.get("/data/columns/{table}")
+async def get_table_columns(request: Request, table: str):
+    # Column-oriented JSON streamed from the memory-mapped column store
+    snapshot = snapshots.current()
+    if table not in snapshot.tables:
+        raise HTTPException(status_code=404, detail="Unknown table")
+    etag = snapshot.column_etag(table)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return StreamingResponse(snapshot.stream_columns(table), media_type="application/json", headers=headers)
+
+def _chart_response(request: Request, name: str, start, end, points):
+    # Series between the optional start and end dates, downsampled with LTTB to
+    # about `points` samples each when given
+    start, end = _date_param(start, "start"), _date_param(end, "end")
+    if start is None and end is None and points is None:
+        return _snapshot_response(request, name)
+    return _json_response(request, to_json_bytes(snapshots.current().chart(name, start, end, points)))
 
 @app.get("/data/chart/portfolio_value_over_time")
-async def get_portfolio_value_chart_data():
-    df = pd.read_csv("/Users/chanv/scripts/portfolio_tracker/output/portfolio_value.csv")
-    df["Date"] = pd.to_datetime(df["Date"]).dt.strftime("%Y-%m-%d")
-    return {"dates": df["Date"].tolist(), "current_value": df["Current Value"].tolist(), "cost": df["Cost"].tolist()}
+async def get_portfolio_value_chart_data(request: Request, start: str | None = None, end: str | None = None, points: int | None = Query(None, ge=3)):
+    return _chart_response(request, "chart/portfolio_value_over_time", start, end, points)
 
 @app.get("/data/chart/daily_pnl_change")
-async def get_daily_pnl_change_chart_data():
-    df = pd.read_csv("/Users/chanv/scripts/portfolio_tracker/output/portfolio_value.csv")
-    df["Date"] = pd.to_datetime(df["Date"]).dt.strftime("%Y-%m-%d")
-    return {"dates": df["Date"].tolist(), "daily_pnl_change": df["Daily P&L Change"].tolist()}
+async def get_daily_pnl_change_chart_data(request: Request, start: str | None = None, end: str | None = None, points: int | None = Query(None, ge=3)):
+    return _chart_response(request, "chart/daily_pnl_change", start, end, points)
 
 @app.get("/data/chart/asset_allocation")
-async def get_asset_allocation_chart_data():
-    df = pd.read_csv("/Users/chanv/scripts/portfolio_tracker/output/open_positions.csv")
-    return {"labels": df["Symbol"].tolist(), "values": df["Value"].tolist()}
+async def get_asset_allocation_chart_data(request: Request):
+    return _snapshot_response(request, "chart/asset_allocation")
 
 @app.get("/data/chart/twr_vs_spy")
-async def get_twr_vs_spy_chart_data():
-    df = pd.read_csv("/Users/chanv/scripts/portfolio_tracker/output/portfolio_value.csv")
-    df["Date"] = pd.to_datetime(df["Date"]).dt.strftime("%Y-%m-%d")
-    return {"dates": df["Date"].tolist(), "portfolio_twr": df["TWR"].tolist(), "spy_twr": df["SPY_TWR"].tolist()}
+async def get_twr_vs_spy_chart_data(request: Request, start: str | None = None, end: str | None = None, points: int | None = Query(None, ge=3)):
+    return _chart_response(request, "chart/twr_vs_spy", start, end, points)
+
+@app.get("/data/chart/twr_vs_benchmarks")
+async def get_twr_vs_benchmarks_chart_data(request: Request,
+                                           benchmarks: str | None = None,
+                                           start: str | None = None,
+                                           end: str | None = None,
+                                           points: int | None = Query(None, ge=3)):
+    # Portfolio TWR against every configured benchmark, or the comma-separated
+    # `benchmarks` subset, with tracking error and excess return over the range
+    snapshot = snapshots.current()
+    if not snapshot.has_payload("chart/twr_vs_benchmarks"):
+        raise HTTPException(status_code=404, detail="No benchmark comparison in the last run")
+    names = [name.strip() for name in benchmarks.split(",") if name.strip()] if benchmarks else None
+    unknown = [name for name in names or [] if name not in snapshot.benchmark_names()]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown benchmarks: {', '.join(unknown)}; available: {', '.join(snapshot.benchmark_names())}")
+    start, end = _date_param(start, "start"), _date_param(end, "end")
+    if names is None and start is None and end is None and points is None:
+        return _snapshot_response(request, "chart/twr_vs_benchmarks")
+    return _json_response(request, to_json_bytes(snapshot.benchmarks_chart(names, start, end, points)))
 
 @app.get("/data/chart/cumulative_cash_flow_adjusted_return")
-async def get_cumulative_return_chart_data():
-    df = pd.read_csv("/Users/chanv/scripts/portfolio_tracker/output/portfolio_value.csv")
-    df["Date"] = pd.to_datetime(df["Date"]).dt.strftime("%Y-%m-%d")
-    return {"dates": df["Date"].tolist(), "cumulative_return": df["Cumulative Cash Flow Adjusted Return"].tolist()}
+async def get_cumulative_return_chart_data(request: Request, start: str | None = None, end: str | None = None, points: int | None = Query(None, ge=3)):
+    return _chart_response(request, "chart/cumulative_cash_flow_adjusted_return", start, end, points)
 
 @app.get("/data/metrics/maximum_drawdown")
-async def get_maximum_drawdown():
-    df = pd.read_csv("/Users/chanv/scripts/portfolio_tracker/output/portfolio_value.csv")
-    # Maximum Drawdown is the largest value in the 'Drawdown' column
-    mdd = df['Drawdown'].max()
-    return {"maximum_drawdown": round(mdd * 100, 2)} # Return as percentage
+async def get_maximum_drawdown(request: Request):
+    return _snapshot_response(request, "metrics/maximum_drawdown")
+
+@app.get("/data/metrics/rolling")
+async def get_rolling_metrics(request: Request,
+                              window: int = 63,
+                              metrics: str | None = None,
+                              start: str | None = None,
+                              end: str | None = None,
+                              points: int | None = Query(None, ge=3)):
+    # Rolling volatility, Sharpe, Sortino, beta, alpha, correlation and max drawdown
+    # over one of the windows computed by the pipeline; `metrics` is a comma-separated subset
+    snapshot = snapshots.current()
+    if window not in snapshot.rolling_windows():
+        windows = ", ".join(str(days) for days in snapshot.rolling_windows()) or "none"
+        raise HTTPException(status_code=400, detail=f"Unknown window {window}; available: {windows}")
+    names = [name.strip() for name in metrics.split(",") if name.strip()] if metrics else None
+    unknown = sorted(set(names or []) - set(snapshot.rolling_metric_names(window)))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metrics: {', '.join(unknown)}")
+    start, end = _date_param(start, "start"), _date_param(end, "end")
+    if names is None and start is None and end is None and points is None:
+        return _snapshot_response(request, f"metrics/rolling_{window}")
+    return _json_response(request, to_json_bytes(snapshot.rolling(window, names, start, end, points)))
+
+@app.get("/data/metrics/risk")
+async def get_risk_metrics(request: Request,
+                           method: str | None = None,
+                           horizon: int | None = None,
+                           confidence: float | None = None):
+    # Monte Carlo VaR/CVaR of the open positions for one method ('parametric' or
+    # 'bootstrap') and horizon in trading days, with per-ticker CVaR contributions
+    snapshot = snapshots.current()
+    options = snapshot.risk_options()
+    if not options:
+        raise HTTPException(status_code=404, detail="No risk simulation in the last run")
+    for name, value, position in (("method", method, 0), ("horizon", horizon, 1), ("confidence", confidence, 2)):
+        available = sorted({option[position] for option in options})
+        if value is not None and value not in available:
+            raise HTTPException(status_code=400, detail=f"Unknown {name} {value}; available: {', '.join(map(str, available))}")
+    if method is None and horizon is None and confidence is None:
+        return _snapshot_response(request, "metrics/risk")
+    return _json_response(request, to_json_bytes(snapshot.risk(method, horizon, confidence)))
+
+def _top_movers(request: Request, name: str, start, end, limit, by, detractors):
+    snapshot = snapshots.current()
+    if not snapshot.has_payload(name):
+        raise HTTPException(status_code=404, detail="No per-ticker attribution in the last run")
+    if by not in ATTRIBUTION_MEASURES:
+        raise HTTPException(status_code=400, detail=f"Unknown measure {by}; available: {', '.join(ATTRIBUTION_MEASURES)}")
+    start, end = _date_param(start, "start"), _date_param(end, "end")
+    if start is None and end is None and limit == 10 and by == "contribution":
+        return _snapshot_response(request, name)
+    return _json_response(request, to_json_bytes(snapshot.top_movers(start, end, limit, by, detractors)))
+
+@app.get("/data/attribution/top_contributors")
+async def get_top_contributors(request: Request,
+                               start: str | None = None,
+                               end: str | None = None,
+                               limit: int = Query(10, ge=1, le=1000),
+                               by: str = "contribution"):
+    # Tickers that added most over [start, end], by summed contribution to return or by P&L
+    return _top_movers(request, "attribution/top_contributors", start, end, limit, by, detractors=False)
+
+@app.get("/data/attribution/top_detractors")
+async def get_top_detractors(request: Request,
+                             start: str | None = None,
+                             end: str | None = None,
+                             limit: int = Query(10, ge=1, le=1000),
+                             by: str = "contribution"):
+    # Tickers that took most away over [start, end]
+    return _top_movers(request, "attribution/top_detractors", start, end, limit, by, detractors=True)
+
+@app.get("/data/positions")
+async def get_positions(request: Request, as_of: str | None = None):
+    # Open positions at the end of any past day, from the holdings index of the last run
+    snapshot = snapshots.current()
+    if not snapshot.has_payload("positions"):
+        raise HTTPException(status_code=404, detail="No holdings index in the last run")
+    as_of = _date_param(as_of, "as_of")
+    if as_of is None:
+        return _snapshot_response(request, "positions")
+    return _json_response(request, to_json_bytes(snapshot.positions(as_of)))
+
+@app.get("/data/positions/diff")
+async def get_positions_diff(request: Request, start: str, end: str):
+    # Changes in quantity and cost basis between the ends of two days
+    snapshot = snapshots.current()
+    if not snapshot.has_payload("positions"):
+        raise HTTPException(status_code=404, detail="No holdings index in the last run")
+    start, end = _date_param(start, "start"), _date_param(end, "end")
+    return _json_response(request, to_json_bytes(snapshot.positions_diff(start, end)))
+
+@app.get("/live/snapshot")
+async def get_live_snapshot():
+    # Totals and every open position at the latest quotes
+    snapshot = live_feed.snapshot()
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="No completed run yet")
+    return snapshot
+
+@app.get("/live/stream")
+async def stream_live_valuation():
+    # Server-Sent Events: a "snapshot" event on connect and after each recompute,
+    # then at most one "update" per second with the totals and the positions that moved
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(live_feed.subscribe(), media_type="text/event-stream", headers=headers)
 
 @app.post("/transactions")
 async def add_transaction(request: Request,
@@ -195,39 +523,108 @@ async def add_transaction(request: Request,
                           price: float = Form(...),
                           commission: float = Form(...)):
     
-    # Convert date from YYYY-MM-DD (from date picker) to MM/DD/YY for CSV
-    formatted_date = datetime.strptime(date, '%Y-%m-%d').strftime('%m/%d/%y')
-
-    transaction_data = {
-        "Date": formatted_date,
-        "Ticker": ticker.upper(),
-        "Type": type.capitalize(),
+    transaction_data = pd.DataFrame([{
+        "Date": date,
+        "Ticker": ticker,
+        "Type": type,
         "Quantity": quantity,
         "Price": price,
         "Commission": commission
-    }
+    }])
 
-    transactions_file = "/Users/chanv/scripts/portfolio_tracker/transactions.csv"
+    # Returns once the transaction is durably committed, together with the
+    # requests queued alongside it. The portfolio is then recomputed in the
+    # background; the /data/* endpoints keep serving the last completed run until
+    # one computed from `version` or later is published.
     try:
-        # Append to transactions.csv
-        with open(transactions_file, 'a') as f:
-            f.write(f"\n{transaction_data['Date']},{transaction_data['Ticker']},{transaction_data['Type']},{transaction_data['Quantity']},{transaction_data['Price']},{transaction_data['Commission']}")
-        
-        # Re-run the portfolio calculation
-        # Get the latest end_date from the transactions file for recalculation
-        latest_transaction_date = pd.to_datetime(date, format='%m/%d/%y')
-        # Ensure end_date for yfinance is tomorrow's date relative to current execution
-        end_date_for_calc = (datetime.today() + timedelta(days=1)).strftime('%Y-%m-%d')
-        advanced_metrics = calculate_portfolio_performance(transactions_file, '2025-03-26', end_date_for_calc)
-
-        return {"message": "Transaction added and portfolio updated successfully!", "advanced_metrics": advanced_metrics}
+        batch = await ingest_queue.submit(transaction_data, source="form")
+    except LedgerValidationError as e:
+        return {"message": f"Error adding transaction: {'; '.join(error['error'] for error in e.errors)}"}
     except Exception as e:
         return {"message": f"Error adding transaction: {e}"}
 
+    if "error" in batch:
+        return {"message": f"Transaction added, but the portfolio update could not be queued: {batch['error']}",
+                "version": batch["version"], "job_id": None}
+    job_id = batch["job_id"]
+    return {"message": "Transaction added successfully! Portfolio update queued.", "version": batch["version"],
+            "job_id": job_id, "status_url": f"/jobs/{job_id}"}
+
+@app.post("/transactions/import")
+async def import_transactions(file: UploadFile = File(...)):
+    # A CSV in the transactions.csv layout (an optional Lot column is kept). The whole
+    # file is validated first and committed as one batch, then one recompute runs.
+    contents = await file.read()
+    try:
+        batch = await ingest_queue.submit(read_transactions_csv(contents), source=file.filename)
+    except LedgerValidationError as e:
+        raise HTTPException(status_code=400, detail={"message": f"{e}; nothing was imported", "errors": e.errors})
+    except (ValueError, UnicodeDecodeError) as e:
+        # Unreadable CSV (pandas' parser errors are ValueErrors)
+        raise HTTPException(status_code=400, detail={"message": f"Could not read the file: {e}", "errors": []})
+
+    if "error" in batch:
+        return {
+            "message": f"Imported {batch['rows']} transactions, but the portfolio update could not be queued: "
+                       f"{batch['error']}",
+            "rows": batch["rows"],
+            "batch_id": batch["batch_id"],
+            "version": batch["version"],
+            "job_id": None,
+        }
+    job_id = batch["job_id"]
+    return {
+        "message": f"Imported {batch['rows']} transactions. Portfolio update queued.",
+        "rows": batch["rows"],
+        "batch_id": batch["batch_id"],
+        "version": batch["version"],
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+    }
+
 @app.get("/data/metrics/advanced")
 async def get_advanced_metrics():
-    # Re-run calculation to get the latest metrics
-    transactions_file = "/Users/chanv/scripts/portfolio_tracker/transactions.csv"
-    end_date_for_calc = (datetime.today() + timedelta(days=1)).strftime('%Y-%m-%d')
-    advanced_metrics = calculate_portfolio_performance(transactions_file, '2025-03-26', end_date_for_calc)
-    return advanced_metrics
\ No newline at end of file
+    # Served from the memo unless the ledger or the cached prices changed
+    advanced_metrics = advanced_metrics_memo.get(input_fingerprint(_ledger(), START_DATE, _end_date()))
+    if advanced_metrics is not None:
+        return advanced_metrics
+
+    job_id = recompute_worker.submit()
+    if 'advanced_metrics' in last_run:
+        return last_run['advanced_metrics']
+    job = await recompute_worker.wait(job_id)
+    if job['status'] != 'done':
+        raise HTTPException(status_code=500, detail=f"Recompute failed: {job['error']}")
+    return job['result']['advanced_metrics']
+
+@app.get("/data/version")
+async def get_version():
+    # Ledger version of the results being served (None for results from before
+    # this process started) and of the ledger itself
+    return {"version": snapshots.current().version, "ledger_version": _ledger().version()}
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/jobs/recompute")
+async def submit_recompute():
+    job_id = recompute_worker.submit()
+    return recompute_worker.status(job_id)
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    status = recompute_worker.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return status
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    status = recompute_worker.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    if status['status'] != 'done':
+        return JSONResponse(status_code=202, content=status)
+    return recompute_worker.result(job_id)
\ No newline at end of file
@@ -0,0 +1,46 @@
+import numpy as np
+
+def lttb_indices(y, points):
+    """
+    Picks which samples of a series to keep with Largest-Triangle-Three-Buckets.
+
+    The first and last samples are always kept. The samples in between are split
+    into points - 2 equal buckets. From each bucket the sample that forms the
+    largest triangle with the previously kept sample and the mean of the next
+    bucket is kept, which preserves peaks and troughs much better than taking
+    every n-th sample. Samples are assumed to be evenly spaced (trading days).
+
+    Args:
+        y (np.ndarray): Series values; NaN is treated as 0 when ranking samples.
+        points (int): Number of samples to keep, at least 3.
+
+    Returns:
+        np.ndarray: Sorted positions of the kept samples.
+    """
+    n = len(y)
+    if points >= n or points < 3:
+        return np.arange(n)
+
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    # Mean position and value of every bucket, from prefix sums
+    sums = np.concatenate(([0.0], np.cumsum(y)))
+    counts = np.diff(edges)
+    mean_x = (edges[:-1] + edges[1:] - 1) / 2
+    mean_y = (sums[edges[1:]] - sums[edges[:-1]]) / counts
+    # The last sample is the "next bucket" of the final bucket
+    mean_x = np.append(mean_x, n - 1)
+    mean_y = np.append(mean_y, y[-1])
+
+    kept = np.empty(points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        x = np.arange(lo, hi)
+        # Twice the triangle area; the constant factor does not change the argmax
+        area = np.abs((previous - mean_x[bucket + 1]) * (y[lo:hi] - y[previous])
+                      - (previous - x) * (mean_y[bucket + 1] - y[previous]))
+        previous = lo + int(np.argmax(area))
+        kept[bucket + 1] = previous
+    return kept
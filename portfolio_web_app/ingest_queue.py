@@ -0,0 +1,70 @@
+import asyncio
+
+from ledger_store import validate_transactions
+from metrics_registry import LEDGER_BATCHES, LEDGER_COMMITS, registry
+
+# Requests committed together at most; any more wait for the next group
+MAX_GROUP_BATCHES = 256
+
+class IngestQueue:
+    """
+    The web app's single writer of the ledger.
+
+    Requests validate their transactions and queue them. One writer task commits
+    everything queued so far in a single durable database transaction (a group
+    commit), then calls on_commit once for the whole group, which queues one
+    recompute. While a commit is in flight new requests gather behind it, so a
+    burst of POSTs costs one fsync and one recompute per group rather than per
+    request. Everything except the commit itself runs on the event loop thread.
+    """
+
+    def __init__(self, ledger, on_commit=None, max_group=MAX_GROUP_BATCHES):
+        # ledger is called for the LedgerStore when a group is committed
+        self.ledger = ledger
+        self.on_commit = on_commit
+        self.max_group = max_group
+        self._queue = []
+        self._writer = None
+
+    async def submit(self, transactions, source=None):
+        """
+        Validates transactions and waits for the group commit that includes them.
+
+        Returns:
+            dict: batch_id, rows and version (the ledger version right after the
+                commit, see LedgerStore.version), plus what on_commit returned,
+                or 'error' when on_commit raised.
+
+        Raises:
+            LedgerValidationError: Invalid rows; nothing is queued.
+        """
+        rows = validate_transactions(transactions)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((rows, source, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write())
+        return await future
+
+    async def _write(self):
+        loop = asyncio.get_running_loop()
+        while self._queue:
+            group, self._queue = self._queue[:self.max_group], self._queue[self.max_group:]
+            batches = [(rows, source) for rows, source, _ in group]
+            try:
+                committed = await loop.run_in_executor(None, lambda: self.ledger().commit_batches(batches, durable=True))
+            except Exception as e:
+                for _, _, future in group:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            registry.inc(LEDGER_COMMITS)
+            registry.inc(LEDGER_BATCHES, len(group))
+            try:
+                extra = self.on_commit() if self.on_commit is not None else {}
+            except Exception as e:
+                # The rows are committed either way; every request of the group still gets its answer
+                extra = {'error': str(e)}
+            for (_, _, future), batch in zip(group, committed):
+                # A request whose client went away is committed all the same
+                if not future.done():
+                    future.set_result(dict(batch, **extra))
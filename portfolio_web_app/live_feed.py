@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+from contextlib import aclosing
+
+from metrics_registry import LIVE_FEED_ERRORS, registry
+
+logger = logging.getLogger(__name__)
+
+# Server-Sent Events messages buffered per client; a client that falls further
+# behind is sent a full snapshot instead of the deltas it missed
+CLIENT_BUFFER = 16
+# Comment line sent to idle clients so proxies keep the connection open
+HEARTBEAT_SECONDS = 15
+# Longest wait before subscribing again after the quote source failed
+MAX_RETRY_SECONDS = 60
+
+def sse_message(event, payload):
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {event}\ndata: {data}\n\n".encode("utf-8")
+
+class LiveFeed:
+    """
+    Feeds quotes into a LiveBook and pushes the changes to every connected client.
+
+    Quotes are applied as they arrive, but at most one update per `throttle`
+    seconds is sent, covering every position that changed since the previous
+    one. Each update is serialized once and shared by all clients, so the cost
+    per tick does not grow with the number of open dashboards. The quote
+    subscription only runs while at least one client is connected, and is
+    opened again, after a growing pause, when the quote source fails. All methods
+    except reload() run on the event loop thread.
+    """
+
+    def __init__(self, load_book, source, throttle=1.0):
+        self.load_book = load_book
+        self.source = source
+        self.throttle = throttle
+        self.book = None
+        self._pending_book = None
+        self._clients = set()
+        self._changed = set()
+        self._resubscribe = False
+        # Set when a new book is pending or was swapped in; wakes the quote consumer
+        self._book_changed = asyncio.Event()
+        self._loop = None
+        self._tasks = []
+
+    def reload(self):
+        """Rebuilds the book from the latest run; safe to call from any thread."""
+        self._pending_book = self.load_book()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._book_changed.set)
+
+    def _swap_book(self):
+        book, self._pending_book = self._pending_book, None
+        if self.book is None or book is None or set(book.symbols) != set(self.book.symbols):
+            self._resubscribe = True
+            self._book_changed.set()
+        self.book = book
+        self._changed.clear()
+        self._broadcast(self._snapshot_message())
+
+    def _snapshot_message(self):
+        return sse_message("snapshot", self.book.snapshot() if self.book is not None else None)
+
+    def _broadcast(self, message):
+        for queue in self._clients:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Deltas were dropped; a snapshot supersedes all of them
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._snapshot_message())
+
+    async def _consume_quotes(self):
+        failures = 0
+        while True:
+            if self._pending_book is not None:
+                self._swap_book()
+            if self.book is None or not self.book.symbols:
+                await asyncio.sleep(self.throttle)
+                continue
+            self._resubscribe = False
+            try:
+                async with aclosing(self.source.stream(self.book.last_prices())) as quotes_stream, \
+                        aclosing(self._until_resubscribe(quotes_stream)) as quotes_until_resubscribe:
+                    async for quotes in quotes_until_resubscribe:
+                        failures = 0
+                        self._changed.update(self.book.apply(quotes))
+            except Exception:
+                # Keep serving the last prices and subscribe again, waiting longer after each failure in a row
+                failures += 1
+                registry.inc(LIVE_FEED_ERRORS)
+                retry = min(self.throttle * 2 ** failures, MAX_RETRY_SECONDS)
+                logger.exception("Quote stream failed; subscribing again in %.1fs", retry)
+                await asyncio.sleep(retry)
+
+    async def _until_resubscribe(self, quotes_stream):
+        # Quotes from the stream until a new run changes the tickers. The wait
+        # races the book change, so a quiet stream (a source that only yields
+        # when a price moves) cannot hold up the subscription for the new book.
+        next_quotes = asyncio.ensure_future(anext(quotes_stream))
+        try:
+            while True:
+                book_changed = asyncio.ensure_future(self._book_changed.wait())
+                done, _ = await asyncio.wait({next_quotes, book_changed}, return_when=asyncio.FIRST_COMPLETED)
+                book_changed.cancel()
+                self._book_changed.clear()
+                if self._pending_book is not None:
+                    self._swap_book()
+                if self._resubscribe or self.book is None:
+                    return
+                if next_quotes in done:
+                    try:
+                        quotes = next_quotes.result()
+                    except StopAsyncIteration:
+                        return
+                    yield quotes
+                    next_quotes = asyncio.ensure_future(anext(quotes_stream))
+        finally:
+            # The stream is closed next; it must not be left running
+            next_quotes.cancel()
+            await asyncio.wait({next_quotes})
+
+    async def _flush(self):
+        idle = 0.0
+        while True:
+            await asyncio.sleep(self.throttle)
+            if self._pending_book is not None:
+                # Picked up here too, so a reload reaches clients while quotes are quiet
+                self._swap_book()
+            if self._changed and self.book is not None:
+                changed, self._changed = sorted(self._changed), set()
+                self._broadcast(sse_message("update", self.book.update(changed)))
+                idle = 0.0
+            else:
+                idle += self.throttle
+                if idle >= HEARTBEAT_SECONDS:
+                    self._broadcast(b": heartbeat\n\n")
+                    idle = 0.0
+
+    def _start(self):
+        self._loop = asyncio.get_running_loop()
+        if self.book is None and self._pending_book is None:
+            self.book = self.load_book()
+        self._tasks = [asyncio.create_task(self._consume_quotes()), asyncio.create_task(self._flush())]
+
+    def _stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def snapshot(self):
+        if self._pending_book is not None:
+            self._swap_book()
+        if self.book is None:
+            self.book = self.load_book()
+        return self.book.snapshot() if self.book is not None else None
+
+    async def subscribe(self):
+        """
+        Yields Server-Sent Events for one client: a snapshot first, then updates.
+        The quote subscription starts with the first client and stops after the last.
+        """
+        queue = asyncio.Queue(maxsize=CLIENT_BUFFER)
+        if not self._clients:
+            self._start()
+        self._clients.add(queue)
+        try:
+            yield b"retry: 5000\n\n" + sse_message("snapshot", self.snapshot())
+            while True:
+                yield await queue.get()
+        finally:
+            self._clients.discard(queue)
+            if not self._clients:
+                self._stop()
+
+    @property
+    def clients(self):
+        return len(self._clients)
@@ -0,0 +1,137 @@
+import asyncio
+import functools
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from main import run_portfolio_pipeline
+
+class RecomputeWorker:
+    """
+    Runs portfolio recomputes in a single worker process, off the event loop.
+    `make_args` is called when a job starts and returns the pipeline arguments;
+    `pipeline_options` are passed to every run as keyword arguments. `version`,
+    if given, is also called when a job starts; it returns the version of the
+    inputs (the ledger's) the job computes from, reported with its status and
+    result.
+
+    At most one job runs and at most one waits. A trigger that arrives while a
+    job is waiting joins that job instead of queueing another, so a burst of
+    triggers costs one extra recompute. All bookkeeping happens on the event
+    loop thread.
+    """
+
+    def __init__(self, make_args, on_complete=None, working_dir=None, max_finished_jobs=100, pipeline_options=None, version=None):
+        self.make_args = make_args
+        self.version = version
+        self.pipeline = functools.partial(run_portfolio_pipeline, **(pipeline_options or {}))
+        self.on_complete = on_complete
+        self.working_dir = working_dir
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = None
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._done_events = {}
+        self._running = None
+        self._waiting = None
+
+    def _pool(self):
+        if self._executor is None:
+            initializer = os.chdir if self.working_dir else None
+            initargs = (self.working_dir,) if self.working_dir else ()
+            self._executor = ProcessPoolExecutor(max_workers=1, initializer=initializer, initargs=initargs)
+        return self._executor
+
+    def submit(self):
+        """Requests a recompute and returns the id of the job that will include it."""
+        if self._waiting is not None:
+            self._jobs[self._waiting]['coalesced'] += 1
+            return self._waiting
+
+        job_id = str(next(self._ids))
+        self._jobs[job_id] = {
+            'id': job_id,
+            'status': 'queued',
+            'coalesced': 0,
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'error': None,
+            'version': None,
+            'result': None,
+        }
+        self._done_events[job_id] = asyncio.Event()
+        self._forget_old_jobs()
+
+        if self._running is None:
+            self._start(job_id)
+        else:
+            self._waiting = job_id
+        return job_id
+
+    def _start(self, job_id):
+        self._running = job_id
+        asyncio.get_running_loop().create_task(self._run(job_id))
+
+    async def _run(self, job_id):
+        job = self._jobs[job_id]
+        job['status'] = 'running'
+        job['started_at'] = time.time()
+        loop = asyncio.get_running_loop()
+        try:
+            # Both may query the ledger, so they run off the event loop too
+            job['version'], args = await loop.run_in_executor(None, self._inputs)
+            result = await loop.run_in_executor(self._pool(), self.pipeline, *args)
+            result = dict(result, version=job['version'])
+            if self.on_complete is not None:
+                await loop.run_in_executor(None, self.on_complete, result)
+            job['result'] = result
+            job['status'] = 'done'
+        except BrokenProcessPool as e:
+            # The worker process died; the next job starts a fresh one
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            job['error'] = str(e)
+            job['status'] = 'failed'
+        except Exception as e:
+            job['error'] = str(e)
+            job['status'] = 'failed'
+        finally:
+            job['finished_at'] = time.time()
+            self._done_events.pop(job_id).set()
+            self._running = None
+            if self._waiting is not None:
+                waiting, self._waiting = self._waiting, None
+                self._start(waiting)
+
+    def _inputs(self):
+        # The version is read before the arguments, so the results include at least that version
+        version = self.version() if self.version is not None else None
+        return version, self.make_args()
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in ('done', 'failed')]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    def status(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        return {key: value for key, value in job.items() if key != 'result'}
+
+    def result(self, job_id):
+        job = self._jobs.get(job_id)
+        return job['result'] if job is not None else None
+
+    async def wait(self, job_id):
+        event = self._done_events.get(job_id)
+        if event is not None:
+            await event.wait()
+        return self._jobs.get(job_id)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
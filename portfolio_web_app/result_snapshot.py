@@ -0,0 +1,418 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from benchmark_analytics import summarize_benchmarks
+from chart_downsampler import lttb_indices
+from column_store import ColumnTable, open_column_store
+from holdings_index import HoldingsIndex
+from position_attribution import rank_tickers
+from report_generator import (ATTRIBUTION_TABLE, ATTRIBUTION_TICKERS_TABLE, BENCHMARKS_TABLE, HOLDINGS_TABLE,
+                              HOLDINGS_TICKERS_TABLE, RISK_CONTRIBUTIONS_TABLE, RISK_TABLE, ROLLING_TABLE_PREFIX)
+
+# Rows per chunk when streaming a column-oriented table
+STREAM_CHUNK_ROWS = 65536
+
+TABLES = ("portfolio_value", "open_positions", "closed_positions")
+
+def _records(df):
+    return df.replace({np.nan: None, np.inf: None, -np.inf: None}).to_dict(orient="records")
+
+def _values(values):
+    """Python list of a column slice, with NaN and ±inf as None (JSON has neither)."""
+    if values.dtype.kind == "f":
+        missing = ~np.isfinite(values)
+        if missing.any():
+            values = values.astype(object)
+            values[missing] = None
+    return values.tolist()
+
+def _json_values(values):
+    return json.dumps(_values(values), ensure_ascii=False, separators=(",", ":"))
+
+def _column(table, name):
+    return _values(table.columns[name])
+
+def to_json_bytes(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _tables_from_csv(output_dir):
+    tables = {}
+    for name in TABLES:
+        frame = pd.read_csv(os.path.join(output_dir, f"{name}.csv"))
+        digest = hashlib.blake2b(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes(), digest_size=8)
+        columns = {column: frame[column].to_numpy() for column in frame.columns}
+        tables[name] = ColumnTable(name, len(frame), columns, digest.hexdigest())
+    return tables
+
+# Chart payload -> (table, payload key -> column) of its time series
+CHART_SERIES = {
+    "chart/portfolio_value_over_time": ("portfolio_value", {"current_value": "Current Value", "cost": "Cost"}),
+    "chart/daily_pnl_change": ("portfolio_value", {"daily_pnl_change": "Daily P&L Change"}),
+    "chart/twr_vs_spy": ("portfolio_value", {"portfolio_twr": "TWR", "spy_twr": "SPY_TWR"}),
+    "chart/cumulative_cash_flow_adjusted_return": ("portfolio_value", {"cumulative_return": "Cumulative Cash Flow Adjusted Return"}),
+}
+
+class ResultSnapshot:
+    """
+    Tables from one pipeline run. The tables are memory-mapped from the column
+    store (or parsed from the CSV reports when there is none); each /data/*
+    payload is serialized to JSON on first use and tagged with an ETag of its
+    contents.
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+        self._builders = {
+            "portfolio_value": lambda: _records(self.frame("portfolio_value")),
+            "open_positions": lambda: _records(self.frame("open_positions")),
+            "closed_positions": lambda: _records(self.frame("closed_positions")),
+            "chart/asset_allocation": lambda: {
+                "labels": _column(self.tables["open_positions"], "Symbol"),
+                "values": _column(self.tables["open_positions"], "Value"),
+            },
+            "metrics/maximum_drawdown": lambda: {"maximum_drawdown": self.maximum_drawdown()},
+        }
+        for name in CHART_SERIES:
+            self._builders[name] = lambda name=name: self.chart(name)
+        for window in self.rolling_windows():
+            self._builders[f"metrics/rolling_{window}"] = lambda window=window: self.rolling(window)
+        if BENCHMARKS_TABLE in self.tables:
+            self._builders["chart/twr_vs_benchmarks"] = lambda: self.benchmarks_chart()
+        if self.risk_options():
+            self._builders["metrics/risk"] = lambda: self.risk()
+        if ATTRIBUTION_TABLE in self.tables:
+            self._builders["attribution/top_contributors"] = lambda: self.top_movers()
+            self._builders["attribution/top_detractors"] = lambda: self.top_movers(detractors=True)
+        if HOLDINGS_TABLE in self.tables and ATTRIBUTION_TABLE in self.tables:
+            self._builders["positions"] = lambda: self.positions()
+        self._bodies = {}
+        self._sort_orders = {}
+        self._holdings_index = None
+        # Ledger version of the run, when the web app computed it
+        self.version = None
+
+    @classmethod
+    def from_output_dir(cls, output_dir):
+        tables = open_column_store(output_dir)
+        if tables is None:
+            tables = _tables_from_csv(output_dir)
+        return cls(tables)
+
+    def frame(self, name):
+        return self.tables[name].to_frame()
+
+    def _entry(self, name):
+        entry = self._bodies.get(name)
+        if entry is None:
+            body = to_json_bytes(self._builders[name]())
+            entry = (body, f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"')
+            self._bodies[name] = entry
+        return entry
+
+    def payload(self, name):
+        return self._entry(name)[0]
+
+    def etag(self, name):
+        return self._entry(name)[1]
+
+    def has_payload(self, name):
+        return name in self._builders
+
+    def payload_names(self):
+        return list(self._builders)
+
+    def column_etag(self, table):
+        return f'"{self.tables[table].digest}"'
+
+    def date_rows(self, table, start=None, end=None):
+        """Row range [lo, hi) of a date-ordered table within [start, end] ('YYYY-MM-DD')."""
+        dates = self.tables[table].columns["Date"]
+        lo = int(np.searchsorted(dates, start, side="left")) if start else 0
+        hi = int(np.searchsorted(dates, end, side="right")) if end else len(dates)
+        return lo, max(lo, hi)
+
+    def _sort_order(self, table, column):
+        # Stable ascending order of the whole column, computed once per snapshot
+        key = (table, column)
+        order = self._sort_orders.get(key)
+        if order is None:
+            order = np.argsort(self.tables[table].columns[column], kind="stable")
+            self._sort_orders[key] = order
+        return order
+
+    def page(self, table, start=None, end=None, offset=0, limit=None, sort=None, descending=False):
+        """
+        One page of a table's rows, optionally limited to a date range and sorted.
+
+        Returns:
+            tuple: (total rows, rows in the date range, list of row dicts)
+        """
+        columns = self.tables[table].columns
+        total = self.tables[table].rows
+        lo, hi = self.date_rows(table, start, end) if (start or end) else (0, total)
+        if sort is None:
+            rows = np.arange(lo, hi)
+            if descending:
+                rows = rows[::-1]
+        else:
+            rows = self._sort_order(table, sort)
+            if lo > 0 or hi < total:
+                rows = rows[(rows >= lo) & (rows < hi)]
+            if descending:
+                rows = rows[::-1]
+        rows = rows[offset:None if limit is None else offset + limit]
+
+        values = {name: _values(column[rows]) for name, column in columns.items()}
+        records = [dict(zip(values, row)) for row in zip(*values.values())]
+        return total, hi - lo, records
+
+    def _series(self, table, series, start=None, end=None, points=None):
+        # Date-ordered columns over [start, end]; with `points`, the dates LTTB
+        # keeps for the first (primary) series, shared by every series
+        columns = self.tables[table].columns
+        lo, hi = self.date_rows(table, start, end)
+        rows = np.arange(lo, hi)
+        if points is not None and hi - lo > points:
+            rows = lo + lttb_indices(columns[next(iter(series.values()))][lo:hi], points)
+
+        payload = {"dates": _values(columns["Date"][rows])}
+        for key, column in series.items():
+            payload[key] = _values(columns[column][rows])
+        return payload
+
+    def chart(self, name, start=None, end=None, points=None):
+        """
+        Payload of a time series chart over [start, end]. With `points`, LTTB picks
+        that many dates from the chart's first series, and every series is sampled
+        at those dates.
+        """
+        table, series = CHART_SERIES[name]
+        return self._series(table, series, start, end, points)
+
+    def maximum_drawdown(self):
+        """
+        Largest value in the 'Drawdown' column, as a percentage; None when the
+        portfolio has no valued days.
+        """
+        drawdown = self.tables["portfolio_value"].columns["Drawdown"]
+        drawdown = drawdown[np.isfinite(drawdown)]
+        if not len(drawdown):
+            return None
+        return round(float(drawdown.max()) * 100, 2)
+
+    def rolling_windows(self):
+        """Window lengths (trading days) of the rolling metrics in this snapshot."""
+        return sorted(int(name[len(ROLLING_TABLE_PREFIX):]) for name in self.tables
+                      if name.startswith(ROLLING_TABLE_PREFIX) and name[len(ROLLING_TABLE_PREFIX):].isdigit())
+
+    def rolling_metric_names(self, window):
+        return [name for name in self.tables[f"{ROLLING_TABLE_PREFIX}{window}"].columns if name != "Date"]
+
+    def rolling(self, window, metrics=None, start=None, end=None, points=None):
+        """
+        Rolling metrics over one window as chart series, {"window", "dates", metric: [...]}.
+        Dates before the first full window are null. Downsampling works as in chart();
+        the dates are picked from the first metric.
+        """
+        metrics = metrics or self.rolling_metric_names(window)
+        payload = self._series(f"{ROLLING_TABLE_PREFIX}{window}", {metric: metric for metric in metrics}, start, end, points)
+        return {"window": window, **payload}
+
+    def benchmark_names(self):
+        """Benchmarks the last run compared the portfolio with, in configured order."""
+        if BENCHMARKS_TABLE not in self.tables:
+            return []
+        return [name[:-len(" TWR")] for name in self.tables[BENCHMARKS_TABLE].columns
+                if name.endswith(" TWR") and name != "Portfolio TWR"]
+
+    def benchmarks_chart(self, names=None, start=None, end=None, points=None):
+        """
+        TWR of the portfolio and each benchmark over [start, end], downsampled as in
+        chart() at the dates picked from the portfolio TWR, with the portfolio's
+        cumulative return relative to each benchmark.
+        The summary (return, excess return, tracking error, information ratio) is
+        computed over the selected dates from the daily rows.
+        """
+        names = names or self.benchmark_names()
+        columns = self.tables[BENCHMARKS_TABLE].columns
+        series = {"portfolio_twr": "Portfolio TWR", **{name: f"{name} TWR" for name in names}}
+        payload = self._series(BENCHMARKS_TABLE, series, start, end, points)
+        portfolio_twr = np.asarray(payload["portfolio_twr"], dtype=np.float64)
+        benchmarks = {}
+        for name in names:
+            twr = np.asarray(payload.pop(name), dtype=np.float64)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                relative = portfolio_twr / twr - 1
+            benchmarks[name] = {"twr": _values(twr), "relative_return": _values(relative)}
+        payload["benchmarks"] = benchmarks
+
+        # Period returns start from the close before the first selected date
+        lo, hi = self.date_rows(BENCHMARKS_TABLE, start, end)
+        base = max(lo - 1, 0)
+        payload["summary"] = summarize_benchmarks(
+            columns["Portfolio TWR"][base:hi],
+            {name: columns[f"{name} TWR"][base:hi] for name in names},
+            {name: columns[f"{name} Excess Return"][base:hi] for name in names},
+        ) if hi > lo else {}
+        return payload
+
+    def risk_options(self):
+        """(method, horizon, confidence) combinations of the last run's VaR/CVaR, in run order."""
+        if RISK_TABLE not in self.tables:
+            return []
+        columns = self.tables[RISK_TABLE].columns
+        return list(zip(columns["Method"].tolist(), columns["Horizon"].tolist(), columns["Confidence"].tolist()))
+
+    def risk(self, method=None, horizon=None, confidence=None):
+        """
+        VaR and CVaR of the open positions for one simulation method and horizon
+        (by default the first computed), at every confidence level, with the
+        per-ticker CVaR contributions at `confidence` (by default the highest),
+        largest first.
+        """
+        options = self.risk_options()
+        method = method or options[0][0]
+        horizon = horizon or options[0][1]
+        levels = [option[2] for option in options if option[:2] == (method, horizon)]
+        confidence = confidence or max(levels)
+
+        columns = self.tables[RISK_TABLE].columns
+        rows = [row for row, option in enumerate(options) if option[:2] == (method, horizon)]
+        contributions = self.tables[RISK_CONTRIBUTIONS_TABLE].columns
+        selected = np.flatnonzero((contributions["Method"] == method) & (contributions["Horizon"] == horizon)
+                                  & (contributions["Confidence"] == confidence))
+        cvar = float(columns["CVaR"][rows[levels.index(confidence)]])
+        order = selected[np.argsort(-contributions["Contribution"][selected], kind="stable")]
+        return {
+            "method": method,
+            "horizon": horizon,
+            "confidence": confidence,
+            "paths": int(columns["Paths"][rows[0]]),
+            "levels": [{"confidence": float(columns["Confidence"][row]), "var": float(columns["VaR"][row]),
+                        "cvar": float(columns["CVaR"][row])} for row in rows],
+            "contributions": [{
+                "symbol": str(contributions["Symbol"][row]),
+                "value": float(contributions["Value"][row]),
+                "contribution": float(contributions["Contribution"][row]),
+                "share": float(contributions["Contribution"][row] / cvar) if cvar else None,
+            } for row in order],
+        }
+
+    def top_movers(self, start=None, end=None, limit=10, by="contribution", detractors=False):
+        """
+        Tickers that contributed most (or, with detractors, least) over [start, end],
+        ranked by summed contribution to return or by P&L; see
+        position_attribution.rank_tickers.
+        """
+        lo, hi = self.date_rows(ATTRIBUTION_TABLE, start, end)
+        dates = self.tables[ATTRIBUTION_TABLE].columns["Date"]
+        return {
+            "start": str(dates[lo]) if hi > lo else None,
+            "end": str(dates[hi - 1]) if hi > lo else None,
+            "by": by,
+            "tickers": rank_tickers(self.tables[ATTRIBUTION_TABLE].columns,
+                                    self.tables[ATTRIBUTION_TICKERS_TABLE].columns["Ticker"], lo, hi, limit, by, detractors),
+        }
+
+    def holdings_index(self):
+        """The HoldingsIndex of the run, over the memory-mapped columns; built on first use."""
+        if self._holdings_index is None:
+            self._holdings_index = HoldingsIndex.from_columns(
+                self.tables[HOLDINGS_TICKERS_TABLE].columns["Ticker"].tolist(), self.tables[HOLDINGS_TABLE].columns)
+        return self._holdings_index
+
+    def _as_of_row(self, as_of=None):
+        # Last attribution row on or before as_of (default: the last day), or -1 before the first day
+        _, hi = self.date_rows(ATTRIBUTION_TABLE, None, as_of)
+        return hi - 1
+
+    def positions(self, as_of=None):
+        """
+        Open positions at the end of as_of ('YYYY-MM-DD', by default the last day):
+        quantity and cost basis from the holdings index, price and value from
+        the attribution's market values on the last trading day up to as_of.
+        """
+        row = self._as_of_row(as_of)
+        if row < 0:
+            return {"as_of": None, "positions": []}
+        date = str(self.tables[ATTRIBUTION_TABLE].columns["Date"][row])
+        held = self.holdings_index().as_of(date)
+        market_value = np.asarray(self.tables[ATTRIBUTION_TABLE].columns["Market Value"][row], dtype=np.float64)
+        positions = pd.Index(self.tables[ATTRIBUTION_TICKERS_TABLE].columns["Ticker"]).get_indexer(held["Symbol"])
+        values = np.where(positions >= 0, market_value[positions], np.nan)
+        return {
+            "as_of": date,
+            "positions": [{
+                "symbol": symbol,
+                "quantity": round(float(quantity), 6),
+                "cost_basis": round(float(cost), 2),
+                "price": round(float(value / quantity), 2) if np.isfinite(value) else None,
+                "value": round(float(value), 2) if np.isfinite(value) else None,
+                "pnl": round(float(value - cost), 2) if np.isfinite(value) else None,
+            } for symbol, quantity, cost, value in zip(held["Symbol"], held["Quantity"], held["Cost Basis"], values)],
+        }
+
+    def positions_diff(self, start, end):
+        """Changes in quantity and cost basis between the ends of start and end ('YYYY-MM-DD')."""
+        changes = self.holdings_index().diff(start, end)
+        return {
+            "start": start,
+            "end": end,
+            "changes": [{
+                "symbol": row["Symbol"],
+                "quantity_before": round(float(row["Quantity Before"]), 6),
+                "quantity_after": round(float(row["Quantity After"]), 6),
+                "quantity_change": round(float(row["Quantity Change"]), 6),
+                "cost_basis_before": round(float(row["Cost Basis Before"]), 2),
+                "cost_basis_after": round(float(row["Cost Basis After"]), 2),
+                "cost_basis_change": round(float(row["Cost Basis Change"]), 2),
+            } for row in changes.to_dict(orient="records")],
+        }
+
+    def stream_columns(self, table, chunk_rows=STREAM_CHUNK_ROWS):
+        """
+        Yields a table as column-oriented JSON, {"rows": n, "columns": {name: [...]}},
+        a chunk of one column at a time straight from the memory maps.
+        """
+        table = self.tables[table]
+        yield f'{{"rows":{table.rows},"columns":{{'.encode("utf-8")
+        for position, (name, values) in enumerate(table.columns.items()):
+            yield f'{"," if position else ""}{json.dumps(name, ensure_ascii=False)}:['.encode("utf-8")
+            for start in range(0, len(values), chunk_rows):
+                chunk = _json_values(values[start:start + chunk_rows])[1:-1]
+                yield f'{"," if start else ""}{chunk}'.encode("utf-8")
+            yield b"]"
+        yield b"}}"
+
+class SnapshotHolder:
+    """
+    Holds the current ResultSnapshot. A new snapshot is built completely before
+    it replaces the old one, so readers always see one consistent run.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = ResultSnapshot.from_output_dir(self.output_dir)
+                snapshot = self._snapshot
+        return snapshot
+
+    def reload(self, version=None):
+        """Loads the latest run; version is the ledger version it was computed from, if known."""
+        snapshot = ResultSnapshot.from_output_dir(self.output_dir)
+        snapshot.version = version
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
@@ -2,6 +2,8 @@ document.addEventListener('DOMContentLoaded', function() {
     console.log('DOM Content Loaded.');
     const transactionForm = document.getElementById('transaction_form');
     const messageParagraph = document.getElementById('message');
+    const importForm = document.getElementById('import_form');
+    const importMessageParagraph = document.getElementById('import_message');
 
     const navLinks = document.querySelectorAll('.sidebar ul li a');
     const contentSections = document.querySelectorAll('.content-section');
@@ -12,12 +14,20 @@ document.addEventListener('DOMContentLoaded', function() {
     let assetAllocationChartInstance = null;
     let twrChartInstance = null;
     let cumulativeReturnChartInstance = null;
+    let rollingRiskChartInstance = null;
+
+    // Server-Sent Events connection of the live section, open only while it is shown
+    let liveEventSource = null;
 
     // DataTable instances
     let portfolioValueTableInstance = null;
     let openPositionsTableInstance = null;
     let closedPositionsTableInstance = null;
 
+    // Samples per series requested for the time series charts; the server
+    // downsamples longer histories with LTTB
+    const CHART_POINTS = 1000;
+
     // Chart tab elements
     const chartTabs = document.querySelectorAll('.chart-tab-button');
     const chartContents = document.querySelectorAll('.chart-tab-content');
@@ -25,6 +35,7 @@ document.addEventListener('DOMContentLoaded', function() {
     console.log('chartContents (divs):', chartContents);
 
     function showSection(sectionId) {
+        if (sectionId !== 'live-section') closeLiveStream();
         contentSections.forEach(section => {
             section.classList.add('hidden');
         });
@@ -38,11 +49,22 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById(activeId).classList.add('active');
     }
 
+    // Query string for the time series chart endpoints: target point count and
+    // the optional date range
+    function chartQuery() {
+        const params = new URLSearchParams({ points: CHART_POINTS });
+        const start = document.getElementById('chart_start').value;
+        const end = document.getElementById('chart_end').value;
+        if (start) params.set('start', start);
+        if (end) params.set('end', end);
+        return params.toString();
+    }
+
     // --- Individual Chart Rendering Functions ---
     async function renderPortfolioValueChart() {
         console.log('Rendering Portfolio Value Chart...');
         if (portfolioValueChartInstance) portfolioValueChartInstance.destroy();
-        const portfolioValueData = await fetch('/data/chart/portfolio_value_over_time').then(res => res.json());
+        const portfolioValueData = await fetch(`/data/chart/portfolio_value_over_time?${chartQuery()}`).then(res => res.json());
         console.log('Portfolio Value Data:', portfolioValueData);
         const ctx = document.getElementById('portfolio_value_chart').getContext('2d');
         console.log('Portfolio Value Chart Context:', ctx);
@@ -107,7 +129,7 @@ document.addEventListener('DOMContentLoaded', function() {
     async function renderDailyPnlChart() {
         console.log('Rendering Daily P&L Chart...');
         if (dailyPnlChartInstance) dailyPnlChartInstance.destroy();
-        const dailyPnlData = await fetch('/data/chart/daily_pnl_change').then(res => res.json());
+        const dailyPnlData = await fetch(`/data/chart/daily_pnl_change?${chartQuery()}`).then(res => res.json());
         console.log('Daily P&L Data:', dailyPnlData);
         const ctx = document.getElementById('daily_pnl_chart').getContext('2d');
         console.log('Daily P&L Chart Context:', ctx);
@@ -215,13 +237,39 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    const BENCHMARK_COLORS = ['rgb(220, 53, 69)', 'rgb(40, 167, 69)', 'rgb(255, 193, 7)', 'rgb(111, 66, 193)', 'rgb(23, 162, 184)'];
+
+    function formatPercent(value) {
+        return value === null || value === undefined ? 'n/a' : `${(value * 100).toFixed(2)}%`;
+    }
+
     async function renderTwrChart() {
         console.log('Rendering TWR Chart...');
         if (twrChartInstance) twrChartInstance.destroy();
-        const twrData = await fetch('/data/chart/twr_vs_spy').then(res => res.json());
+        const response = await fetch(`/data/chart/twr_vs_benchmarks?${chartQuery()}`);
+        let twrData;
+        if (response.ok) {
+            twrData = await response.json();
+        } else {
+            // Reports written without a benchmark comparison only have SPY
+            const spyData = await fetch(`/data/chart/twr_vs_spy?${chartQuery()}`).then(res => res.json());
+            twrData = { dates: spyData.dates, portfolio_twr: spyData.portfolio_twr, benchmarks: { SPY: { twr: spyData.spy_twr } }, summary: {} };
+        }
         console.log('TWR Data:', twrData);
         const ctx = document.getElementById('twr_chart').getContext('2d');
         console.log('TWR Chart Context:', ctx);
+        const benchmarkDatasets = Object.entries(twrData.benchmarks).map(([name, series], i) => {
+            const summary = twrData.summary[name];
+            return {
+                label: summary
+                    ? `${name} TWR (excess ${formatPercent(summary.excess_return)}, tracking error ${formatPercent(summary.tracking_error)})`
+                    : `${name} TWR`,
+                data: series.twr,
+                borderColor: BENCHMARK_COLORS[i % BENCHMARK_COLORS.length],
+                tension: 0.1,
+                fill: false
+            };
+        });
         twrChartInstance = new Chart(ctx, {
             type: 'line',
             data: {
@@ -234,13 +282,7 @@ document.addEventListener('DOMContentLoaded', function() {
                         tension: 0.1,
                         fill: false
                     },
-                    {
-                        label: 'SPY TWR',
-                        data: twrData.spy_twr,
-                        borderColor: 'rgb(220, 53, 69)',
-                        tension: 0.1,
-                        fill: false
-                    }
+                    ...benchmarkDatasets
                 ]
             },
             options: {
@@ -249,7 +291,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 plugins: {
                     title: {
                         display: true,
-                        text: 'Time-Weighted Return (TWR) vs. SPY',
+                        text: 'Time-Weighted Return (TWR) vs. Benchmarks',
                         color: '#ffffff'
                     },
                     legend: {
@@ -283,7 +325,7 @@ document.addEventListener('DOMContentLoaded', function() {
     async function renderCumulativeReturnChart() {
         console.log('Rendering Cumulative Return Chart...');
         if (cumulativeReturnChartInstance) cumulativeReturnChartInstance.destroy();
-        const cumulativeReturnData = await fetch('/data/chart/cumulative_cash_flow_adjusted_return').then(res => res.json());
+        const cumulativeReturnData = await fetch(`/data/chart/cumulative_cash_flow_adjusted_return?${chartQuery()}`).then(res => res.json());
         console.log('Cumulative Return Data:', cumulativeReturnData);
         const ctx = document.getElementById('cumulative_return_chart').getContext('2d');
         console.log('Cumulative Return Chart Context:', ctx);
@@ -338,6 +380,70 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    async function renderRollingRiskChart() {
+        console.log('Rendering Rolling Risk Chart...');
+        if (rollingRiskChartInstance) rollingRiskChartInstance.destroy();
+        const windowSelect = document.getElementById('rolling_window');
+        const metricSelect = document.getElementById('rolling_metric');
+        const metric = metricSelect.value;
+        const params = new URLSearchParams(chartQuery());
+        params.set('window', windowSelect.value);
+        params.set('metrics', metric);
+        const rollingData = await fetch(`/data/metrics/rolling?${params}`).then(res => res.json());
+        console.log('Rolling Risk Data:', rollingData);
+        const label = `${metricSelect.options[metricSelect.selectedIndex].text} (${rollingData.window} days)`;
+        const ctx = document.getElementById('rolling_risk_chart').getContext('2d');
+        rollingRiskChartInstance = new Chart(ctx, {
+            type: 'line',
+            data: {
+                labels: rollingData.dates,
+                datasets: [
+                    {
+                        label: label,
+                        data: rollingData[metric],
+                        borderColor: 'rgb(255, 193, 7)',
+                        tension: 0.1,
+                        fill: false
+                    }
+                ]
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: true,
+                plugins: {
+                    title: {
+                        display: true,
+                        text: `Rolling ${label}`,
+                        color: '#ffffff'
+                    },
+                    legend: {
+                        labels: {
+                            color: '#ffffff'
+                        }
+                    }
+                },
+                scales: {
+                    x: {
+                        ticks: {
+                            color: '#ffffff'
+                        },
+                        grid: {
+                            color: 'rgba(255, 255, 255, 0.1)'
+                        }
+                    },
+                    y: {
+                        ticks: {
+                            color: '#ffffff'
+                        },
+                        grid: {
+                            color: 'rgba(255, 255, 255, 0.1)'
+                        }
+                    }
+                }
+            }
+        });
+    }
+
     // Function to initialize DataTables
     function initializeDataTable(tableId, data, columns) {
         // Destroy existing DataTable instance if it exists
@@ -357,6 +463,38 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // DataTable that fetches each page, sorted and limited to the date range, from the server
+    function initializeServerSideDataTable(tableId, url, columns, startInputId, endInputId) {
+        if ($.fn.DataTable.isDataTable(`#${tableId}`)) {
+            $(`#${tableId}`).DataTable().destroy();
+            $(`#${tableId}`).empty();
+        }
+
+        $(`#${tableId}`).DataTable({
+            serverSide: true,
+            processing: true,
+            columns: columns,
+            responsive: true,
+            paging: true,
+            searching: false,
+            info: true,
+            ajax: function(request, callback) {
+                // DataTables' own start is a row offset; start/end on the server are dates
+                const params = new URLSearchParams({ draw: request.draw, offset: request.start });
+                if (request.length > 0) params.set('limit', request.length);
+                if (request.order.length > 0) {
+                    params.set('sort', columns[request.order[0].column].data);
+                    params.set('order', request.order[0].dir);
+                }
+                const start = document.getElementById(startInputId).value;
+                const end = document.getElementById(endInputId).value;
+                if (start) params.set('start', start);
+                if (end) params.set('end', end);
+                fetch(`${url}?${params}`).then(response => response.json()).then(callback);
+            }
+        });
+    }
+
     // Function to handle chart tab clicks
     function openChartTab(evt, tabId) {
         console.log(`openChartTab called for tabId: ${tabId}`);
@@ -398,6 +536,9 @@ document.addEventListener('DOMContentLoaded', function() {
             case 'cumulative-return-chart-tab':
                 renderCumulativeReturnChart();
                 break;
+            case 'rolling-risk-chart-tab':
+                renderRollingRiskChart();
+                break;
             default:
                 console.warn('Unknown tabId:', tabId);
         }
@@ -418,10 +559,11 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     async function loadPortfolioValuesSection() {
-        const portfolioValueData = await fetch('/data/portfolio_value').then(response => response.json());
-        if (portfolioValueData.length > 0) {
-            const columns = Object.keys(portfolioValueData[0]).map(key => ({ title: key, data: key }));
-            initializeDataTable('portfolio_value_table', portfolioValueData, columns);
+        // One row is enough to learn the columns; the table then pages through the server
+        const firstPage = await fetch('/data/portfolio_value?limit=1').then(response => response.json());
+        if (firstPage.recordsTotal > 0) {
+            const columns = Object.keys(firstPage.data[0]).map(key => ({ title: key, data: key }));
+            initializeServerSideDataTable('portfolio_value_table', '/data/portfolio_value', columns, 'pv_start', 'pv_end');
         } else {
             document.getElementById('portfolio_value_table').innerHTML = '<p>No data available.</p>';
         }
@@ -431,19 +573,60 @@ document.addEventListener('DOMContentLoaded', function() {
 
         const metricsDisplayDiv = document.getElementById('metrics-display');
         metricsDisplayDiv.innerHTML = `
-            <p><strong>Maximum Drawdown:</strong> ${mddData.maximum_drawdown}%</p>
+            <p><strong>Maximum Drawdown:</strong> ${mddData.maximum_drawdown === null ? "N/A" : `${mddData.maximum_drawdown}%`}</p>
             <p><strong>Sharpe Ratio:</strong> ${advancedMetricsData.sharpe_ratio}</p>
             <p><strong>Sortino Ratio:</strong> ${advancedMetricsData.sortino_ratio}</p>
             <p><strong>Beta:</strong> ${advancedMetricsData.beta}</p>
             <p><strong>Alpha (Annualized):</strong> ${advancedMetricsData.alpha}</p>
         `;
 
+        // Monte Carlo VaR/CVaR of the open positions, when the last run computed it
+        const riskResponse = await fetch('/data/metrics/risk');
+        if (riskResponse.ok) {
+            const riskData = await riskResponse.json();
+            const dollars = value => `$${value.toLocaleString(undefined, { maximumFractionDigits: 0 })}`;
+            riskData.levels.forEach(level => {
+                metricsDisplayDiv.innerHTML += `<p><strong>${riskData.horizon}-Day VaR / CVaR (${level.confidence * 100}%, ${riskData.method}):</strong> ${dollars(level.var)} / ${dollars(level.cvar)}</p>`;
+            });
+            const top = riskData.contributions[0];
+            if (top) {
+                metricsDisplayDiv.innerHTML += `<p><strong>Largest Risk Contributor:</strong> ${top.symbol} (${(top.share * 100).toFixed(1)}% of CVaR)</p>`;
+            }
+        }
+
+        // Tickers that drove the return over the whole history
+        const [contributorsResponse, detractorsResponse] = await Promise.all([
+            fetch('/data/attribution/top_contributors?limit=3'),
+            fetch('/data/attribution/top_detractors?limit=3')
+        ]);
+        if (contributorsResponse.ok && detractorsResponse.ok) {
+            const describe = movers => movers.tickers.map(t => `${t.symbol} (${(t.contribution * 100).toFixed(2)}%)`).join(', ') || 'None';
+            metricsDisplayDiv.innerHTML += `<p><strong>Top Contributors:</strong> ${describe(await contributorsResponse.json())}</p>`;
+            metricsDisplayDiv.innerHTML += `<p><strong>Top Detractors:</strong> ${describe(await detractorsResponse.json())}</p>`;
+        }
+
         showSection('portfolio-values-section');
         setActiveLink('nav-portfolio-values');
     }
 
+    async function fetchPositionsAsOf(asOf) {
+        // Positions on a past day from the holdings index; the report when no day is picked
+        if (!asOf) {
+            return fetch('/data/open_positions').then(response => response.json());
+        }
+        const response = await fetch(`/data/positions?as_of=${asOf}`);
+        if (!response.ok) {
+            return [];
+        }
+        const { positions } = await response.json();
+        return positions.map(p => ({
+            'Symbol': p.symbol, 'Quantity': p.quantity, 'Cost Basis': p.cost_basis,
+            'Price': p.price, 'Value': p.value, 'P&L': p.pnl
+        }));
+    }
+
     async function loadOpenPositionsSection() {
-        const openPositionsData = await fetch('/data/open_positions').then(response => response.json());
+        const openPositionsData = await fetchPositionsAsOf(document.getElementById('positions_as_of').value);
         if (openPositionsData.length > 0) {
             const columns = Object.keys(openPositionsData[0]).map(key => ({ title: key, data: key }));
             initializeDataTable('open_positions_table', openPositionsData, columns);
@@ -471,6 +654,66 @@ document.addEventListener('DOMContentLoaded', function() {
         setActiveLink('nav-add-transaction');
     }
 
+    function formatMoney(value) {
+        return value.toLocaleString(undefined, { minimumFractionDigits: 2, maximumFractionDigits: 2 });
+    }
+
+    function setLiveTotals(totals) {
+        ['value', 'cost', 'current_pnl', 'closed_pnl', 'overall_pnl', 'day_change'].forEach(key => {
+            document.getElementById(`live_${key}`).textContent = formatMoney(totals[key]);
+        });
+        const updated = totals.updated_at ? new Date(totals.updated_at * 1000).toLocaleTimeString() : 'no quotes yet';
+        document.getElementById('live_status').textContent = `Positions as of ${totals.as_of}; last quote: ${updated}`;
+    }
+
+    function setLivePosition(position) {
+        const tbody = document.querySelector('#live_positions_table tbody');
+        let row = document.getElementById(`live_row_${position.symbol}`);
+        if (!row) {
+            row = tbody.insertRow();
+            row.id = `live_row_${position.symbol}`;
+            for (let i = 0; i < 7; i++) row.insertCell();
+        }
+        const cells = [position.symbol, position.quantity, position.price.toFixed(2), formatMoney(position.value),
+                       formatMoney(position.cost), formatMoney(position.pnl), formatMoney(position.day_change)];
+        cells.forEach((text, i) => { row.cells[i].textContent = text; });
+        row.cells[6].className = position.day_change < 0 ? 'negative' : 'positive';
+    }
+
+    function closeLiveStream() {
+        if (liveEventSource) {
+            liveEventSource.close();
+            liveEventSource = null;
+        }
+    }
+
+    function loadLiveSection() {
+        showSection('live-section');
+        setActiveLink('nav-live');
+        if (liveEventSource) return;
+        // The server pushes a full snapshot on connect and after every recompute,
+        // then throttled updates with only the positions that moved
+        liveEventSource = new EventSource('/live/stream');
+        liveEventSource.addEventListener('snapshot', event => {
+            const snapshot = JSON.parse(event.data);
+            document.querySelector('#live_positions_table tbody').innerHTML = '';
+            if (!snapshot) {
+                document.getElementById('live_status').textContent = 'No completed run yet.';
+                return;
+            }
+            setLiveTotals(snapshot.totals);
+            snapshot.positions.forEach(setLivePosition);
+        });
+        liveEventSource.addEventListener('update', event => {
+            const update = JSON.parse(event.data);
+            setLiveTotals(update.totals);
+            update.positions.forEach(setLivePosition);
+        });
+        liveEventSource.onerror = () => {
+            document.getElementById('live_status').textContent = 'Connection lost, reconnecting...';
+        };
+    }
+
     function loadWelcomeSection() {
         showSection('welcome-section');
         setActiveLink('nav-welcome');
@@ -479,11 +722,31 @@ document.addEventListener('DOMContentLoaded', function() {
     // Event Listeners for Navigation
     document.getElementById('nav-welcome').addEventListener('click', loadWelcomeSection);
     document.getElementById('nav-charts').addEventListener('click', loadChartsSection);
+    document.getElementById('nav-live').addEventListener('click', loadLiveSection);
     document.getElementById('nav-portfolio-values').addEventListener('click', loadPortfolioValuesSection);
     document.getElementById('nav-open-positions').addEventListener('click', loadOpenPositionsSection);
+    document.getElementById('positions_as_of').addEventListener('change', loadOpenPositionsSection);
     document.getElementById('nav-closed-positions').addEventListener('click', loadClosedPositionsSection);
     document.getElementById('nav-add-transaction').addEventListener('click', loadAddTransactionSection);
 
+    // Date range inputs reload the table or the open chart
+    ['pv_start', 'pv_end'].forEach(id => {
+        document.getElementById(id).addEventListener('change', function() {
+            if ($.fn.DataTable.isDataTable('#portfolio_value_table')) {
+                $('#portfolio_value_table').DataTable().ajax.reload();
+            }
+        });
+    });
+    ['chart_start', 'chart_end'].forEach(id => {
+        document.getElementById(id).addEventListener('change', function() {
+            const activeTab = document.querySelector('.chart-tab-button.active');
+            if (activeTab) openChartTab({ currentTarget: activeTab }, activeTab.dataset.tabId);
+        });
+    });
+    ['rolling_window', 'rolling_metric'].forEach(id => {
+        document.getElementById(id).addEventListener('change', renderRollingRiskChart);
+    });
+
     // Attach event listeners to chart tab buttons
     chartTabs.forEach(button => {
         button.addEventListener('click', function(event) {
@@ -491,6 +754,16 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    async function waitForJob(statusUrl) {
+        while (true) {
+            const job = await fetch(statusUrl).then(response => response.json());
+            if (job.status === 'done' || job.status === 'failed') {
+                return job;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
     // Handle form submission
     transactionForm.addEventListener('submit', function(event) {
         event.preventDefault();
@@ -503,10 +776,17 @@ document.addEventListener('DOMContentLoaded', function() {
             body: formData
         })
         .then(response => response.json())
-        .then(data => {
+        .then(async data => {
             messageParagraph.textContent = data.message;
             if (data.message.includes('successfully')) {
                 transactionForm.reset();
+                // The portfolio is recomputed in the background; wait for the job before refreshing
+                const job = await waitForJob(data.status_url);
+                if (job.status !== 'done') {
+                    messageParagraph.textContent = `Transaction added, but the portfolio update failed: ${job.error}`;
+                    return;
+                }
+                messageParagraph.textContent = 'Transaction added and portfolio updated successfully!';
                 // After adding a transaction, refresh all data and go to charts section
                 // Note: Charts are now rendered individually on tab click
                 loadPortfolioValuesSection();
@@ -521,6 +801,36 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    importForm.addEventListener('submit', async function(event) {
+        event.preventDefault();
+        importMessageParagraph.textContent = 'Importing...';
+        try {
+            const response = await fetch('/transactions/import', { method: 'POST', body: new FormData(importForm) });
+            const data = await response.json();
+            if (!response.ok) {
+                // Validation failures list the offending rows; nothing was imported
+                const rows = data.detail.errors.map(error => error.row ? `row ${error.row}: ${error.error}` : error.error);
+                importMessageParagraph.textContent = [data.detail.message, ...rows.slice(0, 10)].join(' | ');
+                return;
+            }
+            importMessageParagraph.textContent = data.message;
+            importForm.reset();
+            const job = await waitForJob(data.status_url);
+            if (job.status !== 'done') {
+                importMessageParagraph.textContent = `Transactions imported, but the portfolio update failed: ${job.error}`;
+                return;
+            }
+            importMessageParagraph.textContent = `Imported ${data.rows} transactions and updated the portfolio.`;
+            loadPortfolioValuesSection();
+            loadOpenPositionsSection();
+            loadClosedPositionsSection();
+            loadChartsSection();
+        } catch (error) {
+            console.error('Error:', error);
+            importMessageParagraph.textContent = 'An error occurred while importing the transactions.';
+        }
+    });
+
     // Initial load: show welcome section
     loadWelcomeSection();
 });
\ No newline at end of file
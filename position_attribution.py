@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+# Measures top contributors and detractors can be ranked by
+ATTRIBUTION_MEASURES = ('contribution', 'pnl')
+
+class Attribution:
+    """
+    Per-ticker daily results of one evaluation, as dates x tickers matrices.
+
+    market_value and unrealised_pnl are end-of-day levels; realised_pnl and
+    contribution are the day's amounts. A ticker's contribution is its P&L for
+    the day over the start value the portfolio's daily return uses, so on days
+    without trades the contributions add up to 'Portfolio Daily Return'.
+    `holdings` is the holdings_index.HoldingsIndex of the same days.
+    """
+
+    def __init__(self, dates, tickers, market_value, unrealised_pnl, realised_pnl, contribution, holdings=None):
+        self.dates = dates
+        self.tickers = list(tickers)
+        self.market_value = market_value
+        self.unrealised_pnl = unrealised_pnl
+        self.realised_pnl = realised_pnl
+        self.contribution = contribution
+        self.holdings = holdings
+
+    def __len__(self):
+        return len(self.dates)
+
+    def unrealised_on(self, row):
+        """Ticker -> unrealized P&L at the end of the given day, for the tickers with any."""
+        values = self.unrealised_pnl[row]
+        return {self.tickers[t]: values[t] for t in np.flatnonzero(values)}
+
+    def _matrices(self, tickers):
+        # The four matrices with columns in the order of `tickers`, zero for tickers not in this one
+        positions = pd.Index(self.tickers).get_indexer(tickers)
+        known = positions >= 0
+        matrices = []
+        for matrix in (self.market_value, self.unrealised_pnl, self.realised_pnl, self.contribution):
+            reindexed = np.zeros((len(self), len(tickers)), dtype=matrix.dtype)
+            reindexed[:, known] = matrix[:, positions[known]]
+            matrices.append(reindexed)
+        return matrices
+
+    def extend(self, rows, suffix, resume_date):
+        """
+        The first `rows` days of this attribution followed by every day of
+        `suffix`, which was evaluated from resume_date.
+        """
+        tickers = self.tickers + [ticker for ticker in suffix.tickers if ticker not in set(self.tickers)]
+        head = self._matrices(tickers)
+        tail = suffix._matrices(tickers)
+        holdings = self.holdings.extend(suffix.holdings, resume_date) \
+            if self.holdings is not None and suffix.holdings is not None else None
+        return Attribution(self.dates[:rows].append(suffix.dates), tickers,
+                           *(np.concatenate([first[:rows], second]) for first, second in zip(head, tail)), holdings=holdings)
+
+    def astype(self, dtype):
+        """This attribution with the four matrices stored as dtype."""
+        return Attribution(self.dates, self.tickers, *(matrix.astype(dtype, copy=False) for matrix in
+                           (self.market_value, self.unrealised_pnl, self.realised_pnl, self.contribution)), self.holdings)
+
+    def columns(self):
+        """
+        Column store layout: the tickers ever held or traded, and for each measure
+        one dates x tickers array. Realized P&L and contribution are stored as
+        running totals, so any date range is the difference of two rows.
+
+        Returns:
+            tuple: (tickers, {'Date', 'Market Value', 'Unrealized P&L',
+                'Cumulative Realized P&L', 'Cumulative Contribution'})
+        """
+        held = np.flatnonzero((self.market_value != 0).any(axis=0) | (self.unrealised_pnl != 0).any(axis=0)
+                              | (self.realised_pnl != 0).any(axis=0))
+        tickers = np.array([self.tickers[t] for t in held], dtype=str)
+        return tickers, {
+            'Date': self.dates,
+            'Market Value': np.ascontiguousarray(self.market_value[:, held]),
+            'Unrealized P&L': np.ascontiguousarray(self.unrealised_pnl[:, held]),
+            # Running totals are summed in float64 even from float32 matrices
+            'Cumulative Realized P&L': np.cumsum(self.realised_pnl[:, held], axis=0, dtype=np.float64),
+            # Returns only need float32 precision; they are half the size
+            'Cumulative Contribution': np.cumsum(self.contribution[:, held], axis=0, dtype=np.float64).astype(np.float32),
+        }
+
+def _row(matrix, row):
+    return np.asarray(matrix[row], dtype=np.float64) if row >= 0 else np.zeros(matrix.shape[1])
+
+def rank_tickers(columns, tickers, lo, hi, limit=10, by='contribution', detractors=False):
+    """
+    Tickers that added most to (or, with detractors, took most from) the portfolio
+    over rows [lo, hi) of the stored attribution. Only rows hi - 1 and lo - 1 of
+    each running total are read, whatever the length of the range.
+
+    Args:
+        columns (dict): The arrays written from Attribution.columns.
+        tickers (np.ndarray): Their ticker for each column.
+        lo, hi (int): Row range, e.g. from ResultSnapshot.date_rows.
+        limit (int): Tickers returned.
+        by (str): 'contribution' (to the daily returns, summed) or 'pnl'.
+        detractors (bool): Rank from the most negative instead.
+
+    Returns:
+        list: Dicts with symbol, pnl, realized_pnl, contribution and the
+            market_value at the end of the range.
+    """
+    if by not in ATTRIBUTION_MEASURES:
+        raise ValueError(f"Unknown measure '{by}'; expected one of {', '.join(ATTRIBUTION_MEASURES)}")
+    if hi <= lo:
+        return []
+    end, base = hi - 1, lo - 1
+    unrealised = columns['Unrealized P&L']
+    realised = columns['Cumulative Realized P&L']
+    realised_pnl = _row(realised, end) - _row(realised, base)
+    pnl = _row(unrealised, end) - _row(unrealised, base) + realised_pnl
+    contribution = _row(columns['Cumulative Contribution'], end) - _row(columns['Cumulative Contribution'], base)
+    market_value = _row(columns['Market Value'], end)
+
+    measure = contribution if by == 'contribution' else pnl
+    order = np.argsort(measure if detractors else -measure, kind='stable')
+    order = order[(measure[order] < 0) if detractors else (measure[order] > 0)][:limit]
+    return [{
+        'symbol': str(tickers[t]),
+        'pnl': round(float(pnl[t]), 2),
+        'realized_pnl': round(float(realised_pnl[t]), 2),
+        'contribution': round(float(contribution[t]), 6),
+        'market_value': round(float(market_value[t]), 2),
+    } for t in order]
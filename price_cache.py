@@ -0,0 +1,259 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, GoodFriday, Holiday, USLaborDay, USMartinLutherKingJr,
+                                    USMemorialDay, USPresidentsDay, USThanksgivingDay, nearest_workday, sunday_to_monday)
+
+from metrics_registry import registry
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'prices.sqlite')
+
+# Closes older than this many days are treated as final; newer ones are refetched
+# once they are older than the cache's refresh_after, if a session ran since
+SETTLED_AFTER_DAYS = 4
+
+MARKET_TIMEZONE = ZoneInfo('America/New_York')
+# Regular session, (hour, minute) in MARKET_TIMEZONE; the end leaves the provider
+# half an hour after the 16:00 close to publish the final closes
+SESSION_START = (9, 30)
+SESSION_END = (16, 30)
+
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    """Full-day NYSE holidays of the regular schedule (not one-off closures)."""
+    rules = [
+        Holiday("New Year's Day", month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-01-01', observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas Day', month=12, day=25, observance=nearest_workday),
+    ]
+
+_holidays = NYSEHolidayCalendar()
+
+def _market_day(timestamp):
+    return pd.Timestamp(timestamp, unit='s', tz=MARKET_TIMEZONE).tz_localize(None).normalize()
+
+def _session_seconds(day, hour_minute):
+    hour, minute = hour_minute
+    return day.replace(hour=hour, minute=minute).tz_localize(MARKET_TIMEZONE).timestamp()
+
+def _session_since(fetched_at, now, start, end):
+    """
+    Whether a trading session on a day in [start, end) has started by now and
+    was still running after fetched_at, i.e. whether the provider may hold
+    closes the fetch at fetched_at could not see. Weekends, holidays and closes
+    already fetched after the session ended never qualify.
+    """
+    first = max(pd.Timestamp(start), _market_day(fetched_at))
+    last = min(pd.Timestamp(end), _market_day(now) + pd.Timedelta(days=1))
+    return any(_session_seconds(day, SESSION_START) <= now and _session_seconds(day, SESSION_END) > fetched_at
+               for day in _trading_days(first, last))
+
+def _trading_days(first, last):
+    if first >= last:
+        return pd.DatetimeIndex([])
+    days = pd.bdate_range(first, last, inclusive='left')
+    return days[~days.isin(_holidays.holidays(first, last))]
+
+def _session_started(start, end, now):
+    """Whether a trading session on a day in [start, end) has started by now."""
+    days = _trading_days(pd.Timestamp(start), min(pd.Timestamp(end), _market_day(now) + pd.Timedelta(days=1)))
+    return len(days) > 0 and _session_seconds(days[0], SESSION_START) <= now
+
+class PriceProvider:
+    """Source of daily close prices."""
+
+    def fetch(self, tickers, start_date, end_date):
+        """
+        Fetches closes for [start_date, end_date).
+
+        Returns:
+            pd.DataFrame: Indexed by date with one column per ticker that has data.
+        """
+        raise NotImplementedError
+
+class YFinanceProvider(PriceProvider):
+    def fetch(self, tickers, start_date, end_date):
+        # Imported on first fetch: yfinance is slow to import and most runs hit the cache
+        import yfinance as yf
+        closes = yf.download(tickers, start=start_date, end=end_date)['Close']
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(tickers[0])
+        return closes
+
+class CsvPriceProvider(PriceProvider):
+    """
+    File-backed stand-in for offline runs: a wide CSV with a Date column and one
+    column of closes per ticker. Every fetch is recorded in `requests`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.requests = []
+        self._closes = None
+
+    def fetch(self, tickers, start_date, end_date):
+        self.requests.append((tuple(tickers), start_date, end_date))
+        if self._closes is None:
+            self._closes = pd.read_csv(self.path, index_col='Date', parse_dates=['Date'])
+        rows = (self._closes.index >= start_date) & (self._closes.index < end_date)
+        columns = [ticker for ticker in tickers if ticker in self._closes.columns]
+        return self._closes.loc[rows, columns]
+
+def _day(value):
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+class PriceCache:
+    """
+    On-disk SQLite cache of daily closes keyed by (ticker, date).
+
+    Each ticker's fetched date range is recorded, so a request only goes to the
+    provider for dates before or after that range, or for recent closes that
+    may still change: those are refetched after refresh_after seconds, but only
+    while the market is open or once a session ended after the last fetch.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, provider=None, refresh_after=15 * 60):
+        self.path = path
+        self.provider = provider if provider is not None else YFinanceProvider()
+        self.refresh_after = refresh_after
+        self._version = None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS prices (
+                    ticker TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    close REAL,
+                    PRIMARY KEY (ticker, date)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS coverage (
+                    ticker TEXT PRIMARY KEY,
+                    start TEXT NOT NULL,
+                    end TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path)
+
+    def version(self):
+        """
+        Counter bumped every time new closes are written to the cache. The database
+        is only queried again when its file changed.
+        """
+        stat = os.stat(self.path)
+        file_state = (stat.st_size, stat.st_mtime_ns)
+        if self._version is not None and self._version[0] == file_state:
+            return self._version[1]
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        version = row[0] if row else 0
+        self._version = (file_state, version)
+        return version
+
+    def _missing_ranges(self, coverage, tickers, start, end, now):
+        settled = _day(datetime.fromtimestamp(now) - timedelta(days=SETTLED_AFTER_DAYS))
+        # Tickers fetched together share fetched_at, so each fetch time is checked once
+        session_since = {}
+        missing = {}
+        for ticker in tickers:
+            if ticker not in coverage:
+                missing.setdefault((start, end), []).append(ticker)
+                continue
+            covered_start, covered_end, fetched_at = coverage[ticker]
+            if now - fetched_at > self.refresh_after:
+                if fetched_at not in session_since:
+                    session_since[fetched_at] = _session_since(fetched_at, now, start, end)
+                if session_since[fetched_at]:
+                    covered_end = min(covered_end, max(settled, covered_start))
+            # Gaps always extend the covered range so it stays contiguous
+            if start < covered_start:
+                missing.setdefault((start, covered_start), []).append(ticker)
+            if end > covered_end:
+                missing.setdefault((covered_end, end), []).append(ticker)
+        return missing
+
+    def _store(self, conn, closes, tickers, gap_start, gap_end, coverage, now):
+        rows = []
+        returned = set()
+        for ticker in closes.columns:
+            series = closes[ticker].dropna()
+            if len(series):
+                returned.add(ticker)
+            rows.extend((ticker, _day(date), float(close)) for date, close in series.items())
+        conn.executemany("INSERT OR REPLACE INTO prices (ticker, date, close) VALUES (?, ?, ?)", rows)
+
+        # yfinance answers a failed download with an empty frame, so a ticker
+        # without closes keeps its coverage and the gap is asked for again; a gap
+        # without any session yet cannot hold closes and is covered all the same
+        if _session_started(gap_start, gap_end, now):
+            tickers = [ticker for ticker in tickers if ticker in returned]
+        for ticker in tickers:
+            covered_start, covered_end, fetched_at = coverage.get(ticker, (gap_start, gap_end, now))
+            covered_start, covered_end = min(covered_start, gap_start), max(covered_end, gap_end)
+            coverage[ticker] = (covered_start, covered_end, now)
+            conn.execute("INSERT OR REPLACE INTO coverage (ticker, start, end, fetched_at) VALUES (?, ?, ?, ?)",
+                         (ticker, covered_start, covered_end, now))
+        return len(rows)
+
+    def get_closes(self, tickers, start_date, end_date):
+        """
+        Returns closes for [start_date, end_date) in the same shape as
+        yf.download(...)['Close'], fetching only what the cache does not hold.
+        """
+        tickers = sorted(set(tickers))
+        start, end = _day(start_date), _day(end_date)
+        now = time.time()
+
+        with closing(self._connect()) as conn:
+            placeholders = ','.join('?' * len(tickers))
+            coverage = {
+                ticker: (covered_start, covered_end, fetched_at)
+                for ticker, covered_start, covered_end, fetched_at in conn.execute(
+                    f"SELECT ticker, start, end, fetched_at FROM coverage WHERE ticker IN ({placeholders})", tickers)
+            }
+
+            missing = self._missing_ranges(coverage, tickers, start, end, now)
+            fetched = {ticker for gap_tickers in missing.values() for ticker in gap_tickers}
+            registry.count_cache('price', hits=len(tickers) - len(fetched), misses=len(fetched))
+            for (gap_start, gap_end), gap_tickers in missing.items():
+                closes = self.provider.fetch(gap_tickers, gap_start, gap_end)
+                with conn:
+                    written = self._store(conn, closes, gap_tickers, gap_start, gap_end, coverage, now)
+                    if written:
+                        conn.execute("INSERT INTO meta (key, value) VALUES ('version', 1) "
+                                     "ON CONFLICT(key) DO UPDATE SET value = value + 1")
+
+            cached = pd.read_sql_query(
+                f"SELECT ticker, date, close FROM prices WHERE ticker IN ({placeholders}) AND date >= ? AND date < ?",
+                conn, params=tickers + [start, end])
+
+        price_data = cached.pivot(index='date', columns='ticker', values='close')
+        price_data = price_data.reindex(columns=tickers)
+        price_data.index = pd.DatetimeIndex(pd.to_datetime(price_data.index), name='Date')
+        price_data.columns.name = 'Ticker'
+        return price_data
+
+_default_cache = None
+
+def default_price_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PriceCache()
+    return _default_cache
@@ -1,16 +1,75 @@
+import os
+
 import pandas as pd
 
-def generate_csv_reports(portfolio_value, open_positions_data, closed_positions):
+from column_store import write_column_store
+
+# Select only the desired columns for the final portfolio value report
+PORTFOLIO_VALUE_REPORT_COLUMNS = [
+    'Current Value', 'Cost', 'Current P&L', 'Closed P&L', 'Overall P&L',
+    'P&L Positive', 'P&L Negative', 'Daily P&L Change', 'TWR', 'SPY_TWR',
+    'Net Invested Capital', 'Cumulative Cash Flow Adjusted Return', 'Drawdown',
+    'Portfolio Daily Return', 'SPY Daily Return'
+]
+OPEN_POSITIONS_COLUMNS = ['Symbol', 'Portfolio %', 'Quantity', 'Price', 'Cost', 'Value', 'P&L']
+CLOSED_POSITIONS_COLUMNS = ['Symbol', 'Quantity', 'Cost', 'Sell Price', 'Sell Date', 'P&L']
+
+def _to_csv(frame, path, **options):
+    # Written next to the report and renamed over it, so a reader never sees a partial file
+    tmp_path = f'{path}.tmp'
+    frame.to_csv(tmp_path, **options)
+    os.replace(tmp_path, path)
+
+def generate_csv_reports(portfolio_value, open_positions_data, closed_positions, output_dir='output'):
     portfolio_value = portfolio_value.round(2)
-    # Select only the desired columns for the final CSV report
-    columns_to_save = [
-        'Current Value', 'Cost', 'Current P&L', 'Closed P&L', 'Overall P&L',
-        'P&L Positive', 'P&L Negative', 'Daily P&L Change', 'TWR', 'SPY_TWR',
-        'Net Invested Capital', 'Cumulative Cash Flow Adjusted Return', 'Drawdown',
-        'Portfolio Daily Return', 'SPY Daily Return'
-    ]
-    portfolio_value[columns_to_save].to_csv('output/portfolio_value.csv', index=True, index_label='Date')
-
-    pd.DataFrame(open_positions_data).to_csv('output/open_positions.csv', index=False)
-
-    pd.DataFrame(closed_positions).to_csv('output/closed_positions.csv', index=False)
\ No newline at end of file
+    _to_csv(portfolio_value[PORTFOLIO_VALUE_REPORT_COLUMNS], os.path.join(output_dir, 'portfolio_value.csv'), index=True, index_label='Date')
+
+    _to_csv(pd.DataFrame(open_positions_data), os.path.join(output_dir, 'open_positions.csv'), index=False)
+
+    _to_csv(pd.DataFrame(closed_positions), os.path.join(output_dir, 'closed_positions.csv'), index=False)
+
+# Column store table of the rolling metrics over one window, e.g. 'rolling_63'
+ROLLING_TABLE_PREFIX = 'rolling_'
+BENCHMARKS_TABLE = 'benchmarks'
+RISK_TABLE = 'risk'
+RISK_CONTRIBUTIONS_TABLE = 'risk_contributions'
+# Dates x tickers matrices of the per-ticker attribution, and their tickers
+ATTRIBUTION_TABLE = 'attribution'
+ATTRIBUTION_TICKERS_TABLE = 'attribution_tickers'
+# Change points of the holdings index, and the tickers their codes refer to
+HOLDINGS_TABLE = 'holdings'
+HOLDINGS_TICKERS_TABLE = 'holdings_tickers'
+
+def generate_column_reports(portfolio_value, open_positions_data, closed_positions, output_dir='output', rolling_metrics=None, benchmark_comparison=None, risk=None, attribution=None):
+    """
+    Writes the same three reports as generate_csv_reports to the binary column
+    store (one .npy file per column), which the web app memory-maps.
+
+    The rolling metrics from metrics_calculator.calculate_rolling_metrics, if
+    given, are stored unrounded as one table per window ('rolling_<days>'), and
+    the benchmark_analytics.calculate_benchmark_comparison frame as 'benchmarks'.
+    The (levels, contributions) frames of risk_engine.calculate_risk go to
+    'risk' and 'risk_contributions'. A position_attribution.Attribution is
+    stored as 'attribution', whose columns past 'Date' are 2-D (dates x
+    tickers), and 'attribution_tickers'; its holdings index as 'holdings' and
+    'holdings_tickers'.
+    """
+    portfolio_value = portfolio_value.round(2)[PORTFOLIO_VALUE_REPORT_COLUMNS].rename_axis('Date').reset_index()
+    tables = {
+        'portfolio_value': portfolio_value,
+        'open_positions': pd.DataFrame(open_positions_data, columns=OPEN_POSITIONS_COLUMNS),
+        'closed_positions': pd.DataFrame(closed_positions, columns=CLOSED_POSITIONS_COLUMNS),
+    }
+    for window, metrics in (rolling_metrics or {}).items():
+        tables[f'{ROLLING_TABLE_PREFIX}{window}'] = metrics.rename_axis('Date').reset_index()
+    if benchmark_comparison is not None:
+        tables[BENCHMARKS_TABLE] = benchmark_comparison.rename_axis('Date').reset_index()
+    if risk is not None:
+        tables[RISK_TABLE], tables[RISK_CONTRIBUTIONS_TABLE] = risk
+    if attribution is not None:
+        tickers, tables[ATTRIBUTION_TABLE] = attribution.columns()
+        tables[ATTRIBUTION_TICKERS_TABLE] = pd.DataFrame({'Ticker': tickers})
+        if attribution.holdings is not None:
+            tickers, tables[HOLDINGS_TABLE] = attribution.holdings.columns()
+            tables[HOLDINGS_TICKERS_TABLE] = pd.DataFrame({'Ticker': tickers})
+    return write_column_store(tables, output_dir)
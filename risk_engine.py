@@ -0,0 +1,171 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Risk horizons in trading days and VaR/CVaR confidence levels
+RISK_HORIZONS = (1, 10)
+RISK_CONFIDENCE = (0.95, 0.99)
+RISK_METHODS = ('parametric', 'bootstrap')
+DEFAULT_PATHS = 100_000
+# Trading days of history the covariance and the bootstrap draw from
+RISK_LOOKBACK = 252
+# Upper bound on the memory of the simulated path chunks
+RISK_MEMORY_BUDGET = 64 * 2**20
+
+LEVEL_COLUMNS = ['Method', 'Horizon', 'Confidence', 'Paths', 'VaR', 'CVaR']
+CONTRIBUTION_COLUMNS = ['Method', 'Horizon', 'Confidence', 'Symbol', 'Value', 'Contribution']
+
+def _log_returns(values, price_data, lookback):
+    # Daily log returns of the held tickers over the lookback window; days
+    # before a ticker's first close count as no change
+    closes = price_data.reindex(columns=values.index).ffill().iloc[-(lookback + 1):].to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.log(closes[1:] / closes[:-1])
+    returns[~np.isfinite(returns)] = 0.0
+    return returns
+
+def _covariance_factor(returns):
+    """
+    B (tickers x k) with B @ B.T equal to the sample covariance of returns.
+
+    From the eigendecomposition, keeping only the positive eigenvalues, so it
+    also works when the covariance is singular (fewer days than tickers, or
+    tickers that move together); k is at most the number of days - 1.
+    """
+    covariance = np.atleast_2d(np.cov(returns, rowvar=False))
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    keep = eigenvalues > eigenvalues.max(initial=0.0) * 1e-12
+    return eigenvectors[:, keep] * np.sqrt(eigenvalues[keep])
+
+def _chunk_rows(tickers, horizons, memory_budget):
+    # Each path row holds a log return per ticker for every horizon, plus
+    # about as much again in temporaries
+    return max(1, memory_budget // (8 * max(tickers, 1) * (len(horizons) + 3)))
+
+def _path_chunks(method, returns, horizons, paths, chunk_rows, rng):
+    """
+    Yields {horizon: log returns (rows x tickers)} for `paths` paths, chunk by chunk.
+
+    parametric: multivariate normal with the sample mean and covariance; the sum
+        of h daily draws is normal with h times both, so each horizon is a
+        single draw.
+    bootstrap: whole historical days (all tickers together, which keeps their
+        correlation) drawn with replacement and summed over the horizon; the
+        shorter horizons are the first days of the longer paths.
+    """
+    mean = returns.mean(axis=0)
+    factor = _covariance_factor(returns) if method == 'parametric' else None
+    for start in range(0, paths, chunk_rows):
+        rows = min(chunk_rows, paths - start)
+        if method == 'parametric':
+            chunk = {}
+            for horizon in horizons:
+                shocks = rng.standard_normal((rows, factor.shape[1]))
+                chunk[horizon] = horizon * mean + math.sqrt(horizon) * (shocks @ factor.T)
+            yield chunk
+        else:
+            chunk = {}
+            total = np.zeros((rows, returns.shape[1]))
+            for day in range(1, max(horizons) + 1):
+                total += returns[rng.integers(0, len(returns), rows)]
+                if day in horizons:
+                    chunk[day] = total.copy()
+            yield chunk
+
+def _tail_size(paths, level):
+    # Paths in the worst (1 - level) share; rounded first so 0.99 of 100,000 is 1,000, not 1,001
+    return max(1, math.ceil(round(paths * (1 - level), 6)))
+
+def _keep_worst(tail, pnl, ticker_pnl, size):
+    # The `size` lowest-P&L paths seen so far, with their per-ticker P&L
+    if tail is not None:
+        pnl = np.concatenate([tail[0], pnl])
+        ticker_pnl = np.concatenate([tail[1], ticker_pnl])
+    if len(pnl) > size:
+        worst = np.argpartition(pnl, size - 1)[:size]
+        pnl, ticker_pnl = pnl[worst], ticker_pnl[worst]
+    return pnl, ticker_pnl
+
+def simulate_risk(open_positions_data, price_data, method='parametric', paths=DEFAULT_PATHS,
+                  horizons=RISK_HORIZONS, confidence=RISK_CONFIDENCE, lookback=RISK_LOOKBACK,
+                  memory_budget=RISK_MEMORY_BUDGET, seed=0):
+    """
+    Monte Carlo Value at Risk and Conditional VaR (expected shortfall) of the open
+    positions, holding the quantities fixed over each horizon.
+
+    Paths are generated in chunks sized to memory_budget; of each chunk only the
+    portfolio P&L and the per-ticker P&L of the worst paths so far are kept, so
+    memory does not grow with the number of paths. Per-ticker contributions split
+    CVaR by each position's average P&L over the tail paths, and add up to it.
+
+    Args:
+        open_positions_data (list): Rows of the open positions report ('Symbol', 'Value').
+        price_data (pd.DataFrame): Closes, one column per ticker.
+        method (str): 'parametric' (correlated normal) or 'bootstrap' (historical days).
+        paths (int): Simulated paths per horizon.
+        horizons (tuple): Horizons in trading days.
+        confidence (tuple): Confidence levels, e.g. 0.99.
+        lookback (int): Trading days of history used.
+        memory_budget (int): Approximate bytes of path data held at once.
+        seed (int): Random seed; the same inputs give the same results.
+
+    Returns:
+        tuple: (levels, contributions) DataFrames. levels has one row per horizon
+            and confidence: Method, Horizon, Confidence, Paths, VaR, CVaR (losses
+            as positive amounts). contributions has one row per horizon,
+            confidence and ticker: Method, Horizon, Confidence, Symbol, Value,
+            Contribution.
+    """
+    if method not in RISK_METHODS:
+        raise ValueError(f"Unknown risk method '{method}'; expected one of {', '.join(RISK_METHODS)}")
+    horizons = tuple(sorted(set(horizons)))
+    values = pd.Series({row['Symbol']: row['Value'] for row in open_positions_data}, dtype=np.float64)
+    values = values[values.index.isin(price_data.columns)]
+    returns = _log_returns(values, price_data, lookback)
+
+    levels = []
+    contributions = []
+    if values.empty or len(returns) < 2:
+        return pd.DataFrame(levels, columns=LEVEL_COLUMNS), pd.DataFrame(contributions, columns=CONTRIBUTION_COLUMNS)
+
+    weights = values.to_numpy()
+    tail_size = _tail_size(paths, min(confidence))
+    tails = dict.fromkeys(horizons)
+    rng = np.random.default_rng(seed)
+    chunk_rows = _chunk_rows(len(values), horizons, memory_budget)
+    for chunk in _path_chunks(method, returns, horizons, paths, chunk_rows, rng):
+        for horizon, log_returns in chunk.items():
+            ticker_pnl = np.expm1(log_returns, out=log_returns)
+            ticker_pnl *= weights
+            tails[horizon] = _keep_worst(tails[horizon], ticker_pnl.sum(axis=1), ticker_pnl, tail_size)
+
+    for horizon in horizons:
+        pnl, ticker_pnl = tails[horizon]
+        order = np.argsort(pnl)
+        for level in confidence:
+            worst = order[:_tail_size(paths, level)]
+            levels.append({
+                'Method': method,
+                'Horizon': horizon,
+                'Confidence': level,
+                'Paths': paths,
+                'VaR': float(-pnl[worst[-1]]),
+                'CVaR': float(-pnl[worst].mean()),
+            })
+            for symbol, value, contribution in zip(values.index, weights, -ticker_pnl[worst].mean(axis=0)):
+                contributions.append({
+                    'Method': method,
+                    'Horizon': horizon,
+                    'Confidence': level,
+                    'Symbol': symbol,
+                    'Value': value,
+                    'Contribution': float(contribution),
+                })
+    return pd.DataFrame(levels, columns=LEVEL_COLUMNS), pd.DataFrame(contributions, columns=CONTRIBUTION_COLUMNS)
+
+def calculate_risk(open_positions_data, price_data, methods=RISK_METHODS, **options):
+    """simulate_risk for each of methods, concatenated; options are passed through."""
+    results = [simulate_risk(open_positions_data, price_data, method, **options) for method in methods]
+    return (pd.concat([levels for levels, _ in results], ignore_index=True),
+            pd.concat([contributions for _, contributions in results], ignore_index=True))
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+from price_cache import PriceProvider
+
+BENCHMARK_TICKER = 'SPY'
+
+def synthetic_tickers(count):
+    """Distinct made-up ticker symbols: AAAA, AAAB, ..."""
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    codes = np.arange(count)
+    digits = [letters[(codes // 26 ** power) % 26] for power in range(3, -1, -1)]
+    return [''.join(chars) for chars in zip(*digits)]
+
+def generate_prices(tickers, years, end_date='2025-10-17', seed=0):
+    """
+    Daily closes as a geometric random walk for every ticker plus the benchmark,
+    over the business days of the last `years` years up to end_date.
+
+    Returns:
+        pd.DataFrame: Indexed by date ('Date'), one column per ticker ('Ticker').
+    """
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end_date)
+    dates = pd.bdate_range(end - pd.DateOffset(years=years) + pd.Timedelta(days=1), end, name='Date')
+    columns = sorted(set(tickers) | {BENCHMARK_TICKER})
+
+    start_prices = rng.uniform(5, 500, size=len(columns))
+    daily_returns = rng.normal(0.0003, 0.02, size=(len(dates), len(columns)))
+    daily_returns[0] = 0
+    closes = np.round(start_prices * np.exp(np.cumsum(daily_returns, axis=0)), 2)
+    return pd.DataFrame(closes, index=dates, columns=pd.Index(columns, name='Ticker'))
+
+def generate_ledger(prices, trades, tickers=None, seed=0):
+    """
+    Random buys and sells priced near the given closes, in the transactions.csv
+    format. Sells never exceed the shares held, so every row is applied.
+
+    Args:
+        prices (pd.DataFrame): Closes from generate_prices.
+        trades (int): Number of transactions.
+        tickers (list): Tickers to trade; defaults to every non-benchmark column.
+        seed (int): Random seed.
+
+    Returns:
+        pd.DataFrame: Columns Date ('%m/%d/%y'), Ticker, Type, Quantity, Price, Commission.
+    """
+    rng = np.random.default_rng(seed)
+    if tickers is None:
+        tickers = [ticker for ticker in prices.columns if ticker != BENCHMARK_TICKER]
+    ticker_columns = prices.columns.get_indexer(tickers)
+
+    day = np.sort(rng.integers(0, len(prices.index), size=trades))
+    which = rng.integers(0, len(tickers), size=trades)
+    wants_sell = rng.random(trades) < 0.4
+    quantity = rng.integers(1, 200, size=trades)
+
+    # Sells are capped at the running holdings; a sell with nothing to sell becomes a buy
+    # (plain lists: indexing numpy scalars one row at a time is several times slower)
+    held = [0] * len(tickers)
+    is_sell = [False] * trades
+    quantity = quantity.tolist()
+    for row, (ticker, sell) in enumerate(zip(which.tolist(), wants_sell.tolist())):
+        if sell and held[ticker] > 0:
+            quantity[row] = min(quantity[row], held[ticker])
+            held[ticker] -= quantity[row]
+            is_sell[row] = True
+        else:
+            held[ticker] += quantity[row]
+
+    closes = prices.to_numpy()[day, ticker_columns[which]]
+    price = np.round(closes * rng.uniform(0.99, 1.01, size=trades), 2)
+    return pd.DataFrame({
+        'Date': prices.index.strftime('%m/%d/%y').to_numpy()[day],
+        'Ticker': np.asarray(tickers, dtype=object)[which],
+        'Type': np.where(is_sell, 'Sell', 'Buy'),
+        'Quantity': quantity,
+        'Price': price,
+        'Commission': 2.05,
+    })
+
+class FramePriceProvider(PriceProvider):
+    """Serves closes from an in-memory frame, e.g. one from generate_prices."""
+
+    def __init__(self, closes):
+        self.closes = closes
+
+    def fetch(self, tickers, start_date, end_date):
+        rows = (self.closes.index >= start_date) & (self.closes.index < end_date)
+        columns = [ticker for ticker in tickers if ticker in self.closes.columns]
+        return self.closes.loc[rows, columns]
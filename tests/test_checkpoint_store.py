@@ -0,0 +1,42 @@
+import os
+import pickle
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import checkpoint_store
+from checkpoint_store import FORMAT_VERSION, CheckpointStore
+
+def _store():
+    store = CheckpointStore(interval=5)
+    store.checkpoints = [{'date': 'marker'}]
+    return store
+
+def test_saved_store_is_loaded_with_the_new_interval(tmp_path):
+    path = str(tmp_path / 'checkpoints.pkl')
+    _store().save(path)
+    loaded = CheckpointStore.load(path, interval=10)
+    assert loaded.checkpoints == [{'date': 'marker'}]
+    assert loaded.interval == 10
+
+def test_other_formats_load_as_an_empty_store(tmp_path, monkeypatch):
+    path = str(tmp_path / 'checkpoints.pkl')
+    # Pickled without a version, as before FORMAT_VERSION existed
+    with open(path, 'wb') as f:
+        pickle.dump(_store(), f)
+    assert CheckpointStore.load(path).checkpoints == []
+
+    monkeypatch.setattr(checkpoint_store, 'FORMAT_VERSION', FORMAT_VERSION + 1)
+    _store().save(path)
+    monkeypatch.setattr(checkpoint_store, 'FORMAT_VERSION', FORMAT_VERSION)
+    assert CheckpointStore.load(path).checkpoints == []
+
+def test_unreadable_file_loads_as_an_empty_store(tmp_path):
+    path = str(tmp_path / 'checkpoints.pkl')
+    _store().save(path)
+    with open(path, 'rb') as f:
+        head = f.read(20)
+    with open(path, 'wb') as f:
+        f.write(head)
+    assert CheckpointStore.load(path).checkpoints == []
+    assert CheckpointStore.load(str(tmp_path / 'missing.pkl')).checkpoints == []
@@ -0,0 +1,66 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from checkpoint_store import CheckpointStore
+from data_handler import compile_ledger
+from holdings_index import HoldingsIndex
+from valuation_engine import build_portfolio_value, evaluate_incremental
+
+def _prices(start='2024-01-02', days=60):
+    dates = pd.bdate_range(start, periods=days)
+    return pd.DataFrame({'AAAA': np.linspace(10, 20, days), 'BBBB': np.linspace(50, 40, days),
+                         'SPY': np.linspace(400, 420, days)}, index=dates)
+
+def _ledger(rows):
+    return compile_ledger(pd.DataFrame(rows, columns=['Date', 'Ticker', 'Type', 'Quantity', 'Price', 'Commission'])
+                          .assign(Date=lambda frame: pd.to_datetime(frame['Date']))
+                          .sort_values('Date', kind='stable'))
+
+def _quantity(index, date, ticker='AAAA'):
+    held = index.as_of(date).set_index('Symbol')['Quantity']
+    return held.get(ticker, 0.0)
+
+def test_incremental_run_drops_points_of_a_removed_trade():
+    prices = _prices()
+    base = [(prices.index[2], 'AAAA', 'Buy', 505, 10.0, 0.0)]
+    late_buy = (prices.index[50], 'AAAA', 'Buy', 1000, 18.0, 0.0)
+    store = CheckpointStore(interval=10)
+    evaluate_incremental(_ledger(base + [late_buy]), prices, 'SPY', store)
+
+    *_, attribution = evaluate_incremental(_ledger(base), prices, 'SPY', store, attribution=True)
+    *_, full = build_portfolio_value(_ledger(base), prices, 'SPY', attribution=True)
+
+    last_day = prices.index[-1]
+    assert _quantity(attribution.holdings, last_day) == 505
+    assert _quantity(attribution.holdings, last_day) == _quantity(full.holdings, last_day)
+
+def test_incremental_run_with_a_trade_after_the_last_close():
+    prices = _prices()
+    base = [(prices.index[2], 'AAAA', 'Buy', 505, 10.0, 0.0)]
+    store = CheckpointStore(interval=10)
+    evaluate_incremental(_ledger(base), prices.iloc[:-5], 'SPY', store)
+
+    # Nothing to replay: the new trade is dated after the last close evaluated
+    ledger = _ledger(base + [(prices.index[-3], 'AAAA', 'Buy', 7, 19.0, 0.0)])
+    *_, attribution = evaluate_incremental(ledger, prices.iloc[:-5], 'SPY', store, attribution=True)
+    assert _quantity(attribution.holdings, prices.index[-6]) == 505
+
+def test_dates_before_1970_are_indexed():
+    prices = _prices('1965-03-01')
+    ledger = _ledger([(prices.index[5], 'AAAA', 'Buy', 10, 10.0, 0.0), (prices.index[20], 'AAAA', 'Sell', 4, 12.0, 0.0),
+                      (prices.index[8], 'BBBB', 'Buy', 3, 48.0, 0.0)])
+    *_, attribution = build_portfolio_value(ledger, prices, 'SPY', attribution=True)
+    index = attribution.holdings
+    assert _quantity(index, prices.index[4]) == 0
+    assert _quantity(index, prices.index[10]) == 10
+    assert _quantity(index, prices.index[30]) == 6
+    assert _quantity(index, prices.index[7], 'BBBB') == 0
+    assert _quantity(index, prices.index[30], 'BBBB') == 3
+
+    tickers, columns = index.columns()
+    assert _quantity(HoldingsIndex.from_columns(tickers.tolist(), columns), prices.index[30]) == 6
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'portfolio_web_app'))
+
+from ingest_queue import IngestQueue
+from ledger_store import LedgerStore, LedgerValidationError
+
+def _rows(quantity, side='Buy'):
+    return pd.DataFrame([{'Date': '2025-06-02', 'Ticker': 'NVDA', 'Type': side, 'Quantity': str(quantity),
+                          'Price': '100', 'Commission': '0'}])
+
+def _queue(tmp_path, on_commit):
+    store = LedgerStore(str(tmp_path / 'ledger.sqlite'))
+    return store, IngestQueue(lambda: store, on_commit=on_commit)
+
+def test_concurrent_submits_share_group_commits(tmp_path):
+    groups = []
+    store, queue = _queue(tmp_path, lambda: groups.append(len(groups)) or {'job_id': str(len(groups))})
+
+    async def submit_all():
+        return await asyncio.gather(*[queue.submit(_rows(quantity)) for quantity in range(1, 21)])
+
+    batches = asyncio.run(submit_all())
+    assert len(store) == 20
+    assert sorted(batch['batch_id'] for batch in batches) == list(range(1, 21))
+    # Everything queued behind the first commit goes in the second one
+    assert len(groups) <= 2
+    assert all(batch['version'] <= store.version() for batch in batches)
+    assert batches[-1]['version'] == store.version()
+    assert {batch['job_id'] for batch in batches} == {str(group + 1) for group in groups}
+
+def test_invalid_rows_are_rejected_before_queueing(tmp_path):
+    store, queue = _queue(tmp_path, None)
+
+    async def submit():
+        with pytest.raises(LedgerValidationError):
+            await queue.submit(_rows(5, side='Hold'))
+        return await queue.submit(_rows(5))
+
+    assert asyncio.run(submit())['rows'] == 1
+    assert len(store) == 1
+
+def test_failing_on_commit_still_answers_every_request(tmp_path):
+    def on_commit():
+        raise RuntimeError('worker gone')
+    store, queue = _queue(tmp_path, on_commit)
+
+    async def submit_all():
+        return await asyncio.wait_for(asyncio.gather(*[queue.submit(_rows(quantity)) for quantity in range(1, 4)]), 10)
+
+    batches = asyncio.run(submit_all())
+    assert [batch['error'] for batch in batches] == ['worker gone'] * 3
+    assert len(store) == 3
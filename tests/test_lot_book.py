@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lot_book import FIFO, HIFO, LIFO, LotBook
+
+def _book(method, lots=((10, 5.0), (10, 9.0), (10, 7.0))):
+    book = LotBook(method)
+    for quantity, cost_per_share in lots:
+        book.add(quantity, cost_per_share)
+    return book
+
+def _open(book):
+    return [(lot['lot_id'], lot['quantity']) for lot in book]
+
+@pytest.mark.parametrize('method, cost, left', [
+    (FIFO, 10 * 5.0 + 5 * 9.0, [(1, 5), (2, 10)]),
+    (LIFO, 10 * 7.0 + 5 * 9.0, [(0, 10), (1, 5)]),
+    (HIFO, 10 * 9.0 + 5 * 7.0, [(0, 10), (2, 5)]),
+])
+def test_relief_order(method, cost, left):
+    book = _book(method)
+    assert book.relieve(15) == cost
+    assert _open(book) == left
+    assert len(book) == 2
+
+@pytest.mark.parametrize('method, first_cost, rest_cost', [
+    (FIFO, 10 * 9.0 + 2 * 5.0, 8 * 5.0 + 10 * 7.0),
+    (LIFO, 10 * 9.0 + 2 * 7.0, 8 * 7.0 + 10 * 5.0),
+    (HIFO, 10 * 9.0 + 2 * 7.0, 8 * 7.0 + 10 * 5.0),
+])
+def test_specific_lots_go_first_and_are_skipped_afterwards(method, first_cost, rest_cost):
+    book = _book(method)
+    assert book.relieve(12, lot_ids=[1]) == first_cost
+    # Lot 1 is drained; the method only picks from lots 0 and 2
+    assert book.relieve(18) == rest_cost
+    assert len(book) == 0
+    assert book.relieve(1) == 0
+
+def test_fifo_keeps_lot_ids_after_compaction():
+    book = LotBook(FIFO)
+    for day in range(200):
+        book.add(1, float(day))
+    for day in range(150):
+        assert book.relieve(1) == float(day)
+    assert _open(book)[0] == (150, 1)
+    assert book.relieve(1, lot_ids=[199]) == 199.0
+    assert len(book) == 49
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        LotBook('average')
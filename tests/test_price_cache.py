@@ -0,0 +1,63 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import price_cache
+from price_cache import MARKET_TIMEZONE, PriceCache, PriceProvider
+
+class _Provider(PriceProvider):
+    """Closes of AAAA and SPY; returns an empty frame while `failing` is set."""
+
+    def __init__(self):
+        dates = pd.bdate_range('2025-06-02', '2025-10-17', name='Date')
+        self.closes = pd.DataFrame({'AAAA': np.linspace(10, 20, len(dates)), 'SPY': np.linspace(500, 600, len(dates))},
+                                   index=dates)
+        self.failing = False
+        self.requests = []
+
+    def fetch(self, tickers, start_date, end_date):
+        self.requests.append((tuple(tickers), start_date, end_date))
+        if self.failing:
+            return pd.DataFrame()
+        rows = (self.closes.index >= start_date) & (self.closes.index < end_date)
+        return self.closes.loc[rows, [ticker for ticker in tickers if ticker in self.closes.columns]]
+
+def _at(monkeypatch, moment):
+    seconds = pd.Timestamp(moment, tz=MARKET_TIMEZONE).timestamp()
+    monkeypatch.setattr(price_cache.time, 'time', lambda: seconds)
+
+def test_failed_download_is_fetched_again(tmp_path, monkeypatch):
+    provider = _Provider()
+    cache = PriceCache(str(tmp_path / 'prices.sqlite'), provider)
+    _at(monkeypatch, '2025-10-18 12:00')
+
+    provider.failing = True
+    assert cache.get_closes(['AAAA', 'SPY'], '2025-06-02', '2025-10-18').empty
+
+    provider.failing = False
+    closes = cache.get_closes(['AAAA', 'SPY'], '2025-06-02', '2025-10-18')
+    assert len(provider.requests) == 2
+    assert len(closes) == len(provider.closes)
+
+    cache.get_closes(['AAAA', 'SPY'], '2025-06-02', '2025-10-18')
+    assert len(provider.requests) == 2
+
+def test_recent_closes_are_not_refetched_over_the_weekend(tmp_path, monkeypatch):
+    provider = _Provider()
+    cache = PriceCache(str(tmp_path / 'prices.sqlite'), provider)
+    _at(monkeypatch, '2025-10-17 17:00')
+    cache.get_closes(['AAAA', 'SPY'], '2025-06-02', '2025-10-21')
+
+    for moment in ('2025-10-18 12:00', '2025-10-19 12:00', '2025-10-20 09:00'):
+        _at(monkeypatch, moment)
+        cache.get_closes(['AAAA', 'SPY'], '2025-06-02', '2025-10-21')
+    assert len(provider.requests) == 1
+
+    # Open on Monday: the last few days are fetched again
+    _at(monkeypatch, '2025-10-20 10:00')
+    cache.get_closes(['AAAA', 'SPY'], '2025-06-02', '2025-10-21')
+    assert provider.requests[-1] == (('AAAA', 'SPY'), '2025-10-16', '2025-10-21')
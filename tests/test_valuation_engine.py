@@ -0,0 +1,64 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from checkpoint_store import CheckpointStore
+from data_handler import compile_ledger
+from lot_book import LOT_METHODS
+from portfolio_processor import run_daily_loop
+from synthetic_data import generate_ledger, generate_prices, synthetic_tickers
+from valuation_engine import build_portfolio_value, evaluate_incremental
+
+def _inputs(tickers=8, years=1, trades=300):
+    prices = generate_prices(synthetic_tickers(tickers), years)
+    transactions = generate_ledger(prices, trades).assign(Date=lambda frame: pd.to_datetime(frame['Date'], format='%m/%d/%y'))
+    return transactions, prices
+
+def _assert_same_results(expected, actual):
+    pd.testing.assert_frame_equal(expected[0], actual[0], check_dtype=False, rtol=1e-9)
+    assert expected[1] == actual[1]
+    assert expected[2] == actual[2]
+
+@pytest.mark.parametrize('lot_method', LOT_METHODS)
+def test_vectorized_engine_matches_the_daily_loop(lot_method):
+    transactions, prices = _inputs()
+    _assert_same_results(run_daily_loop(compile_ledger(transactions), prices, 'SPY', lot_method),
+                         build_portfolio_value(compile_ledger(transactions), prices, 'SPY', lot_method))
+
+def _with_row(transactions, date, ticker, side, quantity, price):
+    row = pd.DataFrame([{'Date': date, 'Ticker': ticker, 'Type': side, 'Quantity': quantity, 'Price': price, 'Commission': 2.05}])
+    return pd.concat([transactions, row]).sort_values('Date', kind='stable').reset_index(drop=True)
+
+def test_incremental_runs_match_full_runs():
+    transactions, prices = _inputs()
+    store = CheckpointStore(interval=10)
+    revised = prices.copy()
+    revised.iloc[-20, 0] *= 1.01
+    runs = [
+        ('first run', transactions, prices.iloc[:-10]),
+        ('unchanged', transactions, prices.iloc[:-10]),
+        ('new days', transactions, prices),
+        ('backdated buy', _with_row(transactions, prices.index[100], 'AAAB', 'Buy', 40, 100.0), prices),
+        ('price revision', _with_row(transactions, prices.index[100], 'AAAB', 'Buy', 40, 100.0), revised),
+        ('trade removed', transactions, revised),
+    ]
+    for label, rows, closes in runs:
+        full = build_portfolio_value(compile_ledger(rows), closes, 'SPY')
+        incremental = evaluate_incremental(compile_ledger(rows), closes, 'SPY', store)
+        try:
+            _assert_same_results(full, incremental)
+        except AssertionError as e:
+            raise AssertionError(f'{label}: {e}') from e
+    assert len(store.checkpoints) > 1
+
+@pytest.mark.parametrize('lot_method', LOT_METHODS)
+def test_incremental_run_follows_a_lot_method_change(lot_method):
+    transactions, prices = _inputs()
+    store = CheckpointStore(interval=10)
+    evaluate_incremental(compile_ledger(transactions), prices, 'SPY', store)
+    _assert_same_results(build_portfolio_value(compile_ledger(transactions), prices, 'SPY', lot_method),
+                         evaluate_incremental(compile_ledger(transactions), prices, 'SPY', store, lot_method))
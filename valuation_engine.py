@@ -0,0 +1,397 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from holdings_index import HoldingsIndex
+from lot_book import FIFO
+from metrics_registry import registry
+from portfolio_processor import apply_transaction
+from position_attribution import Attribution
+
+PORTFOLIO_VALUE_COLUMNS = [
+    'Current Value', 'Cost', 'Current P&L', 'Closed P&L', 'Overall P&L',
+    'P&L Positive', 'P&L Negative', 'Daily P&L Change', 'TWR', 'SPY_TWR',
+    'Net Invested Capital', 'Cumulative Cash Flow Adjusted Return', 'Drawdown',
+    'Portfolio Daily Return', 'SPY Daily Return',
+    'total_cash_in_cumulative', 'total_cash_out_cumulative', 'running_peak'
+]
+
+# Ratio and return columns; the low-memory mode can store them as float32
+DERIVED_COLUMNS = [
+    'TWR', 'SPY_TWR', 'Cumulative Cash Flow Adjusted Return', 'Drawdown',
+    'Portfolio Daily Return', 'SPY Daily Return'
+]
+# Trading days evaluated at once by the chunked (low-memory) evaluation
+CHUNK_DAYS = 252
+
+def _replay_ledger(ledger, dates, tickers, open_positions, closed_positions, snapshot_days=(), lot_method=FIFO):
+    """
+    Walks the ledger once, in order, and records what each transaction changed.
+
+    Only transactions dated on a trading day in `dates` are applied, matching the
+    day-by-day loop in portfolio_processor.run_daily_loop. The lots are copied at
+    the end of each day in `snapshot_days`.
+    """
+    ledger_day_idx = dates.get_indexer(pd.DatetimeIndex(ledger.dates))
+    day_idx = np.repeat(ledger_day_idx, ledger.counts)
+    rows = np.flatnonzero(day_idx >= 0)
+    day_idx = day_idx[rows]
+    ticker_idx = pd.Index(tickers).get_indexer(ledger.tickers)[ledger.ticker_codes[rows]]
+
+    count = len(rows)
+    quantity_change = np.zeros(count)
+    cost_change = np.zeros(count)
+    realised_pnl = np.zeros(count)
+    cash_in = np.zeros(count)
+    cash_out = np.zeros(count)
+
+    snapshot_days = list(snapshot_days)
+    snapshot_rows = np.searchsorted(day_idx, snapshot_days, side='right')
+    snapshots = []
+    for k, row in enumerate(rows):
+        while len(snapshots) < len(snapshot_days) and snapshot_rows[len(snapshots)] == k:
+            snapshots.append((copy.deepcopy(open_positions), len(closed_positions)))
+        ticker = ledger.tickers[ledger.ticker_codes[row]]
+        held_before = open_positions[ticker]['quantity'] if ticker in open_positions else 0
+        cost_change[k], realised_pnl[k], cash_in[k], cash_out[k] = apply_transaction(
+            dates[day_idx[k]], ticker, ledger.side[row], ledger.quantity[row], ledger.price[row],
+            ledger.commission[row], open_positions, closed_positions, lot_method, ledger.lot_ids(row))
+        quantity_change[k] = open_positions[ticker]['quantity'] - held_before if ticker in open_positions else 0
+
+    while len(snapshots) < len(snapshot_days):
+        snapshots.append((copy.deepcopy(open_positions), len(closed_positions)))
+
+    # calculate_twr counts every traded day's cash flow, even a rejected sell
+    traded = ledger_day_idx >= 0
+    changes = {
+        'day_idx': day_idx,
+        'ticker_idx': ticker_idx,
+        'quantity': quantity_change,
+        'cost': cost_change,
+        'realised_pnl': realised_pnl,
+        'cash_in': cash_in,
+        'cash_out': cash_out,
+        'traded_day_idx': ledger_day_idx[traded],
+        'traded_day_cash_flow': ledger.day_cash_flow[traded],
+    }
+    return changes, snapshots
+
+def _per_day(day_idx, values, n_days):
+    return np.bincount(day_idx, weights=values, minlength=n_days)
+
+def _holdings_matrix(day_idx, ticker_idx, values, n_days, n_tickers, opening=None):
+    # Scatter per-transaction changes into a dates x tickers grid, then carry them forward
+    # Row 0 holds the opening position so a resumed run adds up exactly like a full one
+    matrix = np.zeros((n_days + 1, n_tickers))
+    if opening is not None:
+        matrix[0] = opening
+    known = ticker_idx >= 0
+    np.add.at(matrix, (day_idx[known] + 1, ticker_idx[known]), values[known])
+    return np.cumsum(matrix, axis=0)[1:]
+
+def _per_day_ticker(day_idx, ticker_idx, values, n_days, n_tickers):
+    matrix = np.zeros((n_days, n_tickers))
+    known = ticker_idx >= 0
+    np.add.at(matrix, (day_idx[known], ticker_idx[known]), values[known])
+    return matrix
+
+def _carried_sum(opening, per_day):
+    return np.cumsum(np.concatenate(([opening], per_day)))[1:]
+
+# TWR is chained and rounded to 4 places one day at a time; a plain cumprod drifts
+# from the published series by a few basis points over a year
+_chain_rounded = np.frompyfunc(lambda previous, growth: round(previous * growth, 4), 2, 1)
+
+def _chained_returns(returns, opening=1.0):
+    growth = np.concatenate(([opening], 1 + returns))
+    return _chain_rounded.accumulate(growth, dtype=object)[1:].astype(float)
+
+def _opening_state():
+    """State before the first trading day; resume states carry the previous day's values."""
+    return {
+        'open_positions': {},
+        'closed_positions': [],
+        'holdings': {},
+        'closed_pnl': 0.0,
+        'unrealised': {},
+        'cash_in': 0.0,
+        'cash_out': 0.0,
+        'running_peak': 0.0,
+        'twr': 1.0,
+        'spy_twr': 1.0,
+        'current_value': None,
+        'overall_pnl': None,
+        'spy_close': None,
+    }
+
+def build_portfolio_value(ledger, price_data, spy_ticker, lot_method=FIFO, attribution=False, chunk_days=None,
+                          derived_dtype=np.float64):
+    """
+    Vectorized evaluation of the portfolio over every trading day in price_data.
+
+    Builds dates x tickers holdings and cost-basis matrices from the ledger once and
+    derives all daily columns with array operations. With chunk_days, the price
+    matrix is evaluated that many days at a time instead (see _evaluate_chunked),
+    so the working matrices stay the size of one chunk.
+
+    Args:
+        ledger (TransactionLedger): Compiled ledger from data_handler.load_transactions.
+        price_data (pd.DataFrame): Close prices, one column per ticker.
+        spy_ticker (str): Benchmark column in price_data.
+        lot_method (str): Lot relief method for sells, see lot_book.LotBook.
+        attribution (bool): Also return the per-ticker position_attribution.Attribution.
+        chunk_days (int): Trading days per chunk, e.g. CHUNK_DAYS; None for one pass.
+        derived_dtype: Storage type of the DERIVED_COLUMNS and the attribution
+            matrices; np.float32 halves them, at float32 precision.
+
+    Returns:
+        tuple: (portfolio_value, open_positions, closed_positions), plus the
+            attribution when asked for.
+    """
+    if chunk_days:
+        portfolio_value, open_positions, closed_positions, ticker_attribution = _evaluate_chunked(
+            ledger, price_data, spy_ticker, chunk_days, lot_method, attribution, derived_dtype)
+    else:
+        portfolio_value, open_positions, closed_positions, _, ticker_attribution = _evaluate(
+            ledger, price_data, spy_ticker, _opening_state(), lot_method=lot_method)
+        if np.dtype(derived_dtype) != np.float64:
+            portfolio_value[DERIVED_COLUMNS] = portfolio_value[DERIVED_COLUMNS].astype(derived_dtype)
+            ticker_attribution = ticker_attribution.astype(derived_dtype)
+    if attribution:
+        return portfolio_value, open_positions, closed_positions, ticker_attribution
+    return portfolio_value, open_positions, closed_positions
+
+def _evaluate(ledger, price_data, spy_ticker, state, checkpoint_days=(), lot_method=FIFO):
+    """
+    Evaluates the trading days in price_data starting from `state`.
+
+    Returns the portfolio_value rows for those days, the final lots, all closed
+    positions, a checkpoint for each day index in `checkpoint_days`, and the
+    per-ticker attribution of those days, which comes from the same matrices.
+    """
+    dates = price_data[spy_ticker].index
+    tickers = list(price_data.columns)
+    n_days = len(dates)
+
+    open_positions = copy.deepcopy(state['open_positions'])
+    closed_positions = list(state['closed_positions'])
+    changes, snapshots = _replay_ledger(ledger, dates, tickers, open_positions, closed_positions, checkpoint_days, lot_method)
+    day_idx = changes['day_idx']
+
+    opening = state['holdings']
+    opening_quantity = np.array([opening.get(ticker, (0.0, 0.0))[0] for ticker in tickers])
+    opening_cost = np.array([opening.get(ticker, (0.0, 0.0))[1] for ticker in tickers])
+    holdings = _holdings_matrix(day_idx, changes['ticker_idx'], changes['quantity'], n_days, len(tickers), opening_quantity)
+    cost_basis = _holdings_matrix(day_idx, changes['ticker_idx'], changes['cost'], n_days, len(tickers), opening_cost)
+    prices = price_data[tickers].to_numpy(dtype=float)
+
+    # A position only counts towards value and cost on days it has a close
+    priced = (holdings > 0) & ~np.isnan(prices)
+    market_value = np.where(priced, holdings * np.nan_to_num(prices), 0.0)
+    position_cost = np.where(priced, cost_basis, 0.0)
+    current_value_raw = market_value.sum(axis=1)
+    total_cost_raw = position_cost.sum(axis=1)
+
+    closed_pnl = _carried_sum(state['closed_pnl'], _per_day(day_idx, changes['realised_pnl'], n_days))
+    cash_in = _carried_sum(state['cash_in'], _per_day(day_idx, changes['cash_in'], n_days))
+    cash_out = _carried_sum(state['cash_out'], _per_day(day_idx, changes['cash_out'], n_days))
+
+    current_value = np.round(current_value_raw, 2)
+    current_pnl = np.round(current_value_raw - total_cost_raw, 2)
+    overall_pnl = np.round(current_pnl + closed_pnl, 2)
+    daily_pnl_change = np.zeros(n_days)
+    daily_pnl_change[1:] = np.round(np.diff(overall_pnl), 2)
+    if state['overall_pnl'] is not None and n_days:
+        daily_pnl_change[0] = round(overall_pnl[0] - state['overall_pnl'], 2)
+
+    net_invested = cash_in - cash_out
+    cash_flow_adjusted_return = np.zeros(n_days)
+    invested = net_invested != 0
+    cash_flow_adjusted_return[invested] = np.round(
+        (current_value[invested] + closed_pnl[invested] - net_invested[invested]) / net_invested[invested], 4)
+
+    running_peak = np.maximum.accumulate(np.maximum(current_value, state['running_peak']))
+    drawdown = np.zeros(n_days)
+    peaked = running_peak > 0
+    drawdown[peaked] = np.round((running_peak[peaked] - current_value[peaked]) / running_peak[peaked], 4)
+
+    # Daily return: on days with transactions the previous value is adjusted by the cash flow
+    has_transactions = np.zeros(n_days, dtype=bool)
+    has_transactions[changes['traded_day_idx']] = True
+    net_cash_flow = np.zeros(n_days)
+    net_cash_flow[changes['traded_day_idx']] = changes['traded_day_cash_flow']
+    start_value = np.zeros(n_days)
+    start_value[1:] = current_value[:-1]
+    if n_days:
+        start_value[0] = state['current_value'] if state['current_value'] is not None else np.nan
+    start_value = np.where(has_transactions, start_value + net_cash_flow, start_value)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        portfolio_return = np.where(start_value != 0, current_value / start_value - 1, 0.0)
+    if n_days and state['current_value'] is None:
+        portfolio_return[0] = 0.0
+
+    # Per ticker: the day's P&L is the change in unrealized P&L plus what was
+    # realized, and its contribution that P&L over the same start value as the
+    # portfolio's daily return
+    unrealised = market_value - position_cost
+    realised = _per_day_ticker(day_idx, changes['ticker_idx'], changes['realised_pnl'], n_days, len(tickers))
+    previous_unrealised = np.empty_like(unrealised)
+    previous_unrealised[1:] = unrealised[:-1]
+    if n_days:
+        previous_unrealised[0] = [state['unrealised'].get(ticker, 0.0) for ticker in tickers]
+    contribution = unrealised - previous_unrealised + realised
+    with np.errstate(divide='ignore', invalid='ignore'):
+        contribution /= start_value[:, None]
+    contribution[(start_value == 0) | np.isnan(start_value)] = 0.0
+    if n_days and state['current_value'] is None:
+        contribution[0] = 0.0
+    holdings_index = HoldingsIndex.from_changes(dates, tickers, day_idx, changes['ticker_idx'], changes['quantity'],
+                                                changes['cost'], opening)
+    attribution = Attribution(dates, tickers, market_value, unrealised, realised, contribution, holdings_index)
+
+    spy_prices = price_data[spy_ticker].to_numpy(dtype=float)
+    spy_return = np.zeros(n_days)
+    spy_return[1:] = spy_prices[1:] / spy_prices[:-1] - 1
+    if state['spy_close'] is not None and n_days:
+        spy_return[0] = spy_prices[0] / state['spy_close'] - 1
+
+    portfolio_value = pd.DataFrame({
+        'Current Value': current_value,
+        'Cost': np.round(total_cost_raw, 2),
+        'Current P&L': current_pnl,
+        'Closed P&L': closed_pnl,
+        'Overall P&L': overall_pnl,
+        'P&L Positive': np.where(overall_pnl > 0, overall_pnl, 0.0),
+        'P&L Negative': np.where(overall_pnl > 0, 0.0, overall_pnl),
+        'Daily P&L Change': daily_pnl_change,
+        'TWR': _chained_returns(portfolio_return, state['twr']),
+        'SPY_TWR': _chained_returns(spy_return, state['spy_twr']),
+        'Net Invested Capital': np.round(net_invested, 2),
+        'Cumulative Cash Flow Adjusted Return': cash_flow_adjusted_return,
+        'Drawdown': drawdown,
+        'Portfolio Daily Return': np.round(portfolio_return, 4),
+        'SPY Daily Return': np.round(spy_return, 4),
+        'total_cash_in_cumulative': cash_in,
+        'total_cash_out_cumulative': cash_out,
+        'running_peak': running_peak,
+    }, index=dates, columns=PORTFOLIO_VALUE_COLUMNS)
+
+    checkpoints = []
+    for day, (lots, closed_count) in zip(checkpoint_days, snapshots):
+        held = np.flatnonzero((holdings[day] != 0) | (cost_basis[day] != 0))
+        checkpoints.append({
+            'date': dates[day],
+            'open_positions': lots,
+            'closed_count': closed_count,
+            'holdings': {tickers[t]: (holdings[day, t], cost_basis[day, t]) for t in held},
+            'spy_close': spy_prices[day],
+        })
+
+    return portfolio_value, open_positions, closed_positions, checkpoints, attribution
+
+def _resume_state(checkpoint, portfolio_value, closed_positions, attribution):
+    row = portfolio_value.loc[checkpoint['date']]
+    return {
+        'open_positions': checkpoint['open_positions'],
+        'closed_positions': closed_positions[:checkpoint['closed_count']],
+        'holdings': checkpoint['holdings'],
+        'closed_pnl': row['Closed P&L'],
+        'unrealised': attribution.unrealised_on(portfolio_value.index.get_loc(checkpoint['date'])),
+        'cash_in': row['total_cash_in_cumulative'],
+        'cash_out': row['total_cash_out_cumulative'],
+        'running_peak': row['running_peak'],
+        'twr': row['TWR'],
+        'spy_twr': row['SPY_TWR'],
+        'current_value': row['Current Value'],
+        'overall_pnl': row['Overall P&L'],
+        'spy_close': checkpoint['spy_close'],
+    }
+
+def _evaluate_chunked(ledger, price_data, spy_ticker, chunk_days, lot_method, attribution, derived_dtype):
+    """
+    Evaluates price_data chunk_days trading days at a time, resuming each chunk
+    from the state at the end of the previous one, as an incremental run resumes
+    from a checkpoint; the results are the same as a single pass.
+
+    The daily columns and, when asked for, the attribution matrices are
+    preallocated for the whole history and filled chunk by chunk, so nothing the
+    size of the history is built twice by concatenation.
+    """
+    dates = price_data[spy_ticker].index
+    tickers = list(price_data.columns)
+    n_days = len(dates)
+    columns = {name: np.empty(n_days, dtype=derived_dtype if name in DERIVED_COLUMNS else np.float64)
+               for name in PORTFOLIO_VALUE_COLUMNS}
+    matrices = [np.empty((n_days, len(tickers)), dtype=derived_dtype) for _ in range(4)] if attribution else None
+    holdings_index = None
+
+    state = _opening_state()
+    open_positions, closed_positions = {}, []
+    for start in range(0, n_days, chunk_days):
+        stop = min(start + chunk_days, n_days)
+        chunk, open_positions, closed_positions, checkpoints, chunk_attribution = _evaluate(
+            ledger, price_data.iloc[start:stop], spy_ticker, state, [stop - start - 1], lot_method)
+        for name in PORTFOLIO_VALUE_COLUMNS:
+            columns[name][start:stop] = chunk[name].to_numpy()
+        if attribution:
+            for matrix, values in zip(matrices, (chunk_attribution.market_value, chunk_attribution.unrealised_pnl,
+                                                 chunk_attribution.realised_pnl, chunk_attribution.contribution)):
+                matrix[start:stop] = values
+            holdings_index = chunk_attribution.holdings if holdings_index is None else \
+                holdings_index.extend(chunk_attribution.holdings, dates[start])
+        # The state carried over comes from the float64 chunk, not the stored copy
+        state = _resume_state(checkpoints[0], chunk, closed_positions, chunk_attribution)
+
+    portfolio_value = pd.DataFrame(columns, index=dates, columns=PORTFOLIO_VALUE_COLUMNS, copy=False)
+    ticker_attribution = Attribution(dates, tickers, *matrices, holdings_index) if attribution else None
+    return portfolio_value, open_positions, closed_positions, ticker_attribution
+
+def evaluate_incremental(ledger, price_data, spy_ticker, store, lot_method=FIFO, attribution=False):
+    """
+    Evaluates the portfolio, replaying only from the last checkpoint in `store`
+    before the first date where the ledger or the prices changed.
+
+    Args:
+        store (CheckpointStore): Results and checkpoints of the previous run; updated in place.
+        attribution (bool): Also return the per-ticker attribution, see build_portfolio_value.
+
+    Returns:
+        tuple: (portfolio_value, open_positions, closed_positions), plus the
+            attribution when asked for.
+    """
+    dates = price_data[spy_ticker].index
+    changed_from = store.first_changed_date(ledger, price_data, lot_method)
+    if changed_from is None:
+        registry.count_cache('checkpoints', hits=1)
+        results = store.portfolio_value.copy(), copy.deepcopy(store.open_positions), list(store.closed_positions)
+        return results + (store.attribution,) if attribution else results
+
+    checkpoint = store.checkpoint_before(changed_from)
+    if checkpoint is None:
+        registry.count_cache('checkpoints', misses=1)
+        state, resume_at = _opening_state(), 0
+    else:
+        registry.count_cache('checkpoints', partial=1)
+        state = _resume_state(checkpoint, store.portfolio_value, store.closed_positions, store.attribution)
+        resume_at = dates.get_loc(checkpoint['date']) + 1
+
+    n_days = len(dates)
+    checkpoint_days = [day - resume_at for day in range(resume_at, n_days)
+                       if (day + 1) % store.interval == 0 or day == n_days - 1]
+    suffix, open_positions, closed_positions, checkpoints, suffix_attribution = _evaluate(
+        ledger, price_data.iloc[resume_at:], spy_ticker, state, checkpoint_days, lot_method)
+
+    if checkpoint is None:
+        portfolio_value = suffix
+        ticker_attribution = suffix_attribution
+    else:
+        portfolio_value = pd.concat([store.portfolio_value.iloc[:resume_at], suffix])
+        # Holdings points after the checkpoint day are replaced; the suffix may be
+        # empty when the only change is a trade after the last close
+        ticker_attribution = store.attribution.extend(resume_at, suffix_attribution,
+                                                      checkpoint['date'] + pd.Timedelta(days=1))
+    store.update(ledger, price_data, portfolio_value, open_positions, closed_positions, checkpoints, resume_at, lot_method,
+                 ticker_attribution)
+    results = portfolio_value, open_positions, closed_positions
+    return results + (ticker_attribution,) if attribution else results